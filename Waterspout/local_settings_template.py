@@ -72,9 +72,93 @@ EMAIL_HOST_PASSWORD = ''  # the password for the account to send email through
 EMAIL_USE_TLS = True  # specify whether to encrypt the traffic to the email server
 SERVER_EMAIL = ''  # the email address to send alerts as
 
+# Model runs reuse the data frames built from calibration and rainfall sets. How many should each process keep in
+# memory, and where should they be stored on disk (set to None to only cache in memory)?
+DATA_FRAME_CACHE_SIZE = 16
+DATA_FRAME_CACHE_FOLDER = os.path.join(BASE_DIR, "..", "cache", "data_frames")
+
+# Should model runs with exactly the same inputs as an already completed model run copy its results instead of
+# running the model again?
+MEMOIZE_MODEL_RUN_RESULTS = True
+
+# How should we store model run results? "columnar" stores each result set as a single compressed blob of columns,
+# which is much smaller and faster to read. "records" stores a Result row per region/crop/year, which is
+# handy for ad-hoc SQL on results. "both" does both. Result sets stored either way can always be read back.
+RESULT_STORAGE = "columnar"
+
+# How long, in seconds, should we keep the encoded JSON for completed model run results in Django's cache? Results
+# don't change, so this only limits memory use. Configure CACHES (for example, a file based cache) to share the
+# encoded results between web server processes.
+RESULTS_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# How long, in seconds, should we keep the encoded JSON for the large parts of model areas (calibration data, regions,
+# etc) in Django's cache? They're cached by version, so old copies are never used - this only limits memory use.
+MODEL_AREA_DATA_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Region and region group geometry is also stored simplified at several levels of detail, so maps can load less
+# geometry when zoomed out. Each level's simplification tolerance is in grid cells of a GEOMETRY_QUANTIZATION x
+# GEOMETRY_QUANTIZATION grid over the model area - level 0 is the first tolerance, level 1 the next, and so on. A
+# tolerance of 0 keeps every point that lands on its own grid cell. Changing these takes effect the next time the
+# geometry is rebuilt (the build_feature_collections management command rebuilds it right away).
+GEOMETRY_QUANTIZATION = 100000
+GEOMETRY_SIMPLIFICATION_TOLERANCES = [0, 4, 16, 64]
+
+# Maps can load regions and region groups as vector tiles (/api/model_areas/{id}/tiles/{z}/{x}/{y}.mvt). Where should
+# we store tiles once we've built them (set to None to build every tile on request)? Tiles are stored by model area
+# and version, and old versions are removed when regions or groups change.
+VECTOR_TILE_CACHE_FOLDER = os.path.join(BASE_DIR, "..", "cache", "vector_tiles")
+VECTOR_TILE_MAX_ZOOM = 16  # we don't build tiles past this zoom - maps can overzoom the last ones
+VECTOR_TILE_SIMPLIFICATION = 1  # how far points can move when we simplify tile geometry, out of 4096 across a tile
+
+# How long, in seconds, should we remember which user each API token belongs to, in each process's memory and in
+# Django's cache? Rotating a token (support.refresh_token_for_user) or saving a user clears both right away in the
+# process that does it - other processes notice within the memory timeout if CACHES is shared between them, or the
+# cache timeout if not.
+TOKEN_AUTHENTICATION_MEMORY_TIMEOUT = 10
+TOKEN_AUTHENTICATION_CACHE_TIMEOUT = 300
+
+# How long, in seconds, should we cache which organizations each user is in? Changes to users' groups clear it right
+# away in the process that makes them - other processes pick them up within this long unless CACHES is shared.
+ORGANIZATION_MEMBERSHIP_CACHE_TIMEOUT = 60
+
+# How many model runs should each page of model run listings have when clients use cursor pagination
+# (?pagination=cursor)? Clients can ask for up to 1000 with ?page_size=
+MODEL_RUN_PAGE_SIZE = 100
+
+# How many result rows should exports (CSV/Parquet downloads of model run results) read and write at a time?
+EXPORT_CHUNK_SIZE = 5000
+
+# How many result records should we insert per query when loading model run results?
+RESULT_LOAD_BATCH_SIZE = 1000
+
+# How many records should we insert per query when loading input, calibration, and rainfall data for a model area?
+INPUT_DATA_LOAD_BATCH_SIZE = 1000
+
 # How often should the run processor look for new model runs, in seconds?
-# Shorter means that the effective time to model results is shorter, but causes
-# more database and logging churn. Higher makes the time to model results a little
-# longer, but reduces the amount of churn.
+# The web application notifies the run processor when a model run is ready (Postgres
+# LISTEN/NOTIFY, or the wakeup file below on SQLite), so it starts runs right away either
+# way - this is only the fallback in case a notification gets missed (or can't be sent). Shorter
+# means missed runs get picked up sooner, but causes more database and logging churn.
 MODEL_RUN_CHECK_INTERVAL = 4
 
+# When the run processor runs with --workers, how often should it check that its worker processes are still
+# running, in seconds? Workers that exited get restarted, and their claimed runs go back in the queue
+MODEL_RUN_WORKER_CHECK_INTERVAL = 5
+# How long, in seconds, before the run processor assumes a claimed model run was abandoned by a worker that was killed
+# without releasing it, and puts it back in the queue? Make this longer than any model run takes to solve
+MODEL_RUN_CLAIM_TIMEOUT = 12 * 60 * 60
+
+# When using SQLite, the web application touches this file to wake up the run processor
+MODEL_RUN_WAKEUP_FILE = os.path.join(BASE_DIR, "model_run_wakeup")
+
+# How should the run processor pick which waiting model run to start next? FairShareScheduler shares runs between
+# users so one person's large batch of runs doesn't hold everyone else up. Use
+# "waterspout_api.scheduling.SubmissionOrderScheduler" for first come, first served.
+MODEL_RUN_SCHEDULER = "waterspout_api.scheduling.FairShareScheduler"
+MODEL_RUN_SCHEDULER_BATCH_SIZE = 8  # how many runs the scheduler lines up at a time
+# Organization IDs mapped to how many runs their users get from the fair share scheduler for each run that users of
+# an organization with weight 1 get - organizations that aren't listed get 1
+MODEL_RUN_SCHEDULER_ORGANIZATION_WEIGHTS = {}
+# How far back, in seconds, should the fair share scheduler count the runs each user has had claimed? Users who had
+# more runs claimed in this window (plus any still running) wait for users who had fewer
+MODEL_RUN_SCHEDULER_FAIRNESS_WINDOW = 60 * 60
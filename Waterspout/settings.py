@@ -18,6 +18,40 @@ from sentry_sdk.integrations.django import DjangoIntegration
 
 from Waterspout.local_settings import *
 
+# Settings added to local_settings_template.py after many deployments already had their local_settings.py. Any that
+# local_settings.py doesn't set get these defaults, so older deployments keep working - see the template for what
+# each one does
+LOCAL_SETTINGS_DEFAULTS = {
+    "DATA_FRAME_CACHE_SIZE": 16,
+    "DATA_FRAME_CACHE_FOLDER": os.path.join(BASE_DIR, "..", "cache", "data_frames"),
+    "MEMOIZE_MODEL_RUN_RESULTS": True,
+    "RESULT_STORAGE": "columnar",
+    "RESULTS_CACHE_TIMEOUT": 60 * 60 * 24 * 7,
+    "MODEL_AREA_DATA_CACHE_TIMEOUT": 60 * 60 * 24,
+    "GEOMETRY_QUANTIZATION": 100000,
+    "GEOMETRY_SIMPLIFICATION_TOLERANCES": [0, 4, 16, 64],
+    "VECTOR_TILE_CACHE_FOLDER": os.path.join(BASE_DIR, "..", "cache", "vector_tiles"),
+    "VECTOR_TILE_MAX_ZOOM": 16,
+    "VECTOR_TILE_SIMPLIFICATION": 1,
+    "TOKEN_AUTHENTICATION_MEMORY_TIMEOUT": 10,
+    "TOKEN_AUTHENTICATION_CACHE_TIMEOUT": 300,
+    "ORGANIZATION_MEMBERSHIP_CACHE_TIMEOUT": 60,
+    "MODEL_RUN_PAGE_SIZE": 100,
+    "EXPORT_CHUNK_SIZE": 5000,
+    "RESULT_LOAD_BATCH_SIZE": 1000,
+    "INPUT_DATA_LOAD_BATCH_SIZE": 1000,
+    "MODEL_RUN_CHECK_INTERVAL": 4,
+    "MODEL_RUN_WORKER_CHECK_INTERVAL": 5,
+    "MODEL_RUN_CLAIM_TIMEOUT": 12 * 60 * 60,
+    "MODEL_RUN_WAKEUP_FILE": os.path.join(BASE_DIR, "model_run_wakeup"),
+    "MODEL_RUN_SCHEDULER": "waterspout_api.scheduling.FairShareScheduler",
+    "MODEL_RUN_SCHEDULER_BATCH_SIZE": 8,
+    "MODEL_RUN_SCHEDULER_ORGANIZATION_WEIGHTS": {},
+    "MODEL_RUN_SCHEDULER_FAIRNESS_WINDOW": 60 * 60,
+}
+for _setting_name, _setting_default in LOCAL_SETTINGS_DEFAULTS.items():
+    globals().setdefault(_setting_name, _setting_default)
+
 # sentry config - only run if DEBUG is False (basically, in production)
 if not DEBUG and USE_SENTRY:
     sentry_sdk.init(
@@ -65,7 +99,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
 	'DEFAULT_AUTHENTICATION_CLASSES': (
-		'rest_framework.authentication.TokenAuthentication',
+		'waterspout_api.authentication.CachedTokenAuthentication',  # DRF's TokenAuthentication, but cached
 		'rest_framework.authentication.BasicAuthentication',
 		'rest_framework.authentication.SessionAuthentication',
 	),
@@ -86,6 +120,7 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework.authtoken',
     'guardian',  # gives us object-level permissions
+    'django_filters',
 ]
 
 MIDDLEWARE = [
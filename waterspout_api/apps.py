@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class WaterspoutApiConfig(AppConfig):
     name = 'waterspout_api'
+
+    def ready(self):
+        # connect the signal receivers that clear cached token users - they need to be connected even in processes
+        # (like management commands) that never authenticate a request
+        from waterspout_api import authentication
@@ -0,0 +1,114 @@
+"""
+	Token authentication that doesn't query the database on every request. DRF's TokenAuthentication looks up the
+	token and its user each time, which adds up quickly with clients polling for model run status.
+
+	CachedTokenAuthentication keeps the user for each token in process memory for
+	settings.TOKEN_AUTHENTICATION_MEMORY_TIMEOUT seconds and in Django's cache for
+	settings.TOKEN_AUTHENTICATION_CACHE_TIMEOUT seconds. Deleting a token (as support.refresh_token_for_user does) or
+	saving its user clears it from both right away in the process that makes the change - other processes keep
+	using their in-memory copy for at most the memory timeout, and their Django cache copy too unless CACHES is shared.
+"""
+
+import collections
+import hashlib
+import logging
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from Waterspout import settings
+
+log = logging.getLogger("waterspout.authentication")
+
+MEMORY_CACHE_SIZE = 1024  # how many tokens each process keeps in memory
+
+_users_by_token = collections.OrderedDict()  # cache key: (time it expires, user fields) - least recently used first
+_users_by_token_lock = threading.Lock()
+
+
+def _get_cache_key(token_key):
+	# hashed, so the tokens themselves don't end up in cache keys
+	return f"waterspout_token_user_{hashlib.sha256(token_key.encode('utf-8')).hexdigest()}"
+
+
+def _get_user_fields(user):
+	return {field.attname: getattr(user, field.attname) for field in user._meta.concrete_fields}
+
+
+def _make_user(user_fields):
+	# a new User each time, so nothing one request sets on its user (like cached memberships) leaks into another
+	user_model = get_user_model()
+	return user_model.from_db(None, list(user_fields.keys()), list(user_fields.values()))
+
+
+def forget_tokens(token_keys):
+	"""
+		Clears the cached users for the tokens, in this process and in Django's cache
+	"""
+	cache_keys = [_get_cache_key(token_key) for token_key in token_keys]
+	with _users_by_token_lock:
+		for cache_key in cache_keys:
+			_users_by_token.pop(cache_key, None)
+	cache.delete_many(cache_keys)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+	"""
+		Drop-in replacement for DRF's TokenAuthentication that caches the user for each token - see the module
+		docstring
+	"""
+
+	def authenticate_credentials(self, key):
+		cache_key = _get_cache_key(key)
+
+		with _users_by_token_lock:
+			cached = _users_by_token.get(cache_key)
+			if cached is not None:
+				if cached[0] > time.monotonic():
+					_users_by_token.move_to_end(cache_key)
+				else:
+					del _users_by_token[cache_key]
+					cached = None
+		user_fields = cached[1] if cached is not None else None
+
+		if user_fields is None:
+			user_fields = cache.get(cache_key)
+			if user_fields is None:
+				user, token = super().authenticate_credentials(key)  # raises AuthenticationFailed for bad tokens
+				user_fields = _get_user_fields(user)
+				cache.set(cache_key, user_fields, settings.TOKEN_AUTHENTICATION_CACHE_TIMEOUT)
+			self._remember(cache_key, user_fields)
+
+		user = _make_user(user_fields)
+		if not user.is_active:
+			raise exceptions.AuthenticationFailed("User inactive or deleted.")
+
+		# like TokenAuthentication, request.auth is the Token - built from what we know, without a query
+		token = Token.from_db(None, ["key", "user_id"], [key, user.pk])
+		token.user = user
+		return user, token
+
+	def _remember(self, cache_key, user_fields):
+		with _users_by_token_lock:
+			_users_by_token[cache_key] = (time.monotonic() + settings.TOKEN_AUTHENTICATION_MEMORY_TIMEOUT, user_fields)
+			_users_by_token.move_to_end(cache_key)
+			while len(_users_by_token) > MEMORY_CACHE_SIZE:
+				_users_by_token.popitem(last=False)
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+	forget_tokens([instance.key])
+
+
+@receiver(post_save, sender=get_user_model())
+def forget_user_tokens(sender, instance, **kwargs):
+	# the cached copies of the user are out of date (or the user was deactivated) - load them again next time
+	forget_tokens(Token.objects.filter(user=instance).values_list("key", flat=True))
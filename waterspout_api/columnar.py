@@ -0,0 +1,94 @@
+"""
+	Reads and writes data frames as sets of numpy columns in .npz format. We use it for the data frame cache and for
+	storing model results as a single blob on the ResultSet instead of thousands of Result rows. Everything is stored
+	without pickling, so text columns are stored as plain numpy strings - missing text values get stored as empty
+	strings plus a mask column (named with NULL_MASK_SUFFIX) so that we can restore them as None.
+"""
+
+import io
+
+import numpy
+import pandas
+
+NULL_MASK_SUFFIX = "__isnull"
+
+
+def frame_to_arrays(df):
+	"""
+		Splits a data frame into a dict of numpy arrays, one per column (plus null masks for text columns with
+		missing values)
+	:param df: pandas DataFrame with string column names
+	:return: dict of column name to numpy array
+	"""
+	arrays = {}
+	for column in df.columns:
+		values = df[column].to_numpy()
+		if values.dtype == object:
+			nulls = df[column].isna().to_numpy()
+			if not all(isinstance(value, str) for value in values[~nulls]):
+				raise TypeError(f"Column {column} has values that aren't text - can't store it without pickling")
+			if nulls.any():
+				arrays[f"{column}{NULL_MASK_SUFFIX}"] = nulls
+			values = numpy.where(nulls, "", values).astype(str)
+		arrays[column] = values
+
+	return arrays
+
+
+def arrays_to_frame(arrays, columns):
+	"""
+		The reverse of frame_to_arrays
+	:param arrays: a dict-like of column name to numpy array (such as what numpy.load returns for .npz files)
+	:param columns: the column names, in order, including any null mask columns
+	:return: pandas DataFrame
+	"""
+	data = {}
+	for column in columns:
+		if column.endswith(NULL_MASK_SUFFIX):
+			continue
+
+		values = arrays[column]
+		mask_column = f"{column}{NULL_MASK_SUFFIX}"
+		if mask_column in columns:
+			values = values.astype(object)
+			values[arrays[mask_column]] = None
+		data[column] = values
+
+	return pandas.DataFrame(data)
+
+
+def save(df, file, compress=False):
+	"""
+		Writes df to file (a path or a file-like object opened for binary writing)
+	:raises TypeError: if the data frame has columns we can't store without pickling
+	"""
+	arrays = frame_to_arrays(df)
+	if compress:
+		numpy.savez_compressed(file, **arrays)
+	else:
+		numpy.savez(file, **arrays)
+
+
+def load(file):
+	"""
+		Reads a data frame written by save from file (a path or a file-like object opened for binary reading)
+	"""
+	with numpy.load(file, allow_pickle=False) as stored:
+		return arrays_to_frame(stored, stored.files)
+
+
+def to_bytes(df, compress=True):
+	"""
+		Returns the data frame as compressed .npz bytes - what we store in the database
+	"""
+	buffer = io.BytesIO()
+	save(df, buffer, compress=compress)
+	return buffer.getvalue()
+
+
+def from_bytes(data):
+	"""
+		Reads a data frame from bytes written by to_bytes. Takes any bytes-like object, such as the memoryview some
+		database drivers return for binary fields
+	"""
+	return load(io.BytesIO(data))
@@ -0,0 +1,133 @@
+"""
+	Caches the base data frames we build from record sets (calibration sets, rainfall sets) so that every model run
+	doesn't rebuild the same data frame from the database. Entries are keyed by the record set's type, ID, and
+	data_version, so a cached frame can never be stale - when the records in a set change, its data_version goes up
+	(see the signal receivers in models.py) and we just never ask for the old key again.
+
+	Two tiers - an in-process LRU cache, and .npz files on disk (settings.DATA_FRAME_CACHE_FOLDER) that survive restarts
+	and are shared between run processor workers on the same machine.
+"""
+
+import collections
+import glob
+import logging
+import os
+import tempfile
+import threading
+
+from Waterspout import settings
+from waterspout_api import columnar
+
+log = logging.getLogger("waterspout.data_cache")
+
+
+class DataFrameCache(object):
+
+	def __init__(self, max_items, folder=None):
+		"""
+		:param max_items: how many data frames to keep in memory
+		:param folder: where to store data frames on disk. If None, we only cache in memory
+		"""
+		self.max_items = max_items
+		self.folder = folder
+		self._frames = collections.OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, key):
+		"""
+			Returns the data frame stored under key, or None if we don't have it. Callers get their own copy, so
+			they're free to modify it.
+		"""
+		with self._lock:
+			df = self._frames.get(key)
+			if df is not None:
+				self._frames.move_to_end(key)
+
+		if df is None:
+			df = self._read_file(key)
+			if df is None:
+				return None
+			self._remember(key, df)
+
+		return df.copy()
+
+	def set(self, key, df):
+		self._remember(key, df.copy())
+		self._write_file(key, df)
+
+	def clear(self):
+		with self._lock:
+			self._frames.clear()
+
+	def _remember(self, key, df):
+		with self._lock:
+			self._frames[key] = df
+			self._frames.move_to_end(key)
+			while len(self._frames) > self.max_items:
+				self._frames.popitem(last=False)
+
+	def _path(self, key):
+		return os.path.join(self.folder, f"{key}.npz")
+
+	def _read_file(self, key):
+		if self.folder is None or not os.path.exists(self._path(key)):
+			return None
+
+		try:
+			return columnar.load(self._path(key))
+		except:  # a damaged cache file just means we rebuild the data frame
+			log.warning(f"Couldn't read cached data frame {key}", exc_info=True)
+			return None
+
+	def _write_file(self, key, df):
+		if self.folder is None or len(df.columns) == 0:
+			return
+
+		try:
+			os.makedirs(self.folder, exist_ok=True)
+			# write to a temporary file and move it into place so other processes never read a partial file
+			handle, temp_path = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+			try:
+				with os.fdopen(handle, 'wb') as temp_file:
+					columnar.save(df, temp_file)
+			except TypeError:  # columns we can't store without pickling - we just keep this frame in memory
+				os.remove(temp_path)
+				return
+			os.replace(temp_path, self._path(key))
+		except OSError:
+			log.warning(f"Couldn't write cached data frame {key}", exc_info=True)
+
+	def discard_other_versions(self, key_prefix, keep_key):
+		"""
+			Removes files for older versions of a record set from disk so the cache folder doesn't grow forever
+		"""
+		if self.folder is None:
+			return
+
+		for path in glob.glob(os.path.join(self.folder, f"{key_prefix}-v*.npz")):
+			if os.path.basename(path) != f"{keep_key}.npz":
+				try:
+					os.remove(path)
+				except OSError:
+					pass
+
+
+record_set_frames = DataFrameCache(max_items=settings.DATA_FRAME_CACHE_SIZE, folder=settings.DATA_FRAME_CACHE_FOLDER)
+
+
+def get_record_set_data_frame(record_set):
+	"""
+		Returns the full data frame for a record set (as from record_set.build_data_frame()), from the cache if we can
+	:param record_set: a RecordSet instance, such as a CalibrationSet
+	:return: pandas DataFrame
+	"""
+	key_prefix = f"{record_set._meta.model_name}-{record_set.id}"
+	key = f"{key_prefix}-v{record_set.data_version}"
+
+	df = record_set_frames.get(key)
+	if df is None:
+		df = record_set.build_data_frame()
+		record_set_frames.set(key, df)
+		record_set_frames.discard_other_versions(key_prefix, keep_key=key)
+
+	return df
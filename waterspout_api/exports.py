@@ -0,0 +1,164 @@
+"""
+	Streams model run results out as CSV or Parquet files (or a zip of them for several model runs) a chunk at a
+	time, so that memory use stays flat no matter how many model runs or years someone exports. Results stored as
+	columns come from the stored blob, and results stored as records come from the database through a server-side
+	cursor (.iterator()).
+
+	Parquet needs pyarrow, which is optional - check parquet_available before offering it.
+"""
+
+import itertools
+import logging
+import zipfile
+
+import pandas
+
+from Waterspout import settings
+
+try:
+	import pyarrow
+	import pyarrow.parquet
+	parquet_available = True
+except ImportError:
+	parquet_available = False
+
+log = logging.getLogger("waterspout.exports")
+
+# the result fields hold IDs for these, but exports should have the codes people know them by
+CODE_LOOKUPS = {
+	"region": "region__internal_id",
+	"crop": "crop__crop_code",
+}
+TEXT_FIELDS = ("region", "crop")
+
+
+class _StreamSink(object):
+	"""
+		A write-only file-like object that holds whatever gets written to it until we drain it - lets zipfile and
+		pyarrow write into a streaming response
+	"""
+	closed = False
+
+	def __init__(self):
+		self._chunks = []
+		self._position = 0
+
+	def write(self, data):
+		self._chunks.append(bytes(data))
+		self._position += len(data)
+		return len(data)
+
+	def tell(self):
+		return self._position
+
+	def flush(self):
+		pass
+
+	def close(self):
+		self.closed = True
+
+	def drain(self):
+		data = b"".join(self._chunks)
+		self._chunks = []
+		return data
+
+
+def get_export_fields(model_run):
+	"""
+		The result fields to export - settings.LIMITED_RESULTS_FIELDS, without net revenues unless the model
+		area's preferences include them
+	"""
+	fields = list(settings.LIMITED_RESULTS_FIELDS)
+	if not model_run.calibration_set.model_area.preference_values["include_net_revenue"]:
+		fields = [field for field in fields if field not in ("net_revenue", "net_revenue_flag")]
+	return fields
+
+
+def iter_result_frames(result_set, fields, chunk_size=None):
+	"""
+		Yields the results in result_set as data frames of at most chunk_size rows, with columns fields. The region
+		and crop columns hold the region internal ID and crop code.
+	:param result_set: the ResultSet to export
+	:param fields: list of Result field names
+	:param chunk_size: rows per data frame. Defaults to settings.EXPORT_CHUNK_SIZE
+	:return: generator of pandas DataFrames
+	"""
+	if chunk_size is None:
+		chunk_size = settings.EXPORT_CHUNK_SIZE
+
+	df = result_set.get_columnar_frame("Result")
+	if df is not None:
+		df = df.assign(region=df["g"], crop=df["i"]).reindex(columns=fields)
+		for start in range(0, len(df), chunk_size):
+			yield df.iloc[start:start + chunk_size]
+		return
+
+	lookups = [CODE_LOOKUPS.get(field, field) for field in fields]
+	rows = result_set.result_set.order_by("id").values_list(*lookups).iterator(chunk_size=chunk_size)
+	while True:
+		chunk = list(itertools.islice(rows, chunk_size))
+		if len(chunk) == 0:
+			return
+		yield pandas.DataFrame.from_records(chunk, columns=fields)
+
+
+def encode_csv(frames):
+	"""
+		Yields the data frames as CSV bytes - the header comes from the first data frame
+	"""
+	header = True
+	for frame in frames:
+		yield frame.to_csv(index=False, header=header).encode("utf-8")
+		header = False
+
+
+def encode_parquet(frames, fields):
+	"""
+		Yields the data frames as a single Parquet file, one row group per data frame. Every column other than
+		region and crop is written as a float, including the year, so missing values stay missing.
+	"""
+	schema = pyarrow.schema([(field, pyarrow.string() if field in TEXT_FIELDS else pyarrow.float64()) for field in fields])
+
+	sink = _StreamSink()
+	with pyarrow.parquet.ParquetWriter(sink, schema) as writer:
+		for frame in frames:
+			columns = {}
+			for field in fields:
+				if field in TEXT_FIELDS:
+					columns[field] = frame[field].astype(str)
+				else:
+					columns[field] = pandas.to_numeric(frame[field], errors="coerce").astype("float64")
+			writer.write_table(pyarrow.Table.from_pandas(pandas.DataFrame(columns), schema=schema, preserve_index=False))
+			yield sink.drain()
+	yield sink.drain()
+
+
+def encode(result_set, fields, export_format):
+	"""
+		Yields the results in result_set as bytes in export_format ("csv" or "parquet")
+	"""
+	frames = iter_result_frames(result_set, fields)
+	if export_format == "parquet":
+		return encode_parquet(frames, fields)
+	return encode_csv(frames)
+
+
+def stream_zip(members):
+	"""
+		Yields a zip file, built as we go
+	:param members: iterable of (file name, iterable of bytes) pairs
+	:return: generator of bytes
+	"""
+	sink = _StreamSink()
+	with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+		for name, chunks in members:
+			with archive.open(name, mode="w", force_zip64=True) as member:
+				for chunk in chunks:
+					member.write(chunk)
+					yield sink.drain()
+			yield sink.drain()
+	yield sink.drain()
+
+
+def get_file_name(model_run, export_format):
+	return f"waterspout_model_run_{model_run.id}.{export_format}"
@@ -0,0 +1,173 @@
+"""
+	Builds and stores one GeoJSON FeatureCollection for the regions in each model area, and one for the groups in each
+	region group set, already encoded and gzip-compressed (see models.FeatureCollection). Maps can then load all the
+	geometry in a single request, and we send the stored bytes as they are.
+
+	Along with the full resolution GeoJSON, we store a simplified, quantized copy of each collection for every level of
+	detail in settings.GEOMETRY_SIMPLIFICATION_TOLERANCES (see geometry.py), so maps can load lighter geometry when
+	they're zoomed out.
+
+	Groups without their own geometry (like null groups, or groups loaded without a geometry file) get the outline of
+	their regions instead, dissolved from the regions' geometry and kept on the group until its regions change.
+
+	Stored collections remember the model area's region_version (or region_group_version) they were built from, so
+	get_feature_collection rebuilds them on its own after regions or groups change.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+
+from django.db import transaction
+from django.db.models import F, Q
+
+from Waterspout import settings
+from waterspout_api import geometry, models
+
+log = logging.getLogger("waterspout.feature_collections")
+
+
+def _parse_geometry(geometry):
+	# the loaders store each GeoJSON line as text in the JSON field, but geometry set any other way may already be parsed
+	if isinstance(geometry, str):
+		return json.loads(geometry)
+	return geometry
+
+
+def _as_feature(geometry, feature_id, properties):
+	"""
+		Returns the stored geometry as a GeoJSON Feature with feature_id as its ID and properties added to its own
+	"""
+	feature = _parse_geometry(geometry)
+	if feature.get("type") != "Feature":  # a bare geometry - wrap it in a feature
+		feature = {"type": "Feature", "geometry": feature, "properties": {}}
+	feature["id"] = feature_id
+	feature["properties"] = dict(feature.get("properties") or {}, **properties)
+	return feature
+
+
+def build_region_features(model_area):
+	regions = model_area.region_set.exclude(geometry__isnull=True).order_by("id")\
+		.values_list("id", "internal_id", "name", "geometry")
+	return [_as_feature(region_geometry, region_id, {"region_id": region_id, "internal_id": internal_id, "name": name})
+	        for region_id, internal_id, name, region_geometry in regions]
+
+
+def dissolve_region_groups(region_group_set):
+	"""
+		Builds the outlines of the groups in region_group_set that don't have their own geometry, for any whose
+		regions changed since we last built them
+	"""
+	groups = list(region_group_set.groups.filter(geometry__isnull=True)
+	              .filter(Q(dissolved_version__isnull=True) | ~Q(dissolved_version=F("version"))).values_list("id", "version"))
+	if len(groups) == 0:
+		return
+
+	# quantize to a grid over the whole model area so that neighboring groups' outlines still line up
+	region_features = build_region_features(region_group_set.model_area)
+	transform = geometry.get_transform(region_features, settings.GEOMETRY_QUANTIZATION)
+	region_polygons = {feature["id"]: geometry.get_polygons(feature["geometry"]) for feature in region_features}
+
+	memberships = models.RegionGroup.regions.through.objects.filter(regiongroup_id__in=[group_id for group_id, version in groups])\
+		.values_list("regiongroup_id", "region_id")
+	group_regions = {}
+	for group_id, region_id in memberships:
+		group_regions.setdefault(group_id, []).append(region_id)
+
+	for group_id, version in groups:
+		polygons = [polygon for region_id in group_regions.get(group_id, []) for polygon in region_polygons.get(region_id, [])]
+		outline = geometry.dissolve(polygons, transform)
+		# update (rather than save) so we don't change any versions - and only if the group didn't change while we worked
+		models.RegionGroup.objects.filter(pk=group_id, version=version).update(dissolved_geometry=outline, dissolved_version=version)
+
+	log.info(f"Dissolved {len(groups)} region group outlines for {region_group_set}")
+
+
+def build_region_group_features(region_group_set):
+	dissolve_region_groups(region_group_set)
+	groups = region_group_set.groups.order_by("id").values_list("id", "name", "geometry", "dissolved_geometry")
+	return [_as_feature(group_geometry if group_geometry is not None else dissolved_geometry, group_id, {"region_group_id": group_id, "name": name})
+	        for group_id, name, group_geometry, dissolved_geometry in groups if group_geometry is not None or dissolved_geometry is not None]
+
+
+def _encode(collection):
+	return json.dumps(collection, separators=(",", ":")).encode("utf-8")
+
+
+def update_feature_collections(model_area, region_group_set=None):
+	"""
+		Builds and stores the FeatureCollections for the model area's regions, or for the groups in region_group_set -
+		the full resolution one and one for each level of detail
+	:param model_area: ModelArea instance
+	:param region_group_set: RegionGroupSet instance, or None for the model area's regions
+	:return: dict of the new FeatureCollections, keyed by level of detail (None for the full resolution one)
+	"""
+	# get the version before reading geometry - if anything changes while we build, the next request rebuilds it
+	version_field = "region_version" if region_group_set is None else "region_group_version"
+	version = models.ModelArea.objects.filter(pk=model_area.pk).values_list(version_field, flat=True).get()
+
+	if region_group_set is None:
+		features = build_region_features(model_area)
+	else:
+		features = build_region_group_features(region_group_set)
+
+	encoded_levels = {None: _encode({"type": "FeatureCollection", "features": features})}
+	levels_of_detail = geometry.build_levels_of_detail(features, settings.GEOMETRY_SIMPLIFICATION_TOLERANCES, settings.GEOMETRY_QUANTIZATION)
+	for collection in levels_of_detail:
+		encoded_levels[collection["level_of_detail"]] = _encode(collection)
+
+	with transaction.atomic():
+		models.FeatureCollection.objects.filter(model_area=model_area, region_group_set=region_group_set).delete()
+		feature_collections = {}
+		for level, encoded in encoded_levels.items():
+			feature_collections[level] = models.FeatureCollection.objects.create(
+				model_area=model_area,
+				region_group_set=region_group_set,
+				version=version,
+				level=level,
+				data=gzip.compress(encoded, compresslevel=9),
+				etag=hashlib.sha1(encoded).hexdigest(),
+			)
+
+	sizes = ", ".join(f"{'full' if level is None else level}: {len(encoded)} bytes" for level, encoded in encoded_levels.items())
+	log.info(f"Built feature collections with {len(features)} features for {feature_collections[None]} ({sizes})")
+	return feature_collections
+
+
+def update_model_area_feature_collections(model_area):
+	"""
+		Builds the region FeatureCollection for the model area and one for each of its region group sets
+	"""
+	update_feature_collections(model_area)
+	for region_group_set in model_area.region_group_sets.all():
+		update_feature_collections(model_area, region_group_set)
+
+
+def get_levels_of_detail():
+	"""
+		The levels of detail we build - pass one of them to get_feature_collection
+	"""
+	return range(len(settings.GEOMETRY_SIMPLIFICATION_TOLERANCES))
+
+
+def get_feature_collection(model_area, region_group_set=None, level=None):
+	"""
+		Returns the stored FeatureCollection for the model area's regions or the groups in region_group_set,
+		building them first if we don't have them for the current version
+	:param model_area: ModelArea instance
+	:param region_group_set: RegionGroupSet instance, or None for the model area's regions
+	:param level: level of detail (see get_levels_of_detail), or None for full resolution GeoJSON
+	:return: FeatureCollection instance
+	"""
+	if level is not None and level not in get_levels_of_detail():
+		raise ValueError(f"No level of detail {level} - levels go from 0 to {len(get_levels_of_detail()) - 1}")
+
+	current_version = model_area.region_version if region_group_set is None else model_area.region_group_version
+	feature_collection = models.FeatureCollection.objects.filter(model_area=model_area, region_group_set=region_group_set, level=level)\
+		.order_by("-date_created").first()
+
+	if feature_collection is None or feature_collection.version != current_version:
+		feature_collection = update_feature_collections(model_area, region_group_set)[level]
+
+	return feature_collection
@@ -0,0 +1,27 @@
+"""
+	Filters for API listings, with django-filter
+"""
+
+from django_filters import rest_framework as filters
+
+from waterspout_api import models
+
+
+class ModelRunFilter(filters.FilterSet):
+	"""
+		Filters for model run listings:
+			?user= - user ID
+			?is_base=true/false
+			?complete=true/false
+			?submitted_after= and ?submitted_before= - ISO 8601 dates or datetimes, inclusive
+			?search= - part of the model run's name, in any case
+			?changed_since= - ISO 8601 datetime - only model runs changed after it (see views.list_model_runs)
+	"""
+	search = filters.CharFilter(field_name="name", lookup_expr="icontains")
+	submitted_after = filters.IsoDateTimeFilter(field_name="date_submitted", lookup_expr="gte")
+	submitted_before = filters.IsoDateTimeFilter(field_name="date_submitted", lookup_expr="lte")
+	changed_since = filters.IsoDateTimeFilter(field_name="date_modified", lookup_expr="gt")
+
+	class Meta:
+		model = models.ModelRun
+		fields = ["user", "is_base", "complete"]
@@ -0,0 +1,360 @@
+"""
+	Builds simplified, quantized versions of region and region group geometry at several levels of detail, so maps
+	can download geometry that matches how far they're zoomed in instead of every vertex at full resolution.
+
+	Simplification preserves topology between neighbors: we split every ring into arcs at the points where it meets
+	other rings (junctions), simplify each shared arc once, and then rebuild every ring from the simplified arcs. Two
+	regions that share a border still share exactly the same border after simplification, so there are no gaps or
+	slivers between them. Junctions are never removed.
+
+	Coordinates are quantized - snapped to an integer grid over the bounding box of all the features - before we do
+	anything else, which also makes shared vertices match exactly. The output is a FeatureCollection with a "transform"
+	(like TopoJSON) and rings written as flat, delta-encoded integer lists: [x0, y0, dx1, dy1, dx2, dy2, ...]. To get
+	coordinates back, keep a running sum of the x and y values, then
+	longitude = x * transform["scale"][0] + transform["translate"][0] (and the same for latitude with index 1).
+
+	dissolve merges polygons that share borders (such as the regions in a region group) into their outline.
+"""
+
+import collections
+import logging
+
+import numpy
+
+log = logging.getLogger("waterspout.geometry")
+
+
+def get_polygons(geometry):
+	"""
+		Returns the polygons in a GeoJSON geometry as a list of polygons, each a list of rings (exterior ring
+		first), each ring a list of [x, y] coordinates. Other geometry types have no polygons.
+	"""
+	if geometry is None:
+		return []
+	if geometry["type"] == "Polygon":
+		return [geometry["coordinates"]]
+	if geometry["type"] == "MultiPolygon":
+		return geometry["coordinates"]
+	log.warning(f"Skipping {geometry['type']} geometry - only Polygons and MultiPolygons can be simplified")
+	return []
+
+
+def get_transform(features, quantization):
+	"""
+		Returns the scale and translation that map the features' coordinates onto a quantization x quantization grid
+	"""
+	coordinates = [numpy.asarray(ring, dtype="float64")[:, :2] for feature in features
+	               for polygon in get_polygons(feature["geometry"]) for ring in polygon if len(ring) > 0]
+	if len(coordinates) == 0:
+		return {"scale": [1, 1], "translate": [0, 0]}
+
+	coordinates = numpy.concatenate(coordinates)
+	minimums = coordinates.min(axis=0)
+	ranges = coordinates.max(axis=0) - minimums
+	scale = numpy.where(ranges > 0, ranges / (quantization - 1), 1)
+	return {"scale": scale.tolist(), "translate": minimums.tolist()}
+
+
+def quantize_ring(ring, transform):
+	"""
+		Snaps a ring to the integer grid, dropping points that land on the same grid cell as the point before them
+	:return: tuple of (x, y) integer tuples, closed (the last point is the first point)
+	"""
+	points = numpy.round((numpy.asarray(ring, dtype="float64")[:, :2] - transform["translate"]) / transform["scale"]).astype("int64")
+	if len(points) == 0:
+		return ()
+	keep = numpy.ones(len(points), dtype=bool)
+	keep[1:] = numpy.any(points[1:] != points[:-1], axis=1)
+	points = [tuple(point) for point in points[keep].tolist()]
+	if points[0] != points[-1]:
+		points.append(points[0])
+	return tuple(points)
+
+
+def douglas_peucker(points, tolerance, keep_minimum=False):
+	"""
+		Simplifies a line, keeping its end points
+	:param points: numpy array of shape (n, 2)
+	:param tolerance: how far, in the points' units, a point can be from the simplified line before we keep it
+	:param keep_minimum: if True, always keep the point farthest from the line between the ends, so that lines
+				with any points between their ends keep at least three points
+	:return: numpy array of the points we keep
+	"""
+	if tolerance <= 0 or len(points) < 3:
+		return points
+
+	points = points.astype("float64")
+	keep = numpy.zeros(len(points), dtype=bool)
+	keep[0] = keep[-1] = True
+	stack = [(0, len(points) - 1)]
+	while stack:
+		start, end = stack.pop()
+		if end - start < 2:
+			continue
+
+		segment = points[end] - points[start]
+		offsets = points[start + 1:end] - points[start]
+		length = numpy.hypot(segment[0], segment[1])
+		if length == 0:  # the ends are the same point - use the distance from it
+			distances = numpy.hypot(offsets[:, 0], offsets[:, 1])
+		else:
+			distances = numpy.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+
+		farthest = int(numpy.argmax(distances))
+		if distances[farthest] > tolerance or (keep_minimum and start == 0 and end == len(points) - 1):
+			index = start + 1 + farthest
+			keep[index] = True
+			stack.append((start, index))
+			stack.append((index, end))
+
+	return points[keep]
+
+
+class Topology(object):
+	"""
+		The quantized rings of a set of features, split into arcs at their junctions. Build it once, then call
+		simplify for each tolerance.
+	"""
+
+	def __init__(self, features, quantization):
+		"""
+		:param features: list of GeoJSON features with Polygon or MultiPolygon geometry
+		:param quantization: how many grid cells to quantize each axis into
+		"""
+		self.features = features
+		self.transform = get_transform(features, quantization)
+
+		# each feature becomes a list of polygons, each a list of rings, each a tuple of quantized points. Rings
+		# smaller than a grid cell disappear, and so do polygons whose outside ring disappears
+		self.feature_rings = []
+		for feature in features:
+			polygons = []
+			for polygon in get_polygons(feature["geometry"]):
+				rings = [quantize_ring(ring, self.transform) for ring in polygon]
+				if len(rings) > 0 and len(rings[0]) >= 4:
+					polygons.append([ring for ring in rings if len(ring) >= 4])
+			self.feature_rings.append(polygons)
+		self.junctions = self._find_junctions()
+
+		# rings made of fewer than three arcs would collapse into lines if their arcs simplified down to their ends,
+		# so arcs in those rings keep at least one point between their ends
+		self.ring_arcs = {}
+		self.minimum_arcs = set()
+		for polygons in self.feature_rings:
+			for rings in polygons:
+				for ring in rings:
+					arcs = self._split_ring(ring)
+					self.ring_arcs[ring] = arcs
+					if len(arcs) < 3:
+						self.minimum_arcs.update(min(arc, arc[::-1]) for arc in arcs)
+
+	def _find_junctions(self):
+		# a point is a junction if it has more than two different neighbors across every ring it's in - that's
+		# where a border stops being shared by the same set of rings
+		neighbors = {}
+		for polygons in self.feature_rings:
+			for rings in polygons:
+				for ring in rings:
+					count = len(ring) - 1  # the last point repeats the first
+					for index in range(count):
+						neighbors.setdefault(ring[index], set()).update((ring[index - 1], ring[(index + 1) % count]))
+
+		return {point for point, point_neighbors in neighbors.items() if len(point_neighbors) > 2}
+
+	def _split_ring(self, ring):
+		"""
+			Splits a closed ring into arcs that start and end at junctions. Rings without junctions become a single
+			closed arc starting at their smallest point, so that identical rings split the same way.
+		"""
+		points = ring[:-1]
+		junction_indexes = [index for index, point in enumerate(points) if point in self.junctions]
+		start = junction_indexes[0] if junction_indexes else points.index(min(points))
+		points = points[start:] + points[:start] + (points[start],)
+
+		arcs = []
+		arc_start = 0
+		for index in range(1, len(points)):
+			if index == len(points) - 1 or points[index] in self.junctions:
+				arcs.append(points[arc_start:index + 1])
+				arc_start = index
+
+		return arcs
+
+	def simplify(self, tolerance):
+		"""
+			Returns the features with their geometry simplified to tolerance (in grid cells) and delta encoded
+		:param tolerance: grid cells - 0 keeps every quantized point
+		:return: GeoJSON-like FeatureCollection dict with the transform
+		"""
+		simplified_arcs = {}
+
+		def simplify_arc(arc):
+			# every arc shared between rings gets simplified exactly once, in one direction
+			reverse = arc[::-1]
+			key = min(arc, reverse)
+			if key not in simplified_arcs:
+				if key[0] == key[-1]:  # closed arc - split at the farthest point so both halves have distinct ends
+					offsets = numpy.asarray(key, dtype="float64") - key[0]
+					middle = int(numpy.argmax(numpy.hypot(offsets[:, 0], offsets[:, 1])))
+					points = numpy.concatenate([douglas_peucker(numpy.asarray(key[:middle + 1]), tolerance, keep_minimum=True),
+					                            douglas_peucker(numpy.asarray(key[middle:]), tolerance, keep_minimum=True)[1:]])
+				else:
+					points = douglas_peucker(numpy.asarray(key), tolerance, keep_minimum=key in self.minimum_arcs)
+				simplified_arcs[key] = points.astype("int64")
+			points = simplified_arcs[key]
+			return points if key == arc else points[::-1]
+
+		features = []
+		for feature, polygons in zip(self.features, self.feature_rings):
+			encoded_polygons = []
+			for rings in polygons:
+				encoded_rings = []
+				for ring_index, ring in enumerate(rings):
+					arcs = [simplify_arc(arc) for arc in self.ring_arcs[ring]]
+					points = numpy.concatenate([arcs[0]] + [arc[1:] for arc in arcs[1:]])
+					if len(points) < 4:  # collapsed - drop holes, but keep the full ring for the outside of the polygon
+						if ring_index > 0:
+							continue
+						points = numpy.asarray(ring, dtype="int64")
+					encoded_rings.append(delta_encode(points))
+				encoded_polygons.append(encoded_rings)
+
+			if len(encoded_polygons) == 0:
+				geometry = None
+			elif len(encoded_polygons) == 1:
+				geometry = {"type": "Polygon", "coordinates": encoded_polygons[0]}
+			else:
+				geometry = {"type": "MultiPolygon", "coordinates": encoded_polygons}
+			features.append({"type": "Feature", "id": feature.get("id"), "properties": feature.get("properties", {}), "geometry": geometry})
+
+		return {"type": "FeatureCollection", "encoding": "quantized-delta", "transform": self.transform, "features": features}
+
+
+def delta_encode(points):
+	"""
+		Returns points as a flat list: the first point, then the difference from each point to the one before it
+	"""
+	deltas = numpy.array(points, dtype="int64")
+	deltas[1:] = deltas[1:] - deltas[:-1]
+	return deltas.ravel().tolist()
+
+
+def delta_decode(values, transform):
+	"""
+		The reverse of delta_encode, back to (unquantized) coordinates - mostly for checking output
+	"""
+	points = numpy.cumsum(numpy.asarray(values, dtype="int64").reshape(-1, 2), axis=0)
+	return (points * transform["scale"] + transform["translate"]).tolist()
+
+
+def build_levels_of_detail(features, tolerances, quantization):
+	"""
+		Builds a simplified, quantized FeatureCollection of features for each tolerance
+	:param features: list of GeoJSON features with Polygon or MultiPolygon geometry
+	:param tolerances: list of simplification tolerances, in grid cells - one level of detail per tolerance
+	:param quantization: how many grid cells to quantize each axis into
+	:return: list of FeatureCollection dicts, in the same order as tolerances
+	"""
+	topology = Topology(features, quantization)
+	levels = []
+	for level, tolerance in enumerate(tolerances):
+		collection = topology.simplify(tolerance)
+		collection["level_of_detail"] = level
+		# the tolerance in coordinate units, so that clients can pick a level for their zoom
+		collection["tolerance"] = tolerance * max(topology.transform["scale"])
+		levels.append(collection)
+	return levels
+
+
+def ring_area(points):
+	"""
+		Signed area of a ring - positive when it goes counterclockwise (with y going up)
+	:param points: array-like of shape (n, 2), closed or not
+	"""
+	points = numpy.asarray(points, dtype="float64")
+	following = numpy.roll(points, -1, axis=0)
+	return float(numpy.sum(points[:, 0] * following[:, 1] - following[:, 0] * points[:, 1])) / 2
+
+
+def ring_contains(ring, x, y):
+	"""
+		Whether the point is inside the ring, by counting how many of the ring's edges a ray from the point crosses
+	:param ring: numpy array of shape (n, 2) - closed or not
+	"""
+	following = numpy.roll(ring, -1, axis=0)
+	straddles = (ring[:, 1] > y) != (following[:, 1] > y)
+	with numpy.errstate(divide="ignore", invalid="ignore"):
+		crossing_x = ring[:, 0] + (y - ring[:, 1]) * (following[:, 0] - ring[:, 0]) / (following[:, 1] - ring[:, 1])
+	return bool(numpy.count_nonzero(straddles & (x < crossing_x)) % 2)
+
+
+def _chain_edges(edges):
+	# joins directed edges into closed rings - every point has as many edges leaving it as arriving at it
+	outgoing = collections.defaultdict(list)
+	for start, end in edges:
+		outgoing[start].append(end)
+
+	rings = []
+	for start in list(outgoing):
+		while outgoing[start]:
+			ring = [start]
+			point = outgoing[start].pop()
+			while point != start:
+				ring.append(point)
+				point = outgoing[point].pop()
+			ring.append(start)
+			rings.append(ring)
+	return rings
+
+
+def dissolve(polygons, transform):
+	"""
+		Merges polygons into their outline. Borders shared between polygons cancel each other out, so the
+		polygons need to share points along those borders, which polygons cut from the same source data do.
+		Overlapping polygons aren't merged.
+	:param polygons: list of polygons, each a list of rings of [x, y] coordinates (outside ring first)
+	:param transform: from get_transform - quantizing points to the same grid is what matches up shared borders, so
+				use the same transform for everything that needs to fit together
+	:return: GeoJSON Polygon or MultiPolygon geometry dict, or None if nothing is left
+	"""
+	edges = collections.Counter()
+	for polygon in polygons:
+		for index, ring in enumerate(polygon):
+			points = quantize_ring(ring, transform) if len(ring) > 0 else ()
+			area = ring_area(points) if len(points) >= 4 else 0
+			if area == 0:
+				if index == 0:  # no outside ring means no polygon
+					break
+				continue
+			if (area > 0) != (index == 0):  # outside rings go counterclockwise and holes go clockwise
+				points = points[::-1]
+
+			for edge in zip(points[:-1], points[1:]):
+				reverse = edge[::-1]
+				if edges[reverse] > 0:  # the same border going the other way around a neighbor - it's inside the outline
+					edges[reverse] -= 1
+				else:
+					edges[edge] += 1
+
+	rings = [numpy.asarray(ring, dtype="float64") for ring in _chain_edges(edges.elements())]
+	rings = [ring for ring in rings if len(ring) >= 4 and ring_area(ring) != 0]
+	exteriors = [ring for ring in rings if ring_area(ring) > 0]
+	holes = [ring for ring in rings if ring_area(ring) < 0]
+	if len(exteriors) == 0:
+		return None
+
+	# put each hole in the smallest outside ring that contains it
+	output = [[exterior] for exterior in exteriors]
+	areas = [ring_area(exterior) for exterior in exteriors]
+	for hole in holes:
+		x, y = (hole[0] + hole[1]) / 2  # the middle of an edge, so it's not on another ring's corner
+		containing = [index for index, exterior in enumerate(exteriors) if ring_contains(exterior, x, y)]
+		if containing:
+			output[min(containing, key=lambda index: areas[index])].append(hole)
+
+	scale = numpy.asarray(transform["scale"])
+	translate = numpy.asarray(transform["translate"])
+	coordinates = [[(ring * scale + translate).tolist() for ring in polygon] for polygon in output]
+	if len(coordinates) == 1:
+		return {"type": "Polygon", "coordinates": coordinates[0]}
+	return {"type": "MultiPolygon", "coordinates": coordinates}
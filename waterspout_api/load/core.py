@@ -5,9 +5,12 @@ import logging
 
 import pandas
 import django
+from django.db import transaction
+from django.db.models import DecimalField, FloatField, IntegerField
 
-from waterspout_api import models, load
+from waterspout_api import models, load, feature_collections
 
+from Waterspout import settings
 from Waterspout.settings import BASE_DIR
 
 log = logging.getLogger("waterspout.load")
@@ -96,53 +99,91 @@ def load_regions(json_file, field_map, model_area):
 
 		region.save()  # save it with the new attributes
 
+	# build the FeatureCollections of all the regions we send to maps
+	feature_collections.update_feature_collections(model_area)
+
 
 def load_input_data_set(csv_file, model_area, years,
                          set_model=models.CalibrationSet,
                          item_model=models.CalibratedParameter,
-                         set_lookup="calibration_set"):
+                         set_lookup="calibration_set",
+                         batch_size=None):
 	"""
 		Load Input Data or Calibration Data, but they use the same format - just the calibration data will store
 		more fields. provide the set_model, item_model, and set_lookup in order to use it for input data
-	:param csv_file:
+
+		Reads the whole CSV with pandas, looks up the IDs for every region and crop in the model area once, converts
+		each column to its field's type, and inserts the records in batches in a single transaction. Rows for regions
+		that aren't in the model area get skipped (and logged together), but every crop needs to exist.
+	:param csv_file: path (or file object) of the CSV. "g" and "i" columns have the region internal ID and crop code,
+					and other columns that match fields on item_model get loaded to those fields
 	:param model_area:
 	:param years:
 	:param set_model: which model to use for the dataset
 	:param item_model: which model to use for individual data items
 	:param set_lookup: string for the foreign key from the item_model to the set_model
+	:param batch_size: how many records to insert per query. Defaults to settings.INPUT_DATA_LOAD_BATCH_SIZE
 	:return:
 	"""
-	item_set = set_model(model_area=model_area, years=",".join([str(year) for year in years]))
-	item_set.save()
-
-	with open(csv_file, 'r') as csv_data:
-		reader = csv.DictReader(csv_data)
-		for row in reader:
-			continue_outer = False  # we need a flag in case we don't find an existing region object so we can skip it from the internal loop
-
-			param = item_model()
-			setattr(param, set_lookup, item_set)  # set the foreign key to the item_set - equiv to calibration_set=item_set if for calibration data
-			for key in row:
-				# need to do lookups for foreign keys
-				if key == "g":
-					try:
-						param.region = models.Region.objects.get(internal_id=row["g"], model_area=model_area)
-					except models.Region.DoesNotExist:
-						continue_outer = True
-						break
-				elif key == "i":
-					param.crop = models.Crop.objects.get(crop_code=row["i"], model_area=model_area)
-				elif key == "year":
-					if "." in row["year"]:
-						param.year = 1  # set year = 1 for calibration data sets
-					else:
-						param.year = row["year"]
-				else:
-					setattr(param, key, row[key])
+	if batch_size is None:
+		batch_size = settings.INPUT_DATA_LOAD_BATCH_SIZE
+
+	# read everything as text first so region and crop codes stay as they're written (leading zeros, etc)
+	data = pandas.read_csv(csv_file, dtype=str)
+
+	region_ids = dict(models.Region.objects.filter(model_area=model_area).values_list("internal_id", "id"))
+	crop_ids = dict(models.Crop.objects.filter(model_area=model_area).values_list("crop_code", "id"))
+
+	regions = data["g"].map(region_ids)
+	skipped = regions.isna()
+	if skipped.any():
+		log.warning(f"Skipping {skipped.sum()} rows for regions that aren't in model area {model_area}: {list(data['g'][skipped].unique())}")
+		data = data[~skipped]
+		regions = regions[~skipped]
+
+	crops = data["i"].map(crop_ids)
+	if crops.isna().any():
+		raise models.Crop.DoesNotExist(f"Crops {list(data['i'][crops.isna()].unique())} aren't in model area {model_area}")
+
+	columns = {}
+	if "year" in data.columns:
+		# calibration data has a fractional year column - we store those as year 1
+		is_calibration_year = data["year"].str.contains(".", regex=False, na=False)
+		columns["year"] = pandas.to_numeric(data["year"].mask(is_calibration_year, "1"))
+
+	# columns that don't match a field (other than the region and crop codes) are ignored
+	for field in item_model._meta.concrete_fields:
+		if field.is_relation or field.name in ("id", "year") or field.name not in data.columns:
+			continue
+		if isinstance(field, (DecimalField, FloatField)):
+			values = pandas.to_numeric(data[field.name]).astype("float64")
+			if isinstance(field, DecimalField):
+				values = values.round(field.decimal_places)
+			columns[field.name] = values
+		elif isinstance(field, IntegerField):
+			columns[field.name] = pandas.to_numeric(data[field.name])
+		else:
+			columns[field.name] = data[field.name]
 
-			if not continue_outer:
-				param.save()
+	values = pandas.DataFrame(columns, index=data.index)
+	missing = [field.name for field in item_model._meta.concrete_fields
+	           if field.name in values.columns and not field.null and values[field.name].isna().any()]
+	if missing:
+		raise ValueError(f"{csv_file} is missing values in required columns {missing}")
 
+	# NaN would get stored as NaN instead of NULL, so swap in None
+	values = values.astype(object).where(values.notna(), None)
+
+	with transaction.atomic():
+		item_set = set_model(model_area=model_area, years=",".join([str(year) for year in years]))
+		item_set.save()
+
+		# the set is new, so there's nothing cached for it that bulk_create would need to bump the version of
+		records = [item_model(crop_id=crop_id, region_id=region_id, **{set_lookup: item_set}, **row)
+		           for crop_id, region_id, row in zip(crops.astype(int), regions.astype(int), values.to_dict("records"))]
+		item_model.objects.bulk_create(records, batch_size=batch_size)
+
+	log.info(f"Loaded {len(records)} {item_model.__name__} records for {item_set}")
 	return item_set
 
 
@@ -422,6 +463,9 @@ def load_region_group_file(group_file_path, member_file_path, config_path, model
 	"""
 		Includes definition of models to use because it's used in a migration and we'll need to pass
 		in the migration's version of the model
+
+		group_file_path can be None to make the groups from the names in the member file instead of a GeoJSON file -
+		maps then show the outlines of each group's regions (see feature_collections.dissolve_region_groups)
 	"""
 
 	with open(config_path, 'r') as config_data:
@@ -442,27 +486,29 @@ def load_region_group_file(group_file_path, member_file_path, config_path, model
 	# this should be safe
 	#group_set = models.RegionGroupSet.objects.get(pk=group_set.id)
 
-	# now create the groups in the geojson file
-	with open(group_file_path, 'r') as group_info_file:
-		for line in group_info_file.readlines():
-			RegionGroupModel.objects.create(
-				name=json.loads(line)["properties"][config["group_name_field"]],
-				group_set=group_set,
-				geometry=line
-			)
+	with open(member_file_path, 'r') as group_members_file:
+		groups = list(csv.DictReader(group_members_file))  # read it all in - we're going to go through it twice
+
+	if group_file_path is not None:
+		# now create the groups in the geojson file
+		with open(group_file_path, 'r') as group_info_file:
+			for line in group_info_file.readlines():
+				RegionGroupModel.objects.create(
+					name=json.loads(line)["properties"][config["group_name_field"]],
+					group_set=group_set,
+					geometry=line
+				)
+	else:
+		# no geometry - make a group for each name in the member file, in the order they first show up
+		group_names = dict.fromkeys(region_group[config["group_name_field"]] for region_group in groups)
+		for group_name in group_names:
+			if group_name is not None and group_name != "":
+				RegionGroupModel.objects.create(name=group_name, group_set=group_set)
 
 	# then add the null group for all other regions
 	if "null_group_name" in config:
 		RegionGroupModel.objects.create(name=config["null_group_name"], group_set=group_set)
 
-	with open(member_file_path, 'r') as group_members_file:
-		groups = list(csv.DictReader(group_members_file))  # read it all in - we're going to go through it twice
-
-	# get the distinct list of group names - this was how we originally figured out which groups to make. Now do it with
-	# the GeoJSON file so we can add geometries
-	#group_names = list(set([region_group[config["group_name"]] for region_group in groups]))
-	#group_names.append(config["null_group_name"])
-
 	for region_group in group_set.groups.all():
 		# now add the regions to the group - seems most efficient to iterate through the group data while we already have
 		# this object in hand - we'll go through the data multiple times, but we'll do far fewer DB retrievals for group objects
@@ -481,6 +527,11 @@ def load_region_group_file(group_file_path, member_file_path, config_path, model
 
 				region_group.regions.add(region)
 
+	# build the FeatureCollections of the groups for maps - but not when we're running in a migration, where the
+	# models passed in are the migration's versions and the FeatureCollection table may not exist yet
+	if RegionGroupSetModel is models.RegionGroupSet:
+		feature_collections.update_feature_collections(model_area, group_set)
+
 	# function should check that group set name doesn't already exist in model area and gracefully exit if it does
 
 def preload_model_runs(model_runs, data_name, model_area):
@@ -0,0 +1,25 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from waterspout_api import models
+from waterspout_api import feature_collections
+
+log = logging.getLogger("waterspout")
+
+
+class Command(BaseCommand):
+	help = 'Builds the stored GeoJSON FeatureCollections of regions and region groups that we send to maps. Builds them' \
+	       ' for every model area unless you provide model area IDs with --model_area_id'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--model_area_id', nargs='+', type=int, dest="model_area_id", default=None,)
+
+	def handle(self, *args, **options):
+		model_areas = models.ModelArea.objects.all()
+		if options["model_area_id"]:
+			model_areas = model_areas.filter(id__in=options["model_area_id"])
+
+		for model_area in model_areas:
+			log.info(f"Building feature collections for {model_area.name}")
+			feature_collections.update_model_area_feature_collections(model_area)
@@ -1,14 +1,19 @@
+import argparse
 import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
 import time
 import traceback
 
 import psycopg2
-from django.db import connection
 from django.core.management.base import BaseCommand, CommandError
-from django.db.models import F, RowRange, Window
-from django.db.models.functions import Rank, ExtractYear
 
 from waterspout_api import models
+from waterspout_api import scheduling
+from waterspout_api import notifications
 from Waterspout import settings
 
 
@@ -18,23 +23,100 @@ log = logging.getLogger("waterspout_service_run_processor")
 class Command(BaseCommand):
 	help = 'Starts the event loop that processes model runs and sends the commands to Mantis'
 
+	def add_arguments(self, parser):
+		parser.add_argument("--workers", type=int, default=1,
+		                    help="How many worker processes should solve model runs at the same time? Each worker claims"
+		                         " runs from the queue on its own, so a slow run only holds up one worker")
+		# set by the supervisor when it starts worker processes so the logs say which worker did what - not for direct use
+		parser.add_argument("--worker-id", type=str, default=None, help=argparse.SUPPRESS)
+
 	def handle(self, *args, **options):
 		self._waiting_runs = []
-		self.process_runs()
+		self._worker_id = options["worker_id"] or f"{socket.gethostname()}-{os.getpid()}"
+
+		if options["workers"] < 1:
+			raise CommandError("--workers must be at least 1")
+
+		# service managers stop us with SIGTERM - turn it into SystemExit so our finally blocks release our claims
+		signal.signal(signal.SIGTERM, self._exit_on_signal)
+
+		if options["workers"] == 1:
+			self.process_runs()
+		else:
+			self.supervise_workers(options["workers"])
+
+	def supervise_workers(self, num_workers):
+		"""
+			Starts num_workers separate run processor processes and restarts any that exit. We start full
+			processes through manage.py rather than forking so that each worker sets up Django (and its database
+			connection) on its own, which also keeps this working on Windows, where we can't fork.
+		:param num_workers: how many worker processes to keep running
+		:return:
+		"""
+		manage_py = os.path.join(settings.BASE_DIR, "manage.py")
+		workers = {}
+
+		def start_worker(worker_number):
+			worker_id = f"{socket.gethostname()}-{os.getpid()}-{worker_number}"
+			log.info(f"Starting model run worker {worker_id}")
+			return worker_id, subprocess.Popen([sys.executable, manage_py, "process_runs", "--worker-id", worker_id])
+
+		for worker_number in range(num_workers):
+			workers[worker_number] = start_worker(worker_number)
+
+		try:
+			while True:
+				time.sleep(settings.MODEL_RUN_WORKER_CHECK_INTERVAL)  # only checks on the worker processes - no database work
+				for worker_number, (worker_id, process) in workers.items():
+					if process.poll() is not None:  # the worker exited - log it and start a replacement so we keep the pool full
+						log.error(f"Model run worker {worker_id} exited with code {process.returncode}. Restarting it")
+						# anything it was in the middle of goes back in the queue for the other workers
+						released = models.ModelRun.objects.release_claims(worker_id)
+						if released:
+							log.warning(f"Returned {released} model run(s) claimed by worker {worker_id} to the queue")
+						workers[worker_number] = start_worker(worker_number)
+		finally:  # if we're shutting down (Ctrl+C, service stop, or a crash), don't leave orphaned workers behind
+			for worker_id, process in workers.values():
+				if process.poll() is None:
+					process.terminate()
+			for worker_id, process in workers.values():
+				process.wait()
+				# workers release their own claims when they stop - this catches any that couldn't
+				models.ModelRun.objects.release_claims(worker_id)
+
+	def _exit_on_signal(self, signal_number, frame):
+		log.info(f"Received signal {signal_number} - shutting down")
+		sys.exit(0)
 
 	def process_runs(self):
+		# only the processes that solve runs need these - the supervisor never checks the queue itself
+		self._scheduler = scheduling.get_scheduler()
+		self._waiter = notifications.get_run_waiter()
+
+		try:
+			self._process_runs()
+		finally:  # put anything we were in the middle of back in the queue, so another processor can pick it up
+			released = models.ModelRun.objects.release_claims(self._worker_id)
+			if released:
+				log.warning(f"Returned {released} model run(s) claimed by worker {self._worker_id} to the queue")
+
+	def _process_runs(self):
 		while True:
 			try:
 				self._get_runs()
 
-				if len(self._waiting_runs) == 0:  # if we don't have any runs, go to sleep for a few seconds, then check again
-					time.sleep(settings.MODEL_RUN_CHECK_INTERVAL)  # defaults to 4
+				if len(self._waiting_runs) == 0:  # if we don't have any runs, wait until we're notified of one, or for a while, then check again
+					self._waiter.wait(settings.MODEL_RUN_CHECK_INTERVAL)
 					continue
 
-				for run in self._waiting_runs:
-					log.info(f"Running model run {run.id}")
+				run = models.ModelRun.objects.claim_next(self._worker_id, candidate_ids=self._waiting_runs)
+				if run is None:  # other workers claimed everything we saw - check again right away
+					continue
 
-					run.run()
+				log.info(f"Worker {self._worker_id} running model run {run.id}")
+				run.run()
+			except (KeyboardInterrupt, SystemExit):  # we're shutting down - don't treat it as an error and keep going
+				raise
 			except psycopg2.InterfaceError:  # if we get an error from psycopg2 that basically says the connection is closed, then log the error and wait 60 seconds before starting the loop again
 				log.error(traceback.format_exc())
 				time.sleep(60)
@@ -47,23 +129,12 @@ class Command(BaseCommand):
 	def _get_runs(self):
 		log.debug("Checking for new model runs")
 
-		#if "sqlite3" not in connection.settings_dict["ENGINE"]:  # window functions in django don't work on sqlite
-
-			# the window function is used to ensure fairness, providing the ability to merge someone's newer runs with
-			# someone else's older runs if the first person has lots of runs. Prevents someone from monopolizing the
-			# run processor with API calls - instead, new people
-		#	window_func = Window(
-		#		expression=Rank('date_submitted'),
-		#		partition_by=F('user_id'),
-		#		output_field=F('rank'),
-		#		order_by=F('date_submitted').asc(),
-		#	),
-
-		#	new_runs = models.ModelRun.objects.filter(ready=True, running=False, complete=False).annotate(window_func)\
-		#										.order_by('rank')[:8]  # only select up to 8 at a time so that if someone
-																	# submits a bunch over the API, we pause long enough to get new ones again soon
-		#else:
-		new_runs = models.ModelRun.objects.filter(ready=True, running=False, complete=False) \
-			.order_by('date_submitted')
-
-		self._waiting_runs = new_runs
\ No newline at end of file
+		# a processor that was killed outright (or lost its host) never released its claims - put those runs back
+		stale = models.ModelRun.objects.release_stale_claims(settings.MODEL_RUN_CLAIM_TIMEOUT)
+		if stale:
+			log.warning(f"Returned {stale} model run(s) with stale claims to the queue")
+
+		# the scheduler decides the order for fairness, so that someone submitting lots of runs over the API can't
+		# monopolize the run processor. We only need the IDs - claiming the run retrieves it, and only one worker
+		# will get each one
+		self._waiting_runs = self._scheduler.get_batch()
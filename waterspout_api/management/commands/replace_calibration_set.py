@@ -11,6 +11,7 @@
 import logging
 
 from django.core.management.base import BaseCommand
+from django.utils import timezone
 
 from waterspout_api.load.core import load_input_data_set
 from waterspout_api import models
@@ -50,7 +51,8 @@ class Command(BaseCommand):
 		models.ModelRun.objects.filter(model_area=model_area)\
 								.update(calibration_set=new_calibration_set,
 		                                     complete=False,
-		                                     running=False)
+		                                     running=False,
+		                                     date_modified=timezone.now())
 
 		# 4 delete the old calibration set
 		log.info("Deleting the old calibration set")
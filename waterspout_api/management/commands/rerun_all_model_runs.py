@@ -3,8 +3,10 @@ import time
 import traceback
 
 from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
 
 from waterspout_api import models
+from waterspout_api import notifications
 
 
 log = logging.getLogger("waterspout")
@@ -14,5 +16,6 @@ class Command(BaseCommand):
 	help = 'Sets all model runs to be re-run. Just sets their "complete" status to False and then the run processor will handle running them'
 
 	def handle(self, *args, **options):
-		models.ModelRun.objects.all().update(complete=False, running=False)
+		models.ModelRun.objects.all().update(complete=False, running=False, date_modified=timezone.now())
+		notifications.notify_runs_waiting()  # .update() doesn't send post_save, so let the run processor know directly
 		log.info("All model runs set to incomplete")
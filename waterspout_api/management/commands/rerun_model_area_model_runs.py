@@ -3,8 +3,10 @@ import time
 import traceback
 
 from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
 
 from waterspout_api import models
+from waterspout_api import notifications
 
 
 log = logging.getLogger("waterspout")
@@ -22,6 +24,7 @@ class Command(BaseCommand):
 
 		model_area = models.ModelArea.objects.get(name=options['model_area_name'])
 		for calibration_set in model_area.calibration_data.all():
-			calibration_set.model_runs.update(complete=False, running=False)
+			calibration_set.model_runs.update(complete=False, running=False, date_modified=timezone.now())
+		notifications.notify_runs_waiting()  # .update() doesn't send post_save, so let the run processor know directly
 
 		log.info(f"All model runs in area {options['model_area_name']} set to incomplete")
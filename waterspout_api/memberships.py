@@ -0,0 +1,92 @@
+"""
+	Caches which organizations each user belongs to, since nearly every API request filters or checks permissions by
+	organization. Lookups are cached twice - on the user object, which lives for one request, and in Django's cache
+	for settings.ORGANIZATION_MEMBERSHIP_CACHE_TIMEOUT seconds, so most requests don't query for memberships at all.
+
+	Changes to a user's groups clear that user's cached memberships, and changes to organizations (or deleting groups)
+	clear everyone's. Django's default in-memory cache is per process, so other processes can use old memberships until
+	their cache times out - configure a shared cache in CACHES to clear them everywhere at once.
+"""
+
+import logging
+
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from Waterspout import settings
+
+log = logging.getLogger("waterspout.memberships")
+
+GENERATION_KEY = "waterspout_membership_generation"
+REQUEST_CACHE_ATTRIBUTE = "_waterspout_organization_ids"
+
+
+def _get_cache_key(user_id):
+	# the generation goes up whenever any organization changes, which retires every user's cached memberships at once
+	generation = cache.get_or_set(GENERATION_KEY, 0, timeout=None)
+	return f"waterspout_organization_ids_{generation}_{user_id}"
+
+
+def get_organization_ids(user):
+	"""
+		The IDs of the organizations the user is a member of
+	:param user: a Django User (or AnonymousUser, who isn't in any)
+	:return: frozenset of Organization IDs
+	"""
+	if not user.is_authenticated:
+		return frozenset()
+
+	organization_ids = getattr(user, REQUEST_CACHE_ATTRIBUTE, None)
+	if organization_ids is None:
+		cache_key = _get_cache_key(user.pk)
+		organization_ids = cache.get(cache_key)
+		if organization_ids is None:
+			organization_ids = frozenset(user.groups.filter(organization__isnull=False).values_list("organization__id", flat=True))
+			cache.set(cache_key, organization_ids, settings.ORGANIZATION_MEMBERSHIP_CACHE_TIMEOUT)
+		setattr(user, REQUEST_CACHE_ATTRIBUTE, organization_ids)
+
+	return organization_ids
+
+
+def is_member(user, organization_id):
+	return organization_id is not None and organization_id in get_organization_ids(user)
+
+
+def forget_users(user_ids):
+	"""
+		Clears the cached memberships for the users
+	"""
+	cache.delete_many([_get_cache_key(user_id) for user_id in user_ids])
+
+
+def forget_all():
+	"""
+		Clears the cached memberships for everyone
+	"""
+	try:
+		cache.incr(GENERATION_KEY)
+	except ValueError:  # no generation yet (or it was evicted) - nothing cached under it can be used anyway
+		cache.set(GENERATION_KEY, 1, timeout=None)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def forget_changed_memberships(sender, instance, action, reverse, pk_set=None, **kwargs):
+	# instance is the user when changing a user's groups, and the group when changing a group's users
+	if not reverse:
+		if action in ("post_add", "post_remove", "post_clear"):
+			instance.__dict__.pop(REQUEST_CACHE_ATTRIBUTE, None)
+			forget_users([instance.pk])
+	elif action in ("post_add", "post_remove"):
+		forget_users(pk_set)
+	elif action == "pre_clear":  # after clearing, we can't tell who was in the group
+		forget_users(instance.user_set.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender="waterspout_api.Organization")
+@receiver(post_delete, sender="waterspout_api.Organization")
+@receiver(pre_delete, sender=Group)
+def forget_organization_memberships(sender, instance, **kwargs):
+	# an organization changed groups, or a group disappeared - we don't know who that affects, so start over
+	forget_all()
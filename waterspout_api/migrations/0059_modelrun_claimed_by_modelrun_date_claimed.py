@@ -0,0 +1,23 @@
+# Generated by Django 4.1.13 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waterspout_api', '0058_alter_result_omegawater'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modelrun',
+            name='claimed_by',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='modelrun',
+            name='date_claimed',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.1.13 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waterspout_api', '0059_modelrun_claimed_by_modelrun_date_claimed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calibrationset',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='inputdataset',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='rainfallset',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='resultset',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
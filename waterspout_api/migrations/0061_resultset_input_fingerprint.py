@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waterspout_api', '0060_recordset_data_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resultset',
+            name='input_fingerprint',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
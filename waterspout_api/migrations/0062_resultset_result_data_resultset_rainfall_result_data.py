@@ -0,0 +1,23 @@
+# Generated by Django 4.1.13 on 2026-10-18 13:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waterspout_api', '0061_resultset_input_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resultset',
+            name='result_data',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='resultset',
+            name='rainfall_result_data',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
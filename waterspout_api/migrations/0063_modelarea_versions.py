@@ -0,0 +1,33 @@
+# Generated by Django 4.1.13 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waterspout_api', '0062_resultset_result_data_resultset_rainfall_result_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modelarea',
+            name='crop_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='modelarea',
+            name='multiplier_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='modelarea',
+            name='region_group_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='modelarea',
+            name='region_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
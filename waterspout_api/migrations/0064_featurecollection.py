@@ -0,0 +1,27 @@
+# Generated by Django 4.1.13 on 2026-10-18 15:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waterspout_api', '0063_modelarea_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeatureCollection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('etag', models.CharField(max_length=64)),
+                ('date_created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('model_area', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feature_collections', to='waterspout_api.modelarea')),
+                ('region_group_set', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='feature_collections', to='waterspout_api.regiongroupset')),
+            ],
+        ),
+    ]
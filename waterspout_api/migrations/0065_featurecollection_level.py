@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waterspout_api', '0064_featurecollection'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='featurecollection',
+            name='level',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.1.13 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waterspout_api', '0065_featurecollection_level'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='regiongroup',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='regiongroup',
+            name='dissolved_geometry',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='regiongroup',
+            name='dissolved_version',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waterspout_api', '0066_regiongroup_dissolved_geometry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modelrun',
+            name='date_modified',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waterspout_api', '0067_modelrun_date_modified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modelarea',
+            name='preferences_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
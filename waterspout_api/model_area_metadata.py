@@ -0,0 +1,63 @@
+"""
+	Keeps the small things we check about a model area over and over - whether its regions support rainfall and
+	irrigation, and its preferences - in memory, so reading them doesn't query the database each time. Model runs
+	check them while they're set up and run, and the API checks preferences for permissions and listings.
+
+	Each model area's metadata is stamped with its region_version and preferences_version, which go up whenever a
+	region or the preferences are saved (including by feature_packages.update_feature_package). Reading the metadata
+	for a model area whose versions don't match the stamp loads it again, so every process picks up changes as soon as
+	it loads the changed model area. The process that makes a change also forgets its copy right away (see forget).
+"""
+
+import logging
+import threading
+import types
+
+log = logging.getLogger("waterspout.model_area_metadata")
+
+
+class ModelAreaMetadata(object):
+
+	def __init__(self, model_area):
+		self.supports_rainfall = model_area.region_set.filter(supports_rainfall=True).exists()
+		self.supports_irrigation = model_area.region_set.filter(supports_irrigation=True).exists()
+
+		# keyed and valued like ModelAreaPreferencesSerializer's output, and read-only, since everyone shares it
+		preferences = model_area.preferences
+		self.preferences = types.MappingProxyType({field.name: getattr(preferences, field.attname)
+		                                           for field in preferences._meta.concrete_fields})
+
+
+_metadata = {}  # model area ID: (stamp, ModelAreaMetadata)
+_metadata_lock = threading.Lock()
+
+
+def _get_stamp(model_area):
+	return model_area.region_version, model_area.preferences_version
+
+
+def get_metadata(model_area):
+	"""
+		Returns the ModelAreaMetadata for the model area, loading it if we don't have it for the model area's versions
+	:param model_area: a ModelArea
+	:return: ModelAreaMetadata
+	"""
+	stamp = _get_stamp(model_area)
+	with _metadata_lock:
+		cached = _metadata.get(model_area.id)
+	if cached is not None and cached[0] == stamp:
+		return cached[1]
+
+	metadata = ModelAreaMetadata(model_area)
+	with _metadata_lock:
+		_metadata[model_area.id] = (stamp, metadata)
+	return metadata
+
+
+def forget(model_area_id):
+	"""
+		Drops this process's copy of the model area's metadata. Instances loaded before a change still carry the old
+		versions, so without this, they'd keep matching the old copy until they're loaded again
+	"""
+	with _metadata_lock:
+		_metadata.pop(model_area_id, None)
@@ -1,23 +1,30 @@
+import datetime
 import logging
 import traceback
-import decimal
 import json
+import hashlib
 
 import numpy
 
 import django
 from django.db import models  # we're going to geodjango this one - might not need it, but could make some things nicer
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Q, Avg, OuterRef, Subquery
 from django.contrib.auth.models import Group
 from django.contrib.auth import get_user_model
 User = get_user_model()  # define user by this method rather than direct import - safer for the future
 
 from guardian.shortcuts import assign_perm
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
 
 
 from Waterspout import settings
+from waterspout_api import notifications
+from waterspout_api import memberships
+from waterspout_api import data_cache
+from waterspout_api import columnar
+from waterspout_api import model_area_metadata
 
 import pandas
 from Dapper import scenarios, get_version as get_dapper_version, worst_case
@@ -25,6 +32,21 @@ from Dapper import scenarios, get_version as get_dapper_version, worst_case
 log = logging.getLogger("waterspout.models")
 
 
+def save_without_version_fields(instance, version_fields, save, *args, **kwargs):
+	"""
+		Saves an existing instance without writing its version fields, which only change through F() updates in
+		signal receivers. Otherwise saving a copy loaded before a version went up would put the old version back.
+	:param instance: the model instance being saved
+	:param version_fields: names of the fields to leave alone
+	:param save: the parent class's save method to call
+	:return:
+	"""
+	if not instance._state.adding and kwargs.get("update_fields") is None and not kwargs.get("force_insert"):
+		kwargs["update_fields"] = [field.name for field in instance._meta.concrete_fields
+		                           if not field.primary_key and field.name not in version_fields]
+	return save(*args, **kwargs)
+
+
 class SimpleJSONField(models.TextField):
 	"""
 		converts dicts to JSON strings on save and converts JSON to dicts
@@ -92,7 +114,7 @@ class Organization(models.Model):
 	group = models.OneToOneField(Group, on_delete=models.DO_NOTHING, null=True, blank=True)
 
 	def has_member(self, user):
-		return self.group in user.groups.all()  # True if this group is in that set, otherwise, False
+		return memberships.is_member(user, self.id)  # cached, so checking again is cheap
 
 	def add_member(self, user):
 		self.group.user_set.add(user)
@@ -146,9 +168,41 @@ class ModelArea(models.Model):
 	# override any custom settings to the model area preferences
 	feature_package_name = models.CharField(max_length=100, default="DEFAULT")
 
+	# these go up whenever the crops, regions, region groups, employment multipliers, or preferences of the model area
+	# change (see bump_model_area_version) so that clients and caches can tell when they need new copies
+	crop_version = models.PositiveIntegerField(default=0)
+	region_version = models.PositiveIntegerField(default=0)
+	region_group_version = models.PositiveIntegerField(default=0)
+	multiplier_version = models.PositiveIntegerField(default=0)
+	preferences_version = models.PositiveIntegerField(default=0)
+	version_fields = ("crop_version", "region_version", "region_group_version", "multiplier_version", "preferences_version")
+
 	def __str__(self):
 		return self.name
 
+	def save(self, *args, **kwargs):
+		return save_without_version_fields(self, self.version_fields, super().save, *args, **kwargs)
+
+	def get_resource_versions(self):
+		"""
+			Returns a version hash for each of the large pieces of data the model area detail view includes, keyed
+			by the same names. A hash only changes when that piece of data changes, so clients can keep what they
+			have for everything else.
+		:return: dict of resource name to version hash
+		"""
+		versions = {
+			"calibration_data": list(self.calibration_data.order_by("id").values_list("id", "data_version")),
+			"rainfall_data": list(self.rainfall_data.order_by("id").values_list("id", "data_version")),
+			"input_data": list(self.input_data.order_by("id").values_list("id", "data_version")),
+			"crop_set": self.crop_version,
+			"region_set": self.region_version,
+			"region_group_sets": [self.region_group_version, self.region_version],  # groups list their regions
+			"multipliers_raw": [self.multiplier_version, self.crop_version, self.region_version],
+		}
+
+		return {name: hashlib.sha1(json.dumps([self.id, name, version]).encode("utf-8")).hexdigest()[:20]
+		        for name, version in versions.items()}
+
 	@property
 	def model_defaults(self):
 		# Just making it a dict so that it comes out of the serializer grouped
@@ -173,12 +227,20 @@ class ModelArea(models.Model):
 	#def elasticities_as_dict(self):
 	#	return {item.crop.crop_code: float(item.value) for item in self.elasticities}
 
+	# these three are cached in memory for each version of the model area's regions and preferences - see model_area_metadata
 	@property
 	def supports_rainfall(self):
-		return self.region_set.filter(supports_rainfall=True).exists()
+		return model_area_metadata.get_metadata(self).supports_rainfall
 	@property
 	def supports_irrigation(self):
-		return self.region_set.filter(supports_irrigation=True).exists()
+		return model_area_metadata.get_metadata(self).supports_irrigation
+
+	@property
+	def preference_values(self):
+		"""
+			Read-only mapping of the model area's preferences (field name: value). Use self.preferences to change them
+		"""
+		return model_area_metadata.get_metadata(self).preferences
 
 	@property
 	def background_code(self):
@@ -342,11 +404,47 @@ class RegionGroup(models.Model):
 
 	geometry = models.JSONField(null=True, blank=True)  # this will just store GeoJSON and then we'll combine into collections manually
 
+	# goes up whenever the group's regions, or their geometry, change (see the signal receivers below)
+	version = models.PositiveIntegerField(default=0)
+	# the outline of the group's regions, for groups without their own geometry (like null groups) - built by
+	# feature_collections.dissolve_region_groups, and only current while dissolved_version matches version
+	dissolved_geometry = models.JSONField(null=True, blank=True)
+	dissolved_version = models.PositiveIntegerField(null=True, blank=True)
+
 	serializer_fields = ["id", "name", "regions", "geometry"]
 
 	def __str__(self):
 		return f"Region Group {self.group_set.model_area.name}/{self.group_set.name}/{self.name}"
 
+	def save(self, *args, **kwargs):
+		return save_without_version_fields(self, ("version", "dissolved_geometry", "dissolved_version"), super().save, *args, **kwargs)
+
+
+class FeatureCollection(models.Model):
+	"""
+		A GeoJSON FeatureCollection of all the regions in a model area (when region_group_set is empty) or of all the
+		groups in a region group set, already encoded and gzip-compressed so that we can send it without touching
+		the JSON encoder. See feature_collections.py for building them.
+	"""
+	model_area = models.ForeignKey(ModelArea, on_delete=models.CASCADE, related_name="feature_collections")
+	region_group_set = models.ForeignKey(RegionGroupSet, null=True, blank=True, on_delete=models.CASCADE, related_name="feature_collections")
+
+	# the model area's region_version (or region_group_version for group sets) that this was built from - when it
+	# doesn't match anymore, we rebuild it
+	version = models.PositiveIntegerField()
+	# the level of detail (index into settings.GEOMETRY_SIMPLIFICATION_TOLERANCES) for simplified, quantized
+	# versions of the geometry (see geometry.py), or empty for the full resolution GeoJSON
+	level = models.PositiveSmallIntegerField(null=True, blank=True)
+	data = models.BinaryField()  # gzip-compressed GeoJSON
+	etag = models.CharField(max_length=64)  # hash of the uncompressed GeoJSON
+	date_created = models.DateTimeField(default=django.utils.timezone.now)
+
+	def __str__(self):
+		detail = "" if self.level is None else f" (level of detail {self.level})"
+		if self.region_group_set is None:
+			return f"Region Feature Collection for {self.model_area.name}{detail}"
+		return f"Region Group Feature Collection for {self.region_group_set}{detail}"
+
 
 class Crop(models.Model):
 	"""
@@ -403,6 +501,33 @@ class RecordSet(models.Model):
 	years = models.TextField()  # yes, text. We'll concatenate text as a year lookup
 	# prices = model
 
+	# goes up whenever records in the set change - lets us cache data built from the set, keyed by this version
+	data_version = models.PositiveIntegerField(default=0)
+
+	def save(self, *args, **kwargs):
+		return save_without_version_fields(self, ("data_version",), super().save, *args, **kwargs)
+
+	def bump_data_version(self):
+		"""
+			Marks the records in this set as changed so that anything cached for the old version isn't used again
+		"""
+		type(self).objects.filter(pk=self.pk).update(data_version=models.F("data_version") + 1)
+		self.refresh_from_db(fields=["data_version"])
+
+	def as_cached_data_frame(self, exclude_regions=None):
+		"""
+			Same output as as_data_frame, but the full data frame for the set comes from a cache when we can, and
+			then we drop any excluded regions from it
+		:param exclude_regions: list of region internal ids - regions in this list will not have their data
+					included in the output data frame
+		:return:
+		"""
+		df = data_cache.get_record_set_data_frame(self)
+		if exclude_regions and len(df) > 0:
+			df = df[~df["g"].isin(exclude_regions)].reset_index(drop=True)
+
+		return self.attach_set(df)
+
 	def as_data_frame(self, exclude_regions=None):
 		"""
 			Returns the data frame that needs to be run through the model itself
@@ -410,40 +535,56 @@ class RecordSet(models.Model):
 						included in the output data frame
 		:return:
 		"""
-		# .values() makes a queryset into an iterable of dicts. Coerce that to a list of dicts
-		# and pass it to the pandas constructor.
-		# Django has a handy method to transform a queryset into a list of dicts,
-		# but we can't really use it because we need to retrieve foreign keys, and it
-		# can only retrieve either bare attributes or the ones we specify, so we'd
-		# need to either hardcode everything or run it twice and merge it. Easier
-		# to write our own, unfortunately. It's quite a bit slower than the Django though
-		# so maybe we can speed it up somehow. Maybe doing it as a raw SQL query and then
-		# dropping any excess fields would be better. Going to leave that for another
-		# day right now.
+		return self.attach_set(self.build_data_frame(exclude_regions=exclude_regions))
+
+	def build_data_frame(self, exclude_regions=None):
+		"""
+			Builds the data for as_data_frame, except that the column for the records' set holds the set's ID instead
+			of the set itself (see attach_set), so the data frame cache can store it on disk
+		:param exclude_regions: list of region internal ids - regions in this list will not have their data
+					included in the output data frame
+		:return:
+		"""
+		# We pull everything in one query with .values_list(), joining in the crop code and region internal ID we
+		# need instead of the foreign keys, then build the data frame column by column. Decimal fields come out
+		# of the database as Decimal objects, so we convert those columns to floats all at once at the end.
 
 		foreign_keys = ["region", "crop", "rainfall_set"]
 
 		record_model = globals()[self.record_model_name]
 		fields = [f.name for f in record_model._meta.get_fields()]  # get all the fields for calibrated parameters
 		basic_fields = list(set(fields) - set(foreign_keys))  # remove the foreign keys - we'll process those separately
+		decimal_fields = [f.name for f in record_model._meta.get_fields() if isinstance(f, models.DecimalField)]
 
 		# reverse_name will exist for subclasses
 		data = getattr(self, self.reverse_name).all()  # get all the records for this set
-		output = []
-		for record in data:
-			# if we were told to skip this region, don't add it - could also do this in pandas after conversion
-			if exclude_regions and record.region.internal_id in exclude_regions:
-				continue
-
-			output_dict = {}
-			for field in basic_fields:  # apply the basic fields directly into a dictionary and coerce to floats
-				field_value = getattr(record, field)
-				output_dict[field] = float(field_value) if type(field_value) is decimal.Decimal else field_value
-			output_dict["i"] = record.crop.crop_code  # but then grab the specific attributes of the foreign keys we wawnt
-			output_dict["g"] = record.region.internal_id
-			output.append(output_dict)  # put the dict into the list so we can make a DF of it
-
-		return pandas.DataFrame(output)  # construct a data frame and send it back
+		if exclude_regions:  # if we were told to skip these regions, leave them out of the query entirely
+			data = data.exclude(region__internal_id__in=exclude_regions)
+
+		columns = basic_fields + ["i", "g"]
+		# grab the specific attributes of the foreign keys we want, rather than the foreign keys themselves
+		rows = list(data.values_list(*basic_fields, "crop__crop_code", "region__internal_id"))
+		if len(rows) == 0:
+			return pandas.DataFrame()  # same as before - an empty data frame, without any columns
+
+		df = pandas.DataFrame.from_records(rows, columns=columns)
+		for field in decimal_fields:
+			# a column with no values at all stays as Nones, like it was when we built this record by record
+			if field in df.columns and df[field].notna().any():
+				df[field] = df[field].astype("float64")
+
+		return df
+
+	def attach_set(self, df):
+		"""
+			Puts this set back in the column for the records' set, in place of its ID, like the data frame had when
+			we built it record by record. Returns a new data frame
+		"""
+		record_model = globals()[self.record_model_name]
+		for field in record_model._meta.concrete_fields:
+			if field.is_relation and field.related_model is type(self) and field.name in df.columns:
+				df = df.assign(**{field.name: pandas.Series([self] * len(df), index=df.index, dtype=object)})
+		return df
 
 	def to_csv(self, *args, **kwargs):
 		"""
@@ -515,9 +656,52 @@ class ResultSet(RecordSet):
 	infeasibilities_text = models.TextField(null=True, blank=True)
 	# infeasibilities reverse relation
 
+	# hash of the model run inputs that produced these results - see ModelRun.get_input_fingerprint. Lets us reuse
+	# the results for other model runs with the same inputs. Empty for results that aren't fully loaded yet
+	input_fingerprint = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+
+	# the results as compressed columns (see columnar.py) instead of Result and RainfallResult rows - depending
+	# on settings.RESULT_STORAGE, we store results here, as rows, or both. Both are empty for result sets with no results
+	result_data = models.BinaryField(null=True, blank=True)
+	rainfall_result_data = models.BinaryField(null=True, blank=True)
+
+	# which field holds the columnar version of each record model's results
+	columnar_fields = {
+		"Result": "result_data",
+		"RainfallResult": "rainfall_result_data",
+	}
+
 	def __str__(self):
 		return f"Results for Model Run {self.model_run.name} from Dapper {self.dapper_version} at {self.date_run}"
 
+	def get_columnar_frame(self, record_model_name="Result"):
+		"""
+			Returns the stored columns for a record model's results as a data frame - including the crop and region
+			IDs (as "crop" and "region") along with the crop code and region internal ID (as "i" and "g"). Returns None
+			if the results weren't stored as columns.
+		:param record_model_name: "Result" or "RainfallResult"
+		:return: pandas DataFrame or None
+		"""
+		data = getattr(self, self.columnar_fields[record_model_name])
+		if data is None:
+			return None
+		return columnar.from_bytes(data)
+
+	def as_data_frame(self, exclude_regions=None):
+		"""
+			Reads the stored columns when we have them, otherwise builds the data frame from the Result records. The
+			columnar version doesn't include the database-only id and result_set columns.
+		"""
+		df = self.get_columnar_frame("Result")
+		if df is None:
+			return super().as_data_frame(exclude_regions=exclude_regions)
+
+		df = df.drop(columns=["crop", "region"])
+		if exclude_regions:
+			df = df[~df["g"].isin(exclude_regions)].reset_index(drop=True)
+
+		return df
+
 
 class ModelItem(models.Model):
 	"""
@@ -632,6 +816,97 @@ class RainfallParameter(ModelItem):
 	coef_crop = models.DecimalField(max_digits=10, decimal_places=5)
 
 
+# which field on each record model points to the set it belongs to
+_record_set_field_names = {
+	InputDataItem: "dataset",
+	CalibratedParameter: "calibration_set",
+	RainfallParameter: "rainfall_set",
+}
+
+
+@receiver(post_save, sender=InputDataItem)
+@receiver(post_delete, sender=InputDataItem)
+@receiver(post_save, sender=CalibratedParameter)
+@receiver(post_delete, sender=CalibratedParameter)
+@receiver(post_save, sender=RainfallParameter)
+@receiver(post_delete, sender=RainfallParameter)
+def bump_record_set_data_version(sender, instance, **kwargs):
+	# anything cached from the set these records belong to is out of date now. Bulk operations (bulk_create,
+	# .update()) don't send these signals, so code using them should call bump_data_version on the set itself
+	set_field = sender._meta.get_field(_record_set_field_names[sender])
+	set_field.related_model.objects.filter(pk=getattr(instance, set_field.attname))\
+		.update(data_version=models.F("data_version") + 1)
+
+
+# which ModelArea version goes up when each model changes, and how to find the model area from an instance - a lookup
+# from ModelArea and the attribute on the instance to match. We stick to IDs so that this still works while cascading
+# deletes have already removed related objects
+_model_area_versions = {
+	Crop: ("crop_version", "pk", "model_area_id"),
+	Region: ("region_version", "pk", "model_area_id"),
+	ModelAreaPreferences: ("preferences_version", "pk", "model_area_id"),
+	RegionGroupSet: ("region_group_version", "pk", "model_area_id"),
+	RegionGroup: ("region_group_version", "region_group_sets", "group_set_id"),
+	EmploymentMultipliers: ("multiplier_version", "region", "region_id"),
+}
+
+
+@receiver(post_save, sender=Crop)
+@receiver(post_delete, sender=Crop)
+@receiver(post_save, sender=Region)
+@receiver(post_delete, sender=Region)
+@receiver(post_save, sender=RegionGroupSet)
+@receiver(post_delete, sender=RegionGroupSet)
+@receiver(post_save, sender=RegionGroup)
+@receiver(post_delete, sender=RegionGroup)
+@receiver(post_save, sender=EmploymentMultipliers)
+@receiver(post_delete, sender=EmploymentMultipliers)
+@receiver(post_save, sender=ModelAreaPreferences)
+def bump_model_area_version(sender, instance, **kwargs):
+	# like bump_record_set_data_version - bulk operations don't send these signals, so code using them needs to
+	# update the version itself
+	version_field, lookup, attname = _model_area_versions[sender]
+	ModelArea.objects.filter(**{lookup: getattr(instance, attname)})\
+		.update(**{version_field: models.F(version_field) + 1})
+
+
+@receiver(post_save, sender=Region)
+@receiver(post_delete, sender=Region)
+@receiver(post_save, sender=ModelAreaPreferences)
+def forget_model_area_metadata(sender, instance, **kwargs):
+	# the new versions above retire the cached metadata everywhere - this also covers model areas already loaded here
+	model_area_metadata.forget(instance.model_area_id)
+
+
+@receiver(m2m_changed, sender=RegionGroup.regions.through)
+def bump_model_area_version_for_group_membership(sender, instance, action, pk_set=None, **kwargs):
+	# instance is the group when changing a group's regions, and the region when changing a region's groups
+	bump_group_version = {"version": models.F("version") + 1}
+	if isinstance(instance, RegionGroup):
+		if action in ("post_add", "post_remove", "post_clear"):
+			RegionGroup.objects.filter(pk=instance.pk).update(**bump_group_version)
+	elif action in ("post_add", "post_remove"):
+		RegionGroup.objects.filter(pk__in=pk_set).update(**bump_group_version)
+	elif action == "pre_clear":  # after clearing, we can't tell which groups the region was in
+		RegionGroup.objects.filter(regions=instance).update(**bump_group_version)
+
+	if action not in ("post_add", "post_remove", "post_clear"):
+		return
+	if isinstance(instance, RegionGroup):
+		model_areas = ModelArea.objects.filter(region_group_sets=instance.group_set_id)
+	else:
+		model_areas = ModelArea.objects.filter(pk=instance.model_area_id)
+	model_areas.update(region_group_version=models.F("region_group_version") + 1)
+
+
+@receiver(post_save, sender=Region)
+@receiver(pre_delete, sender=Region)
+def bump_region_group_versions(sender, instance, **kwargs):
+	# the outlines of the region's groups may have changed with it - and so have the groups' FeatureCollections
+	if RegionGroup.objects.filter(regions=instance).update(version=models.F("version") + 1) > 0:
+		ModelArea.objects.filter(pk=instance.model_area_id).update(region_group_version=models.F("region_group_version") + 1)
+
+
 class Result(ModelItem):
 	"""
 		Holds the results for a single region/crop
@@ -672,11 +947,127 @@ class RainfallResult(models.Model):
 	xwatersc = models.DecimalField(max_digits=18, decimal_places=10, null=True, blank=True)
 
 
+class ModelRunQuerySet(models.QuerySet):
+
+	# (related name, field) for each modification average in ModelRun.serializer_fields
+	MODIFICATION_AVERAGES = (
+		("region_modifications", "land_proportion"),
+		("region_modifications", "water_proportion"),
+		("crop_modifications", "price_proportion"),
+		("crop_modifications", "yield_proportion"),
+	)
+
+	def with_listing_data(self):
+		"""
+			Gets everything the model run listings serialize in a fixed number of queries, no matter how many model
+			runs there are - the modification averages as annotations (computed in the database, one subquery each),
+			and the modifications themselves prefetched
+		"""
+		annotations = {}
+		for related_name, field in self.MODIFICATION_AVERAGES:
+			modification_model = self.model._meta.get_field(related_name).related_model
+			averages = modification_model.objects.filter(model_run=OuterRef("pk")).order_by()\
+				.values("model_run").annotate(average=Avg(field)).values("average")
+			annotations[f"average_{field}"] = Subquery(averages, output_field=models.FloatField())
+
+		return self.annotate(**annotations).prefetch_related("region_modifications", "crop_modifications")
+
+	def waiting(self):
+		"""
+			Model runs that are ready to run, but that nobody is running or has completed yet
+		"""
+		return self.filter(ready=True, running=False, complete=False)
+
+	def claim_next(self, worker_id, candidate_ids=None):
+		"""
+			Claims a waiting model run for the worker and marks it as running. Safe to call from many processes or
+			hosts against the same database - a run is only ever handed to one of them.
+		:param worker_id: string identifying the worker. It's stored on the model run so we can see who's running it
+		:param candidate_ids: optional ordered iterable of model run IDs to try to claim, in order. If not provided,
+				we claim the oldest waiting run
+		:return: the claimed ModelRun, or None if there's nothing left to claim
+		"""
+		if candidate_ids is None:
+			if self._supports_skip_locked():
+				return self._claim_with_row_lock(worker_id, self.waiting().order_by("date_submitted"))
+			candidate_ids = self.waiting().order_by("date_submitted").values_list("id", flat=True)
+
+		for run_id in candidate_ids:
+			if self._supports_skip_locked():
+				run = self._claim_with_row_lock(worker_id, self.waiting().filter(id=run_id))
+			else:
+				run = self._claim_with_conditional_update(worker_id, run_id)
+
+			if run is not None:
+				return run
+
+		return None
+
+	def release_claims(self, worker_id):
+		"""
+			Puts any incomplete runs claimed by the worker back in the queue - used when a worker dies mid-run
+		:param worker_id: the same ID the worker used when claiming runs
+		:return: the number of runs released
+		"""
+		released = self.filter(claimed_by=worker_id, running=True, complete=False)\
+			.update(running=False, claimed_by=None, date_modified=django.utils.timezone.now())
+		if released:
+			notifications.notify_runs_waiting(using=self.db)
+		return released
+
+	def release_stale_claims(self, max_age):
+		"""
+			Puts any incomplete runs that were claimed more than max_age seconds ago back in the queue. Their worker
+			was most likely killed (or its host went down) before it could release them with release_claims
+		:param max_age: seconds - should be longer than any model run takes to solve, or we'll release runs that
+				are still going
+		:return: the number of runs released
+		"""
+		now = django.utils.timezone.now()
+		released = self.filter(running=True, complete=False, date_claimed__lt=now - datetime.timedelta(seconds=max_age))\
+			.update(running=False, claimed_by=None, date_modified=now)
+		if released:
+			notifications.notify_runs_waiting(using=self.db)
+		return released
+
+	def _supports_skip_locked(self):
+		return django.db.connections[self.db].features.has_select_for_update_skip_locked
+
+	def _claim_with_row_lock(self, worker_id, queryset):
+		# Postgres (and others that support it) - lock the row, skipping any rows another worker has locked already,
+		# so workers never wait on each other and never get the same run
+		with transaction.atomic(using=self.db):
+			run = queryset.select_for_update(skip_locked=True).first()
+			if run is None:
+				return None
+
+			run.running = True
+			run.claimed_by = worker_id
+			run.date_claimed = django.utils.timezone.now()
+			run.save(update_fields=["running", "claimed_by", "date_claimed", "date_modified"])
+		return run
+
+	def _claim_with_conditional_update(self, worker_id, run_id):
+		# SQLite doesn't have row locks, but it does serialize writes, so an UPDATE that only matches while the
+		# run is still waiting changes exactly one row for exactly one worker
+		with transaction.atomic(using=self.db):
+			now = django.utils.timezone.now()
+			claimed = self.waiting().filter(id=run_id).update(running=True,
+			                                                  claimed_by=worker_id,
+			                                                  date_claimed=now,
+			                                                  date_modified=now)
+			if claimed == 0:
+				return None
+			return self.get(id=run_id)
+
+
 class ModelRun(models.Model):
 	"""
 		The central object for configuring an individual run of the model - is related to modification objects from the
 		modification side.
 	"""
+	objects = ModelRunQuerySet.as_manager()
+
 	class Meta:
 		indexes = [
 			models.Index(fields=("ready", "running", "complete")),
@@ -694,6 +1085,13 @@ class ModelRun(models.Model):
 	log_data = models.TextField(null=True, blank=True)  # we'll store log outputs from the model run here.
 	date_submitted = models.DateTimeField(default=django.utils.timezone.now, null=True, blank=True)
 	date_completed = models.DateTimeField(null=True, blank=True)
+	# set on every save, so clients can ask for only the model runs that changed (?changed_since=) - code that
+	# changes model runs with .update() needs to set it too
+	date_modified = models.DateTimeField(auto_now=True, db_index=True)
+
+	# which run processor worker claimed this run and when - see ModelRun.objects.claim_next
+	claimed_by = models.CharField(max_length=255, null=True, blank=True)
+	date_claimed = models.DateTimeField(null=True, blank=True)
 
 	# which model run is the base, unmodified version? Useful for data viz
 	base_model_run = models.ForeignKey("ModelRun", null=True, blank=True, on_delete=models.DO_NOTHING)
@@ -714,7 +1112,7 @@ class ModelRun(models.Model):
 	# crop_modifications - back-reference from related content
 
 	serializer_fields = ['id', 'name', 'description', 'ready', 'running', 'complete', 'status_message',
-		                'date_submitted', 'date_completed', "calibration_set", "rainfall_set",
+		                'date_submitted', 'date_completed', 'date_modified', "calibration_set", "rainfall_set",
 						 "user_id", "organization", "base_model_run_id", "is_base",
 	                     "land_modifications_average", "water_modifications_average",
 	                     "price_modifications_average", "yield_modifications_average"]
@@ -730,6 +1128,11 @@ class ModelRun(models.Model):
 		return json.dumps(self.as_dict(), cls=django.core.serializers.json.DjangoJSONEncoder)
 
 	def _get_modification_average(self, queryset_name, property_name):
+		# model runs from ModelRun.objects.with_listing_data() come with the averages already - None means no modifications
+		if hasattr(self, f"average_{property_name}"):
+			average = getattr(self, f"average_{property_name}")
+			return 0 if average is None else average
+
 		mods = list(getattr(self, queryset_name).all())
 		num_items = len(mods)
 		if num_items == 0:
@@ -783,7 +1186,7 @@ class ModelRun(models.Model):
 		exclude_ids = self.get_regions_for_behaviors([Region.FIXED, Region.REMOVED])
 
 		# pull initial calibration dataset as it is
-		df = base_model.as_data_frame(exclude_regions=exclude_ids)
+		df = base_model.as_cached_data_frame(exclude_regions=exclude_ids)
 
 		# do any overrides or changes from the modifications
 
@@ -813,7 +1216,7 @@ class ModelRun(models.Model):
 		else:
 			ids = []
 
-		if self.calibration_set.model_area.preferences.use_default_region_behaviors:
+		if self.calibration_set.model_area.preference_values["use_default_region_behaviors"]:
 			# figure out which regions didn't have modifications in the current model run - we'll pull the defaults for these
 			regions_to_use_defaults_from = self.calibration_set.model_area.region_set.filter(default_behavior_includes)\
 				.difference(Region.objects.filter(modifications__in=self.region_modifications.filter(region__isnull=False, region_group__isnull=True)))
@@ -939,6 +1342,19 @@ class ModelRun(models.Model):
 			# need to do this first - it modifies the set of modifications, which in turn modifies the scenario_df we pull because of region behaviors
 			self.convert_region_group_modifications()
 
+			# if we've already solved a model run with exactly the same inputs, copy its results instead of solving
+			# again. Skip it if we were asked for CSV outputs though - those are for checking the solver itself
+			fingerprint = None
+			if settings.MEMOIZE_MODEL_RUN_RESULTS and csv_output is None and worst_case_csv_output is None:
+				fingerprint = self.get_input_fingerprint()
+				existing_result_set = ResultSet.objects.filter(input_fingerprint=fingerprint).order_by('-date_run').first()
+				if existing_result_set is not None:
+					log.info(f"Model run {self.id} has the same inputs as result set {existing_result_set.id} - copying its results")
+					self.copy_results(existing_result_set)
+					self.complete = True
+					log.info("Model run complete")
+					return
+
 			scenario_runner = scenarios.Scenario(calibration_df=self.scenario_df, rainfall_df=self.rainfall_df)
 			self.attach_modifications(scenario=scenario_runner)
 			results = scenario_runner.run()
@@ -961,8 +1377,15 @@ class ModelRun(models.Model):
 			result_set = self.load_records(results_df=results, rainfall_df=scenario_runner.rainfall_df)
 			self.load_infeasibilities(scenario_runner, result_set)
 
+			# only mark the results with the fingerprint once they're fully loaded so we never copy partial results
+			if fingerprint is not None:
+				result_set.input_fingerprint = fingerprint
+				result_set.save(update_fields=["input_fingerprint"])
+
 			self.complete = True
 			log.info("Model run complete")
+		except (KeyboardInterrupt, SystemExit):  # the run processor is shutting down - leave the run ready so it runs again
+			raise
 		except:
 			self.ready = False  # if we hit an exception, mark it as not ready to run - someone will need to make a fix before it can be run - this ensures we don't run into infinite loops trying to run the same items over and over
 			log.error(traceback.format_exc())
@@ -970,6 +1393,82 @@ class ModelRun(models.Model):
 			self.running = False
 			self.save()
 
+	def get_input_fingerprint(self):
+		"""
+			Returns a hash of everything that determines this model run's results - the calibration and rainfall data
+			(by their data versions), the region and crop modifications, which regions are removed, fixed, or linear
+			scaled, which regions support irrigation and rainfall, and the Dapper version. Two model runs with the
+			same fingerprint get the same results.
+
+			Run convert_region_group_modifications first - we hash the region modifications after group settings
+			have been applied to each region, so a group setting and the same setting made region by region match.
+		:return: hex string of a SHA-256 hash
+		"""
+		model_area = self.calibration_set.model_area
+
+		# group modifications were already applied to individual regions, so leave them out
+		region_modifications = self.region_modifications.filter(region_group__isnull=True).select_related("region")
+		crop_modifications = self.crop_modifications.select_related("crop", "region")
+
+		inputs = {
+			"dapper_version": get_dapper_version(),
+			"calibration_set": [self.calibration_set.id, self.calibration_set.data_version],
+			"rainfall_set": [self.rainfall_set.id, self.rainfall_set.data_version] if self.rainfall_set else None,
+			"supports": [model_area.supports_irrigation, model_area.supports_rainfall],
+			# attach_modifications only applies water and rainfall modifications to regions that support them
+			"region_supports": [list(region) for region in model_area.region_set.order_by("internal_id")
+			                    .values_list("internal_id", "supports_irrigation", "supports_rainfall")],
+			# sort each item's JSON so that the order the modifications were created in doesn't matter
+			"region_modifications": sorted(json.dumps([
+				mod.region.internal_id if mod.region else None,
+				mod.land_proportion,
+				mod.water_proportion,
+				mod.rainfall_proportion,
+				mod.modeled_type,
+			]) for mod in region_modifications),
+			"crop_modifications": sorted(json.dumps([
+				mod.crop.crop_code if mod.crop else None,
+				mod.region.internal_id if mod.region else None,
+				mod.price_proportion,
+				mod.yield_proportion,
+				mod.min_land_area_proportion,
+				mod.max_land_area_proportion,
+			]) for mod in crop_modifications),
+			"excluded_regions": sorted(self.get_regions_for_behaviors([Region.FIXED, Region.REMOVED])),
+			"linear_scaled_regions": sorted(self.get_regions_for_behaviors([Region.LINEAR_SCALED, ])),
+		}
+
+		return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode("utf-8")).hexdigest()
+
+	def copy_results(self, source_result_set):
+		"""
+			Copies the results (including rainfall results and infeasibilities) from another result set into a new
+			result set for this model run, in a single transaction. Copies both the columnar results and any records.
+		:param source_result_set: the ResultSet to copy from
+		:return: the new ResultSet
+		"""
+		with transaction.atomic():
+			result_set = ResultSet.objects.create(model_run=self,
+			                                      years=source_result_set.years,
+			                                      dapper_version=source_result_set.dapper_version,
+			                                      in_calibration=source_result_set.in_calibration,
+			                                      infeasibilities_text=source_result_set.infeasibilities_text,
+			                                      input_fingerprint=source_result_set.input_fingerprint,
+			                                      result_data=source_result_set.result_data,
+			                                      rainfall_result_data=source_result_set.rainfall_result_data)
+
+			for relation, record_model in (("result_set", Result),
+			                               ("rainfall_result_set", RainfallResult),
+			                               ("infeasibilities", Infeasibility)):
+				records = []
+				for record in getattr(source_result_set, relation).all().iterator():
+					record.pk = None  # saves as a new record
+					record.result_set = result_set
+					records.append(record)
+				record_model.objects.bulk_create(records, batch_size=settings.RESULT_LOAD_BATCH_SIZE)
+
+		return result_set
+
 	def add_worst_case_and_linear_scaled_values(self, results):
 		results = worst_case.default_worst_case_scaling_function(results)
 
@@ -1005,32 +1504,95 @@ class ModelRun(models.Model):
 
 		return result_set
 
-	def _load_df(self, results_df, result_set, record_model=Result):
-		try:
-			for record in results_df.itertuples():
-				# get the first tuple's fields, then exit the loop
-				# this should be faster than retrieving it every time in the next loop, but we need to do it once
-				fields = list(set(record._fields) - set(["id", "g", "i", "calibration_set"]))
-				break
-
-			for record in results_df.itertuples():  # returns named tuples
-				result = record_model(result_set=result_set)
-				result.crop = Crop.objects.get(crop_code=record.i, model_area=self.calibration_set.model_area)
-				result.region = Region.objects.get(internal_id=record.g, model_area=self.calibration_set.model_area)
-				for column in fields:  # _fields isn't private - it's just preventing conflicts - see namedtuple docs
-					value = getattr(record, column)
-
-					if value is not None and type(value) is not str and numpy.isnan(value):  # if we got NaN (such as with an infeasibility) - filter out None values because they make numpy.isnan fail
-						value = None  # then we need to skip it or it'll bork the whole table (seriously)
+	def _load_df(self, results_df, result_set, record_model=Result, batch_size=None):
+		"""
+			Loads a data frame of results as record_model results attached to result_set. We look up the IDs for
+			every crop and region in the model area once, then store the results as compressed columns on the
+			result set, as record_model records, or both, depending on settings.RESULT_STORAGE. Records get
+			inserted in batches in a single transaction, rather than querying and saving one row at a time.
+		:param results_df: data frame with "g" and "i" columns for the region internal ID and crop code
+		:param result_set: the ResultSet the records belong to
+		:param record_model: Result or RainfallResult
+		:param batch_size: how many records to insert per query. Defaults to settings.RESULT_LOAD_BATCH_SIZE
+		:return:
+		"""
+		if batch_size is None:
+			batch_size = settings.RESULT_LOAD_BATCH_SIZE
 
-					setattr(result, column, value)
+		if len(results_df) == 0:  # nothing to load - and an empty frame might not even have the columns we look for
+			return result_set
 
-				if hasattr(result, "net_revenue_flag") and (not result.net_revenue_flag or result.net_revenue_flag < 0):  # if any record has negative net revenues, we're out of bounds on calibration - mark it
+		try:
+			model_area = self.calibration_set.model_area
+			crop_ids = dict(Crop.objects.filter(model_area=model_area).values_list("crop_code", "id"))
+			region_ids = dict(Region.objects.filter(model_area=model_area).values_list("internal_id", "id"))
+
+			# codes are stored as text, but results read from CSVs can come in as numbers, so match on text
+			crop_codes = results_df["i"].astype(str)
+			region_codes = results_df["g"].astype(str)
+			crops = crop_codes.map(crop_ids)
+			regions = region_codes.map(region_ids)
+			if crops.isna().any():
+				raise Crop.DoesNotExist(f"Crops {list(results_df['i'][crops.isna()].unique())} aren't in model area {model_area}")
+			if regions.isna().any():
+				raise Region.DoesNotExist(f"Regions {list(results_df['g'][regions.isna()].unique())} aren't in model area {model_area}")
+
+			# only keep the columns we have fields for - the results include some columns we don't store
+			fields = [field for field in record_model._meta.concrete_fields if not field.is_relation and field.name != "id"]
+			fields = [field for field in fields if field.name in results_df.columns]
+
+			if "net_revenue_flag" in [field.name for field in record_model._meta.concrete_fields]:
+				# if any record has negative (or missing) net revenues, we're out of bounds on calibration - mark it
+				if "net_revenue_flag" in results_df.columns:
+					net_revenue_flag = pandas.to_numeric(results_df["net_revenue_flag"], errors="coerce")
+					if (net_revenue_flag.isna() | (net_revenue_flag <= 0)).any():
+						result_set.in_calibration = False
+				else:
 					result_set.in_calibration = False
 
-				result.save()
+			if settings.RESULT_STORAGE in ("records", "both"):
+				# check the columns the records can't store as null here, rather than getting an IntegrityError from
+				# partway through inserting them
+				for field in record_model._meta.concrete_fields:
+					if field.null or field.is_relation or field.name == "id":
+						continue
+					if field.name in results_df.columns and results_df[field.name].isna().any():
+						raise ValueError(f"Column {field.name} has missing values, but {record_model.__name__}.{field.name} can't be null")
+					if field.name not in results_df.columns and not field.has_default():
+						raise ValueError(f"Column {field.name} is missing, but {record_model.__name__}.{field.name} can't be null")
+
+			with transaction.atomic():
+				if settings.RESULT_STORAGE in ("records", "both"):
+					columns = [field.name for field in fields]
+					# if we got NaN (such as with an infeasibility), we need to make it None or it'll bork the whole table (seriously)
+					values = results_df[columns].astype(object)
+					values = values.where(results_df[columns].notna(), None)
+
+					records = [record_model(result_set=result_set, crop_id=crop_id, region_id=region_id, **row)
+					           for crop_id, region_id, row in zip(crops.astype(int), regions.astype(int), values.to_dict("records"))]
+					record_model.objects.bulk_create(records, batch_size=batch_size)
+
+				if settings.RESULT_STORAGE in ("columnar", "both"):
+					columns = {
+						"crop": crops.astype("int64").to_numpy(),
+						"region": regions.astype("int64").to_numpy(),
+						"i": crop_codes.to_numpy(),
+						"g": region_codes.to_numpy(),
+					}
+					for field in fields:
+						values = results_df[field.name]
+						if isinstance(field, models.DecimalField):
+							# keep the model's values as they are - rounding them here and again when we serialize them
+							# can change the last decimal place. serializers.columnar_representation rounds them once,
+							# the same way saving a Result record does
+							columns[field.name] = pandas.to_numeric(values, errors="coerce").astype("float64").to_numpy()
+						elif isinstance(field, (models.IntegerField, models.FloatField)):
+							columns[field.name] = pandas.to_numeric(values, errors="coerce").to_numpy()
+						else:
+							columns[field.name] = values.astype(object).where(values.notna(), None).to_numpy()
+
+					setattr(result_set, result_set.columnar_fields[record_model.__name__], columnar.to_bytes(pandas.DataFrame(columns)))
 
-			if result_set.in_calibration is False:  # if we changed the in_calibration value, save the result set - we check this here so we only trigger the save once
 				result_set.save()
 
 			return result_set
@@ -1051,13 +1613,14 @@ class ModelRun(models.Model):
 		crops = {}
 		# now let's see if there are any crops that are common to the infeasibilities
 		#if total_infeasibilities > 2:  # if we have more than a handful, we'll assess which crops are common
+		# read the results once, whether they're stored as columns or records
+		results = result_set.as_data_frame() if total_infeasibilities > 0 else None
 		for infeasibility in scenario.infeasibilities:
-			infeasible_region_results = Result.objects.filter(result_set=result_set,
-					                                          region__internal_id=infeasibility.region,
-					                                          year=infeasibility.timeframe)
+			if len(results) == 0:
+				break
+			infeasible_region_results = results[(results["g"] == str(infeasibility.region)) & (results["year"] == infeasibility.timeframe)]
 
-			for result in infeasible_region_results:
-				crop = result.crop.crop_code
+			for crop in infeasible_region_results["i"]:
 				if crop in crops:
 					crops[crop] += 1
 				else:
@@ -1070,6 +1633,13 @@ class ModelRun(models.Model):
 			self.infeasibilities_text = ", ".join(infeasibility_items)
 
 
+@receiver(post_save, sender=ModelRun)
+def notify_run_processor(sender, instance, using, **kwargs):
+	# wake up the run processor right away instead of waiting for its next check of the database
+	if instance.ready and not instance.running and not instance.complete:
+		notifications.notify_runs_waiting(using=using)
+
+
 class Infeasibility(models.Model):
 	result_set = models.ForeignKey(ResultSet, on_delete=models.CASCADE, related_name="infeasibilities")
 	year = models.SmallIntegerField()
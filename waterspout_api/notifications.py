@@ -0,0 +1,138 @@
+"""
+	Lets the web application wake up the run processor as soon as a model run is ready, instead of the run processor
+	finding it on its next check of the database. On Postgres, we use LISTEN/NOTIFY. SQLite doesn't have anything like
+	that, so we touch a wakeup file that run processors on the same machine watch (SQLite deployments are single
+	machine anyway).
+
+	The run processor still checks the database every so often in case it misses a notification (restarts, runs
+	made ready through .update(), etc), so notifications only speed things up - nothing depends on them.
+"""
+
+import logging
+import os
+import select
+import time
+
+import psycopg2
+from django.db import connections, transaction
+
+from Waterspout import settings
+
+log = logging.getLogger("waterspout.notifications")
+
+NOTIFY_CHANNEL = "waterspout_model_runs"
+
+
+def notify_runs_waiting(using="default"):
+	"""
+		Tells any listening run processors that there's a model run waiting. The notification goes out after the
+		current transaction commits so that the run processor can see the run (and its modifications) when it looks.
+	:param using: the database alias the run was saved to
+	:return:
+	"""
+	transaction.on_commit(lambda: _send_notification(using), using=using)
+
+
+def _send_notification(using):
+	try:
+		connection = connections[using]
+		if connection.vendor == "postgresql":
+			with connection.cursor() as cursor:
+				cursor.execute("SELECT pg_notify(%s, '')", [NOTIFY_CHANNEL])
+		else:
+			# write something new each time so that both the modification time and contents change
+			with open(settings.MODEL_RUN_WAKEUP_FILE, 'w') as wakeup_file:
+				wakeup_file.write(str(time.time_ns()))
+	except:  # notifications are only an optimization - the run processor will still find the run when it checks the DB
+		log.warning("Couldn't notify the run processor about a waiting model run", exc_info=True)
+
+
+def get_run_waiter(using="default"):
+	"""
+		Returns an object with a wait(timeout) method the run processor can sleep on between checks for model runs
+	"""
+	if connections[using].vendor == "postgresql":
+		return PostgresRunWaiter(using=using)
+	else:
+		return FileRunWaiter(wakeup_file=settings.MODEL_RUN_WAKEUP_FILE)
+
+
+class PostgresRunWaiter(object):
+	"""
+		Keeps its own connection open, LISTENing on the notification channel. Waiting blocks on the connection's socket,
+		so it doesn't send any queries to the database while idle.
+	"""
+	def __init__(self, using="default"):
+		self.using = using
+		self._connection = None
+
+	def _connect(self):
+		self._connection = psycopg2.connect(**connections[self.using].get_connection_params())
+		self._connection.set_session(autocommit=True)
+		with self._connection.cursor() as cursor:
+			cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+
+	def wait(self, timeout):
+		"""
+			Blocks until a notification comes in or the timeout expires
+		:param timeout: seconds to wait
+		:return: True if we were notified, False if the timeout expired
+		"""
+		try:
+			if self._connection is None or self._connection.closed:
+				self._connect()
+
+			if self._connection.notifies:  # notifications can arrive while we were off running a model
+				self._connection.notifies.clear()
+				return True
+
+			readable, _, _ = select.select([self._connection], [], [], timeout)
+			if not readable:
+				return False
+
+			self._connection.poll()
+			notified = len(self._connection.notifies) > 0
+			self._connection.notifies.clear()
+			return notified
+		except psycopg2.Error:  # drop the connection and fall back to a plain sleep - we'll reconnect next time
+			log.warning("Lost the model run notification connection", exc_info=True)
+			self._connection = None
+			time.sleep(timeout)
+			return False
+
+
+class FileRunWaiter(object):
+	"""
+		Watches the wakeup file for changes. Checking the file's stats is cheap and doesn't touch the database, so we can
+		check often enough to start runs quickly.
+	"""
+	check_interval = 0.05  # seconds
+
+	def __init__(self, wakeup_file):
+		self.wakeup_file = wakeup_file
+		self._last_seen = self._file_state()
+
+	def _file_state(self):
+		try:
+			stats = os.stat(self.wakeup_file)
+			return stats.st_mtime_ns, stats.st_size
+		except OSError:  # hasn't been created yet - that's fine, nothing has notified us
+			return None
+
+	def wait(self, timeout):
+		"""
+			Blocks until the wakeup file changes or the timeout expires
+		:param timeout: seconds to wait
+		:return: True if we were notified, False if the timeout expired
+		"""
+		deadline = time.monotonic() + timeout
+		while True:
+			state = self._file_state()
+			if state != self._last_seen:
+				self._last_seen = state
+				return True
+
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				return False
+			time.sleep(min(self.check_interval, remaining))
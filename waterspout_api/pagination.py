@@ -0,0 +1,19 @@
+from rest_framework.pagination import CursorPagination
+
+from Waterspout import settings
+
+
+class ModelRunCursorPagination(CursorPagination):
+	"""
+		Cursor pagination for model run listings - clients opt in with ?pagination=cursor and then follow the next
+		links. Unlike page numbers, cursors don't skip or repeat model runs when runs are added or removed between
+		requests, and each page costs the same no matter how deep into the list it is.
+	"""
+	ordering = "id"
+	page_size = settings.MODEL_RUN_PAGE_SIZE
+	page_size_query_param = "page_size"
+	max_page_size = 1000
+
+
+def wants_cursor_pagination(request):
+	return request.query_params.get("pagination") == "cursor" or "cursor" in request.query_params
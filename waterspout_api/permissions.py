@@ -5,72 +5,67 @@ from rest_framework.exceptions import ValidationError, PermissionDenied
 from rest_framework import status
 from rest_framework import permissions
 
-from waterspout_api import models
+from waterspout_api import memberships
+from waterspout_api import resolution
 
 log = logging.getLogger("waterspout.permissions")
 
 
 class IsInSameOrganization(permissions.BasePermission):
 	"""
-		Can only be used on objects that have an "organization" property
+		Can only be used on objects that have an "organization" property (or get one through their model area,
+		model run or calibration set). Objects are looked up through the request's resolution context, so they're
+		loaded once per request, no matter how many permission classes and views use them
 	"""
 
 	def has_permission(self, request, view):
 		if request.method in permissions.SAFE_METHODS:
 			return True  # in this case, we can't really check permissions here - need to make sure the queryset filters properly
 		else:
-			return self._check_org_info(request.user, request.data, view)
+			return self._check_org_info(request, view)
 
 	def has_object_permission(self, request, view, obj):
 		if request.method in permissions.SAFE_METHODS:  # org members can read
-			return obj.organization.has_member(request.user)
+			return memberships.is_member(request.user, obj.organization_id)  # the ID, so we don't load the organization
 		else:
-			return self._check_org_info(request.user, request.data, view)
+			return self._check_org_info(request, view)
+
+	def _check_org_info(self, request, view):
+		resolution_context = resolution.get_context(request)
+		request_data = request.data
 
-	def _check_org_info(self, request_user, request_data, view):
 		# get the item ID, as well as the class of the item so we can look the item up.
-		# We assume this permission is only used for items that have an "organization" foreign key
 		if "pk" in view.kwargs:  # then we're checking against an existing object
-			item_id = view.kwargs['pk']
-			item_class = view.serializer_class.Meta.model
-			try:
-				item = item_class.objects.get(pk=item_id)
-			except item_class.DoesNotExist:
-				return PermissionError("Model Run doesn't exist")
-
-			if hasattr(item, "organization"):
-				organization = item.organization
-			elif hasattr(item, "model_area"):
-				organization = item.model_area.organization
-			elif hasattr(item, "model_run"):
-				organization = item.model_run.organization
-			elif hasattr(item, "calibration_set"):
-				organization = item.calibration_set.model_area.organization
+			item = resolution_context.get_item(view.serializer_class.Meta.model, view.kwargs['pk'])
+			if item is None:
+				return True  # nothing to check - the view responds with a 404
+			organization_id = resolution.get_organization_id(item)
 
 		else:  # we're creating an object - check what org they specify instead of the org of the object
 			if type(request_data) is not dict:
 				request_data = json.loads(request_data)
-			organization = models.Organization.objects.get(id=int(request_data["organization"]))
-
-		#log.debug(f"Make Model Run Request: ${request_data}")
+			try:
+				organization_id = int(request_data["organization"])
+			except (KeyError, TypeError, ValueError):
+				raise ValidationError("Specify the organization by its ID")
 
 		# Check Permissions
-		if not organization.has_member(request_user):
+		if not memberships.is_member(request.user, organization_id):
 			log.error("User is not a member of the specified organization and cannot create or modify model runs within it")
 			raise PermissionDenied(
 				"User is not a member of the specified organization and cannot create or modify model runs within it")
-		# request_data["organization"] = organization  # replace it with the object so we can assign it later
 
 		if "calibration_set" in request_data:
-			calibration_set = models.CalibrationSet.objects.get(id=int(request_data["calibration_set"]))
+			calibration_set = resolution_context.get_calibration_set(request_data["calibration_set"])
+			if calibration_set is None:
+				raise ValidationError("CalibrationSet doesn't exist")
 			log.debug(f"Calibration Set: {calibration_set}")
-			if not calibration_set.model_area.organization == organization:
+			if not calibration_set.model_area.organization_id == organization_id:
 				log.error("CalibrationSet is not part of this organization. You can only use calibration sets that"
 				          "are attached to the organization you're working within")
 				raise PermissionDenied(
 					detail="CalibrationSet is not part of this organization. You can only use calibration sets that"
 					       "are attached to the organization you're working within")
-			# request_data["calibration_set"] = calibration_set  # replace it with the object so we can assign it later
 
 		return True
 
@@ -80,27 +75,20 @@ class CanCreateOrModifyModelRuns(permissions.BasePermission):
 		if request.method in permissions.SAFE_METHODS:  # allow them to read model runs with this permission
 			return True
 		else:  # but if they want to create, we need to check if the ModelArea allows creation
+			resolution_context = resolution.get_context(request)
 			if "pk" in view.kwargs:  # then we're checking against an existing object
-				item_id = view.kwargs['pk']
-				item_class = view.serializer_class.Meta.model
-				try:
-					item = item_class.objects.get(pk=item_id)
-				except item_class.DoesNotExist:
-					return PermissionError("Model Run doesn't exist")
-
-				if hasattr(item, "model_area"):
-					model_area = item.model_area
-				elif hasattr(item, "calibration_set"):
-					model_area = item.calibration_set.model_area
-				else:
-					raise RuntimeError(f"Can't get model area from {view.serializer_class}")
+				item = resolution_context.get_item(view.serializer_class.Meta.model, view.kwargs['pk'])
+				if item is None:
+					return True  # the view responds with a 404
+				model_area = resolution.get_model_area(item)
 			else:
 				if type(request.data) is not dict:
 					request_data = json.loads(request.data)
 				else:
 					request_data = request.data
-				calibration_set = models.CalibrationSet.objects.get(pk=request_data["calibration_set"])
+				calibration_set = resolution_context.get_calibration_set(request_data.get("calibration_set"))
+				if calibration_set is None:
+					raise ValidationError("CalibrationSet doesn't exist")
 				model_area = calibration_set.model_area
 
-			preferences = model_area.preferences
-			return preferences.create_or_modify_model_runs
\ No newline at end of file
+			return model_area.preference_values["create_or_modify_model_runs"]
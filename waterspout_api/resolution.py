@@ -0,0 +1,97 @@
+"""
+	Loads the objects a request works on once, no matter how many permission classes (and then the view) need them.
+	Before this, a single write to a model run looked up the model run, its organization, calibration set, model area
+	and preferences separately in each permission class, and then again in the view's get_object.
+
+	The context lives on the request, so nothing here outlives it. Items are loaded with select_related for the objects
+	we use to check permissions (see get_related_paths) - checking them afterward doesn't need any more queries.
+"""
+
+import logging
+
+from waterspout_api import models
+
+log = logging.getLogger("waterspout.resolution")
+
+REQUEST_ATTRIBUTE = "_waterspout_resolution"
+
+
+def get_related_paths(item_class):
+	"""
+		The select_related paths that get us from an item to its organization ID and its model area
+	"""
+	# only forward foreign keys - reverse relations can share these names (CalibrationSet has a reverse calibration_set)
+	field_names = {field.name for field in item_class._meta.get_fields() if field.concrete and field.many_to_one}
+	paths = []
+	if "model_area" in field_names:
+		paths.append("model_area")
+	if "model_run" in field_names:
+		paths.append("model_run")
+	if "calibration_set" in field_names:
+		paths.append("calibration_set__model_area")
+	return paths
+
+
+def get_organization_id(item):
+	"""
+		The ID of the organization the item belongs to - directly, or through its model area, model run or calibration set
+	"""
+	if hasattr(item, "organization_id"):
+		return item.organization_id
+	elif hasattr(item, "model_area"):
+		return item.model_area.organization_id
+	elif hasattr(item, "model_run"):
+		return item.model_run.organization_id
+	elif hasattr(item, "calibration_set"):
+		return item.calibration_set.model_area.organization_id
+	else:
+		raise RuntimeError(f"Can't get organization from {item.__class__.__name__}")
+
+
+def get_model_area(item):
+	if hasattr(item, "model_area"):
+		return item.model_area
+	elif hasattr(item, "calibration_set"):
+		return item.calibration_set.model_area
+	else:
+		raise RuntimeError(f"Can't get model area from {item.__class__.__name__}")
+
+
+class ResolutionContext(object):
+
+	def __init__(self):
+		self._items = {}  # (class, pk as a string): item, or None if it doesn't exist
+
+	def get_item(self, item_class, pk):
+		"""
+			Returns the item with the given primary key (from the URL or the request data), or None if it doesn't exist
+		:param item_class: the model class
+		:param pk:
+		:return:
+		"""
+		key = (item_class, str(pk))
+		if key not in self._items:
+			try:
+				self._items[key] = item_class.objects.select_related(*get_related_paths(item_class)).filter(pk=pk).first()
+			except (ValueError, TypeError):  # not a valid primary key, so there's nothing to find
+				self._items[key] = None
+		return self._items[key]
+
+	def get_calibration_set(self, calibration_set_id):
+		"""
+			Returns the calibration set, with its model area, or None if it doesn't exist
+		"""
+		return self.get_item(models.CalibrationSet, calibration_set_id)
+
+
+def get_context(request):
+	"""
+		Returns the request's ResolutionContext, creating it on first use
+	:param request: a DRF Request
+	:return:
+	"""
+	context = getattr(request, REQUEST_ATTRIBUTE, None)
+	if context is None:
+		context = ResolutionContext()
+		setattr(request, REQUEST_ATTRIBUTE, context)
+	return context
@@ -0,0 +1,129 @@
+"""
+	Schedulers decide the order that the run processor tries to claim waiting model runs in. The run processor
+	asks the configured scheduler (settings.MODEL_RUN_SCHEDULER) for an ordered batch of model run IDs, then claims
+	the first one nobody else has claimed yet via ModelRun.objects.claim_next. It asks again after every run, so
+	new submissions get slotted in right away instead of waiting for the whole batch.
+
+	All of the ordering happens in Python on a list of IDs, so schedulers behave the same on SQLite and Postgres.
+"""
+
+import datetime
+import logging
+from fractions import Fraction
+
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from Waterspout import settings
+from waterspout_api import models
+
+log = logging.getLogger("waterspout.scheduling")
+
+
+def get_scheduler():
+	"""
+		Returns an instance of the scheduler configured in settings.MODEL_RUN_SCHEDULER
+	"""
+	return import_string(settings.MODEL_RUN_SCHEDULER)(batch_size=settings.MODEL_RUN_SCHEDULER_BATCH_SIZE)
+
+
+class BaseScheduler(object):
+	"""
+		Subclasses implement order_runs. batch_size caps how many run IDs we hand back at once - the run processor
+		only needs the first few since it asks again after every run.
+	"""
+	def __init__(self, batch_size=8):
+		self.batch_size = batch_size
+
+	def get_batch(self, queryset=None):
+		"""
+			Returns a list of waiting model run IDs, in the order they should be claimed
+		:param queryset: a queryset of ModelRuns to schedule from. Defaults to all waiting model runs
+		:return: list of model run IDs, no longer than batch_size
+		"""
+		if queryset is None:
+			queryset = models.ModelRun.objects.waiting()
+
+		return self.order_runs(queryset)[:self.batch_size]
+
+	def order_runs(self, queryset):
+		raise NotImplementedError("Schedulers must implement order_runs")
+
+
+class SubmissionOrderScheduler(BaseScheduler):
+	"""
+		First come, first served - the original behavior of the run processor
+	"""
+	def order_runs(self, queryset):
+		return list(queryset.order_by("date_submitted", "id").values_list("id", flat=True))
+
+
+class FairShareScheduler(BaseScheduler):
+	"""
+		Shares the run processor between users so that someone submitting a large batch of model runs over the API
+		doesn't push everyone else's runs to the back of the queue. Each user's share is weighted by their
+		organization's weight (settings.MODEL_RUN_SCHEDULER_ORGANIZATION_WEIGHTS, keyed by organization ID - defaults
+		to 1), so a user with weight 2 gets two runs for every one of a user with weight 1.
+
+		Shares count the runs each user already has running or had claimed in the last
+		settings.MODEL_RUN_SCHEDULER_FAIRNESS_WINDOW seconds, not just the runs in this batch. The run processor asks
+		for a new batch after every run, so without that, whoever has the oldest waiting run would always go first.
+		Counting in the database also keeps it fair across several workers. When users have had the same share,
+		older submissions go first, and each user's own runs stay oldest first.
+
+		So if one user submits 81 runs and someone else submits a single run a minute later, the single run is claimed
+		second instead of 82nd - and two users with big batches take turns.
+	"""
+	def __init__(self, batch_size=8, organization_weights=None, fairness_window=None):
+		super().__init__(batch_size=batch_size)
+		if organization_weights is None:
+			organization_weights = settings.MODEL_RUN_SCHEDULER_ORGANIZATION_WEIGHTS
+		if fairness_window is None:
+			fairness_window = settings.MODEL_RUN_SCHEDULER_FAIRNESS_WINDOW
+		self.organization_weights = organization_weights
+		self.fairness_window = fairness_window
+
+	def get_weight(self, organization_id):
+		return max(1, int(self.organization_weights.get(organization_id, 1)))
+
+	def get_recent_runs(self, user_ids):
+		"""
+			How many runs each user has running, or had claimed within the fairness window
+		:param user_ids: the users to count runs for
+		:return: dict of user ID: number of runs
+		"""
+		since = timezone.now() - datetime.timedelta(seconds=self.fairness_window)
+		recent = models.ModelRun.objects.filter(Q(running=True) | Q(date_claimed__gte=since), user_id__in=user_ids)\
+			.values("user_id").annotate(runs=Count("id")).values_list("user_id", "runs")
+		return dict(recent)
+
+	def order_runs(self, queryset):
+		# split the queue up by user - since we go through it oldest first, each user's own runs stay oldest first
+		user_queues = {}
+		user_weights = {}
+		submission_order = {}
+		waiting = queryset.order_by("date_submitted", "id").values_list("id", "user_id", "organization_id")
+		for run_id, user_id, organization_id in waiting:
+			submission_order[run_id] = len(submission_order)
+			user_queues.setdefault(user_id, []).append(run_id)
+			user_weights.setdefault(user_id, self.get_weight(organization_id))
+		if len(user_queues) == 0:
+			return []
+
+		# each run a user gets adds 1/weight to their share. Next goes the user whose share would be smallest after
+		# their next run, and between equal shares, the user whose next run was submitted first
+		shares = {user_id: Fraction(runs, user_weights[user_id]) for user_id, runs in self.get_recent_runs(list(user_queues)).items()}
+		positions = {user_id: 0 for user_id in user_queues}
+
+		ordered = []
+		while len(ordered) < self.batch_size and user_queues:
+			user_id = min(user_queues, key=lambda user: (shares.get(user, 0) + Fraction(1, user_weights[user]),
+			                                             submission_order[user_queues[user][positions[user]]]))
+			ordered.append(user_queues[user_id][positions[user_id]])
+			shares[user_id] = shares.get(user_id, 0) + Fraction(1, user_weights[user_id])
+			positions[user_id] += 1
+			if positions[user_id] == len(user_queues[user_id]):
+				del user_queues[user_id]
+
+		return ordered
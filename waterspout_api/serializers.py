@@ -1,7 +1,14 @@
 import json
 import logging
 
+import numpy
+import pandas
+from django.db import models as django_models
+from django.core.cache import cache
+from django.db import transaction
 from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.reverse import reverse
 from action_serializer import ModelActionSerializer
 
 from Waterspout import settings
@@ -137,19 +144,140 @@ class InfeasibilitySerializer(serializers.ModelSerializer):
 		model = models.Infeasibility
 
 
+def columnar_representation(df, serializer_class):
+	"""
+		Builds the same list of dicts that serializer_class would give us for records, but from a data frame of
+		stored result columns (see ResultSet.get_columnar_frame) or the values from a values_list query, without
+		creating any model instances. Decimals go through the same steps as a saved record - to a Decimal with the
+		field's max_digits, then through the serializer's own DecimalField - so even large values with all their
+		decimal places come out exactly as they would from records. The crop and region come out as their IDs.
+	:param df: data frame of result columns
+	:param serializer_class: ResultSerializer or RainfallResultSerializer - we use the fields from its Meta
+	:return: list of dicts
+	"""
+	record_model = serializer_class.Meta.model
+	field_names = serializer_class.Meta.fields
+	serializer_fields = serializer_class().fields
+
+	columns = []
+	for name in field_names:
+		if name not in df.columns:  # results from older versions of the model may not have every field
+			columns.append([None] * len(df))
+			continue
+
+		field = record_model._meta.get_field(name)
+		values = df[name].to_numpy()
+		nulls = pandas.isna(df[name]).to_numpy()
+		if isinstance(field, django_models.DecimalField):
+			# formatting the floats directly rounds differently for values that don't fit in a float exactly
+			to_representation = serializer_fields[name].to_representation
+			columns.append([None if null else to_representation(field.to_python(value)) for value, null in zip(values.tolist(), nulls)])
+		elif field.is_relation or isinstance(field, django_models.IntegerField):
+			columns.append([None if null else int(value) for value, null in zip(values.tolist(), nulls)])
+		else:
+			columns.append([None if null else value for value, null in zip(values.tolist(), nulls)])
+
+	return [dict(zip(field_names, row)) for row in zip(*columns)]
+
+
+def columnar_results(df, serializer_class):
+	"""
+		The columnar wire format for results (requested with the "columnar" format - see ColumnarJSONRenderer).
+		Instead of a list of objects that repeat every field name, it's one array per field, all the same length.
+		Numbers come out as plain JSON numbers (rounded to the field's decimal places) and missing values as null.
+		Crops and regions are dictionary encoded - their arrays hold indexes into the crop and region ID lists in
+		"dictionaries", so repeated IDs stay small.
+	:param df: data frame of result columns, as for columnar_representation
+	:param serializer_class: ResultSerializer or RainfallResultSerializer - we use the fields from its Meta
+	:return: dict with "length", "dictionaries", and "columns" keys
+	"""
+	record_model = serializer_class.Meta.model
+
+	dictionaries = {}
+	columns = {}
+	for name in serializer_class.Meta.fields:
+		if name not in df.columns:
+			columns[name] = [None] * len(df)
+			continue
+
+		field = record_model._meta.get_field(name)
+		nulls = pandas.isna(df[name]).to_numpy()
+		if field.is_relation:
+			codes, ids = pandas.factorize(df[name])  # missing values get -1
+			dictionaries[name] = [int(item_id) for item_id in ids]
+			values = codes.astype(object)
+		elif isinstance(field, django_models.DecimalField):
+			values = pandas.to_numeric(df[name], errors="coerce").astype("float64").round(field.decimal_places).to_numpy().astype(object)
+		elif isinstance(field, django_models.IntegerField):
+			values = numpy.array([None if null else int(value) for value, null in zip(df[name].tolist(), nulls)], dtype=object)
+		else:
+			values = df[name].to_numpy().astype(object)
+
+		values[nulls] = None  # JSON has no NaN
+		columns[name] = values.tolist()
+
+	return {"length": len(df), "dictionaries": dictionaries, "columns": columns}
+
+
 class ResultSetSerializer(serializers.ModelSerializer):
 	"""
 		For a single result - we'll basically never access this endpoint, but we'll use it to define the fields for the
 		full RunResultSerializer
+
+		If the context has results_format set to "columnar", results come out in the columnar wire format (see
+		columnar_results) instead of a list of objects
 	"""
-	result_set = ResultSerializer(allow_null=True, many=True)
-	rainfall_result_set = RainfallResultSerializer(allow_null=True, many=True)
+	# read from the stored columns when the result set has them, otherwise from the records
+	result_set = serializers.SerializerMethodField()
+	rainfall_result_set = serializers.SerializerMethodField()
 	infeasibilities = InfeasibilitySerializer(allow_null=True, many=True, read_only=True)
 
 	class Meta:
 		fields = ["result_set", "rainfall_result_set", "in_calibration", "dapper_version", "date_run", "infeasibilities", "infeasibilities_text"]
 		model = models.ResultSet
 
+	def get_result_set(self, instance):
+		return self._get_records(instance, "result_set", ResultSerializer)
+
+	def get_rainfall_result_set(self, instance):
+		return self._get_records(instance, "rainfall_result_set", RainfallResultSerializer)
+
+	def _get_records(self, instance, relation, serializer_class):
+		df = instance.get_columnar_frame(serializer_class.Meta.model.__name__)
+		if df is None:  # stored as records - pull just the values we need in one query instead of loading model instances
+			fields = serializer_class.Meta.fields
+			df = pandas.DataFrame.from_records(list(getattr(instance, relation).values_list(*fields)), columns=fields)
+
+		if self.context.get("results_format") == "columnar":
+			return columnar_results(df, serializer_class)
+		return columnar_representation(df, serializer_class)
+
+
+def get_encoded_result_sets(result_set_ids, results_format="records"):
+	"""
+		Returns the JSON for each result set, as ResultSetSerializer would render it, already encoded to bytes.
+		Results don't change once a model run is complete, so we encode each result set once and keep the bytes
+		in Django's cache. Only use this for result sets of complete model runs - we can't tell if results are
+		still loading.
+	:param result_set_ids: list of ResultSet IDs
+	:param results_format: "records" or "columnar" - see ResultSetSerializer
+	:return: list of bytes, in the same order as result_set_ids
+	"""
+	keys = {result_set_id: f"waterspout_result_set_{results_format}_json_{result_set_id}" for result_set_id in result_set_ids}
+	encoded = cache.get_many(keys.values())
+
+	missing = [result_set_id for result_set_id in result_set_ids if keys[result_set_id] not in encoded]
+	if missing:
+		renderer = JSONRenderer()
+		new_items = {}
+		for result_set in models.ResultSet.objects.filter(id__in=missing).prefetch_related("infeasibilities"):
+			serializer = ResultSetSerializer(result_set, context={"results_format": results_format})
+			new_items[keys[result_set.id]] = renderer.render(serializer.data)
+		cache.set_many(new_items, timeout=settings.RESULTS_CACHE_TIMEOUT)
+		encoded.update(new_items)
+
+	return [encoded[keys[result_set_id]] for result_set_id in result_set_ids]
+
 
 class ModelRunSerializer(ModelActionSerializer):
 	#region_modifications = serializers.SerializerMethodField()
@@ -186,21 +314,30 @@ class ModelRunSerializer(ModelActionSerializer):
 			and orders them by date, descending. This ensures that the newest results for the model run are always
 			in position 0 in the web app so that it can start with index 0 and not need to examine which is newest itself.
 			Users will see the newest by default until we can add functionality for them to switch it.
+
+			If the context has defer_results set, we leave the results out (as None) - the view adds the
+			pre-encoded results itself (see ModelRunViewSet.retrieve)
 		:param instance:
 		:return:
 		"""
+		if self.context.get("defer_results"):
+			return None
+
 		results = instance.results.all().order_by('-date_run')
-		return ResultSetSerializer(results, allow_null=True, many=True).data
+		return ResultSetSerializer(results, allow_null=True, many=True, context=self.context).data
 
 	def create(self, validated_data):
 		region_modification_data = validated_data.pop('region_modifications')
 		crop_modification_data = validated_data.pop('crop_modifications')
 
-		model_run = models.ModelRun.objects.create(**validated_data)
-		for modification in region_modification_data:
-			models.RegionModification.objects.create(model_run=model_run, **modification)
-		for modification in crop_modification_data:
-			models.CropModification.objects.create(model_run=model_run, **modification)
+		# create it all in one transaction - the run processor can pick up a ready run as soon as it's committed,
+		# so it can't be visible before its modifications are
+		with transaction.atomic():
+			model_run = models.ModelRun.objects.create(**validated_data)
+			for modification in region_modification_data:
+				models.RegionModification.objects.create(model_run=model_run, **modification)
+			for modification in crop_modification_data:
+				models.CropModification.objects.create(model_run=model_run, **modification)
 		return model_run
 
 
@@ -271,7 +408,7 @@ class ModelAreaSerializer(ModelActionSerializer):
 	region_set = RegionSerializer(read_only=True, many=True, allow_null=True)
 	region_group_sets = RegionGroupSetSerializer(read_only=True, many=True, allow_null=True)
 	multipliers_raw = serializers.SerializerMethodField(read_only=True)
-	preferences = ModelAreaPreferencesSerializer(read_only=True)
+	preferences = serializers.SerializerMethodField(read_only=True)  # same as ModelAreaPreferencesSerializer, but from memory
 
 	class Meta:
 		model = models.ModelArea
@@ -290,4 +427,66 @@ class ModelAreaSerializer(ModelActionSerializer):
 
 	def get_multipliers_raw(self, instance):
 		multipliers = models.EmploymentMultipliers.objects.filter(region__model_area=instance)
-		return EmploymentMultipliersSerializer(multipliers, read_only=True, allow_null=True, many=True).data
\ No newline at end of file
+		return EmploymentMultipliersSerializer(multipliers, read_only=True, allow_null=True, many=True).data
+
+	def get_preferences(self, instance):
+		return dict(instance.preference_values)
+
+
+class ModelAreaManifestSerializer(ModelAreaSerializer):
+	"""
+		The small parts of the model area detail view, plus the version of each large part (see
+		ModelArea.get_resource_versions). Clients get the large parts separately, and only when their versions change.
+	"""
+	resources = serializers.SerializerMethodField()
+
+	class Meta:
+		model = models.ModelArea
+		fields = ModelAreaSerializer.Meta._base_fields + ["main_help_page_content", "supports_rainfall",
+		                                                  "supports_irrigation", "background_code", "resources"]
+		depth = 0
+
+	def get_resources(self, instance):
+		request = self.context.get("request")
+		return {
+			name: {
+				"version": version,
+				"url": reverse("model_areas-data", kwargs={"pk": instance.pk, "resource": name}, request=request),
+			} for name, version in instance.get_resource_versions().items()
+		}
+
+
+# the serializer for each large part of the model area detail view (see ModelAreaSerializer) - multipliers_raw is
+# handled separately since it's not a direct relation of the model area
+MODEL_AREA_RESOURCE_SERIALIZERS = {
+	"calibration_data": CalibrationSetSerializer,
+	"rainfall_data": RainfallSetSerializer,
+	"input_data": InputDataSetSerializer,
+	"crop_set": CropSerializer,
+	"region_set": RegionSerializer,
+	"region_group_sets": RegionGroupSetSerializer,
+	"multipliers_raw": EmploymentMultipliersSerializer,
+}
+
+
+def get_encoded_model_area_resource(model_area, resource, version):
+	"""
+		Returns one of the large parts of the model area detail view, rendered to JSON bytes - the same data the
+		detail view has under that key. We keep the bytes in Django's cache by version, so each version only gets
+		encoded once.
+	:param model_area: ModelArea instance
+	:param resource: one of the keys in MODEL_AREA_RESOURCE_SERIALIZERS
+	:param version: the resource's current version, from ModelArea.get_resource_versions
+	:return: bytes
+	"""
+	key = f"waterspout_model_area_{model_area.id}_{resource}_{version}"
+	encoded = cache.get(key)
+	if encoded is None:
+		if resource == "multipliers_raw":
+			queryset = models.EmploymentMultipliers.objects.filter(region__model_area=model_area)
+		else:
+			queryset = getattr(model_area, resource).all()
+		data = MODEL_AREA_RESOURCE_SERIALIZERS[resource](queryset, read_only=True, allow_null=True, many=True).data
+		encoded = JSONRenderer().render(data)
+		cache.set(key, encoded, timeout=settings.MODEL_AREA_DATA_CACHE_TIMEOUT)
+	return encoded
\ No newline at end of file
@@ -0,0 +1,121 @@
+"""
+	An in-memory spatial index of each model area's regions, so we can find the regions in a map's viewport or the
+	region containing a point without PostGIS (or downloading every region's geometry). Works the same on SQLite.
+
+	Each region's bounding box goes into a uniform grid over the model area. Queries look up the grid cells they
+	touch, check the candidates' bounding boxes, and point lookups then test the actual polygons. Indexes are built on
+	first use and kept for each model area until its region_version changes.
+"""
+
+import logging
+import math
+import threading
+
+import numpy
+
+from waterspout_api import feature_collections, geometry
+
+log = logging.getLogger("waterspout.spatial_index")
+
+
+def polygons_contain(polygons, x, y):
+	"""
+		Whether the point is inside any of the polygons (and not in one of their holes)
+	:param polygons: list of polygons, each a list of numpy array rings, outside ring first
+	"""
+	for rings in polygons:
+		if geometry.ring_contains(rings[0], x, y) and not any(geometry.ring_contains(hole, x, y) for hole in rings[1:]):
+			return True
+	return False
+
+
+class RegionIndex(object):
+
+	def __init__(self, features):
+		"""
+		:param features: GeoJSON features of regions, with region IDs as their IDs
+		"""
+		self.region_ids = []
+		self.polygons = []
+		bounds = []
+		for feature in features:
+			polygons = [[numpy.asarray(ring, dtype="float64")[:, :2] for ring in polygon if len(ring) > 0]
+			            for polygon in geometry.get_polygons(feature["geometry"])]
+			polygons = [rings for rings in polygons if len(rings) > 0]
+			if len(polygons) == 0:
+				continue
+			points = numpy.concatenate([rings[0] for rings in polygons])
+			self.region_ids.append(feature["id"])
+			self.polygons.append(polygons)
+			bounds.append(numpy.concatenate([points.min(axis=0), points.max(axis=0)]))
+
+		self.region_ids = numpy.array(self.region_ids, dtype="int64")
+		self.bounds = numpy.array(bounds, dtype="float64").reshape(-1, 4)  # min x, min y, max x, max y
+
+		# about one region per cell, on average
+		self.cells_per_side = max(1, math.ceil(math.sqrt(len(self.region_ids))))
+		if len(self.region_ids) > 0:
+			self.origin = self.bounds[:, :2].min(axis=0)
+			self.cell_size = numpy.maximum((self.bounds[:, 2:].max(axis=0) - self.origin) / self.cells_per_side, 1e-12)
+		else:
+			self.origin = numpy.zeros(2)
+			self.cell_size = numpy.ones(2)
+
+		self.cells = {}
+		for index, (min_x, min_y, max_x, max_y) in enumerate(self.bounds):
+			(first_column, first_row), (last_column, last_row) = self._get_cells(min_x, min_y, max_x, max_y)
+			for column in range(first_column, last_column + 1):
+				for row in range(first_row, last_row + 1):
+					self.cells.setdefault((column, row), []).append(index)
+
+	def _get_cells(self, min_x, min_y, max_x, max_y):
+		# the first and last grid cells (column, row) the box touches, clamped to the grid
+		first = numpy.clip(numpy.floor((numpy.array([min_x, min_y]) - self.origin) / self.cell_size), 0, self.cells_per_side - 1)
+		last = numpy.clip(numpy.floor((numpy.array([max_x, max_y]) - self.origin) / self.cell_size), 0, self.cells_per_side - 1)
+		return first.astype(int).tolist(), last.astype(int).tolist()
+
+	def _get_candidates(self, min_x, min_y, max_x, max_y):
+		(first_column, first_row), (last_column, last_row) = self._get_cells(min_x, min_y, max_x, max_y)
+		candidates = set()
+		for column in range(first_column, last_column + 1):
+			for row in range(first_row, last_row + 1):
+				candidates.update(self.cells.get((column, row), ()))
+
+		candidates = numpy.array(sorted(candidates), dtype="int64")
+		if len(candidates) == 0:
+			return candidates
+		bounds = self.bounds[candidates]
+		overlaps = (bounds[:, 0] <= max_x) & (bounds[:, 2] >= min_x) & (bounds[:, 1] <= max_y) & (bounds[:, 3] >= min_y)
+		return candidates[overlaps]
+
+	def regions_in_bbox(self, min_x, min_y, max_x, max_y):
+		"""
+			IDs of the regions whose bounding boxes overlap the box
+		"""
+		return self.region_ids[self._get_candidates(min_x, min_y, max_x, max_y)].tolist()
+
+	def regions_at(self, x, y):
+		"""
+			IDs of the regions containing the point
+		"""
+		return [int(self.region_ids[index]) for index in self._get_candidates(x, y, x, y) if polygons_contain(self.polygons[index], x, y)]
+
+
+_indexes = {}  # model area ID: (region_version, RegionIndex)
+_indexes_lock = threading.Lock()
+
+
+def get_region_index(model_area):
+	"""
+		Returns the RegionIndex for the model area, building it if we don't have one for its current regions
+	"""
+	with _indexes_lock:
+		cached = _indexes.get(model_area.id)
+	if cached is not None and cached[0] == model_area.region_version:
+		return cached[1]
+
+	region_index = RegionIndex(feature_collections.build_region_features(model_area))
+	log.debug(f"Built spatial index of {len(region_index.region_ids)} regions for {model_area}")
+	with _indexes_lock:
+		_indexes[model_area.id] = (model_area.region_version, region_index)
+	return region_index
@@ -5,6 +5,7 @@ import csv
 import pandas
 
 from . import models
+from . import memberships
 from Waterspout.local_settings import BASE_DIR
 
 from rest_framework.authtoken.models import Token
@@ -68,11 +69,11 @@ def get_or_create_token(user):
 	:return: a DRF Token object. The actual token string is the "key" attribute on it
 	:return:
 	"""
-	tokens = Token.objects.filter(user=user)
-	if len(tokens) == 0:
+	token = Token.objects.filter(user=user).first()
+	if token is None:
 		return refresh_token_for_user(user)
 	else:
-		return tokens.first()
+		return token
 
 
 def add_user_to_organization_by_name(username, organization_name):
@@ -84,7 +85,13 @@ def add_user_to_organization_by_name(username, organization_name):
 
 
 def get_organizations_for_user(user):
-	return [val for val in [getattr(group, "organization", None) for group in user.groups.all()] if val is not None]
+	"""
+		The IDs of the organizations the user is in (cached - see memberships.py) - use them in filters like
+		organization__in=
+	:param user: a Django User object
+	:return: list of Organization IDs
+	"""
+	return list(memberships.get_organization_ids(user))
 
 
 def compare_runs(run1, run2, compare_digits=3, keep_fields=False):
@@ -1,6 +1,11 @@
+import io
 import os
 import json
 import logging
+import unittest
+import zipfile
+
+import pandas
 
 from django.contrib.auth.models import User, Group
 
@@ -8,7 +13,7 @@ from rest_framework.test import APITestCase, APIRequestFactory, APITransactionTe
 from rest_framework import status
 
 from waterspout_api.load import dap
-from waterspout_api import support, models
+from waterspout_api import support, models, exports
 from . import TEST_DATA_FOLDER
 
 log = logging.getLogger("waterspout.tests")
@@ -135,4 +140,103 @@ class APIModelRunTestCase(APITransactionTestCase):
 	# test that user that's not a member of the group gets PermissionDenied
 	# test that use of calibration set that's not in org gets PermissionDenied
 	# test that use of calibration set and user in org succeeds and returns HTTP 200 and a status message
-	# test that patching an existing item has same behavior
\ No newline at end of file
+	# test that patching an existing item has same behavior
+
+
+class APIExportTestCase(APITestCase):
+
+	def setUp(self):
+		self.group = Group(name="export_test")
+		self.group.save()
+		self.organization = models.Organization(name="export_test", group=self.group)
+		self.organization.save()
+		self.model_area = models.ModelArea(name="export_test", organization=self.organization, map_center_longitude=1,
+		                                   map_center_latitude=1, map_default_zoom=1)
+		self.model_area.save()
+		self.calibration_set = models.CalibrationSet.objects.create(model_area=self.model_area)
+		self.regions = [models.Region.objects.create(name=f"Region {index}", internal_id=str(index), model_area=self.model_area) for index in range(3)]
+		self.crop = models.Crop.objects.create(name="Alfalfa", crop_code="ALF", model_area=self.model_area)
+
+		self.user = User(username="export_test")
+		self.user.save()
+		self.organization.add_member(self.user)
+		self.client.force_authenticate(user=self.user)
+
+		self.model_runs = [self._make_run(name, rows) for name, rows in (("export one", 3), ("export two", 2))]
+
+	def _make_run(self, name, rows):
+		model_run = models.ModelRun.objects.create(name=name, user=self.user, organization=self.organization,
+		                                           calibration_set=self.calibration_set, complete=True)
+		results = pandas.DataFrame({
+			"g": [region.internal_id for region in self.regions[:rows]],
+			"i": [self.crop.crop_code] * rows,
+			"year": [2020] * rows,
+			"p": [1.5] * rows,
+			"y": [2.5] * rows,
+			"xland": [100.0] * rows,
+			"xlandsc": [90.0 + index for index in range(rows)],
+			"xwatersc": [200.0] * rows,
+			"water_per_acre": [2.0] * rows,
+			"gross_revenue": [1000.0] * rows,
+			"net_revenue": [500.0] * rows,
+			"net_revenue_flag": [1.0] * rows,
+		})
+		model_run._load_df(results_df=results, result_set=models.ResultSet.objects.create(model_run=model_run))
+		return model_run
+
+	def _get_content(self, url):
+		response = self.client.get(url)
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		return response, b"".join(response.streaming_content)
+
+	def test_export_csv(self):
+		response, content = self._get_content(f"/api/model_runs/{self.model_runs[0].id}/export/?format=csv")
+		self.assertEqual(response["Content-Type"], "text/csv")
+		self.assertIn(f"waterspout_model_run_{self.model_runs[0].id}.csv", response["Content-Disposition"])
+
+		data = pandas.read_csv(io.BytesIO(content), dtype={"region": str})
+		self.assertEqual(len(data), 3)
+		self.assertEqual(list(data.columns), exports.get_export_fields(self.model_runs[0]))
+		self.assertEqual(sorted(data["region"]), ["0", "1", "2"])
+		self.assertEqual(list(data["crop"].unique()), ["ALF"])
+
+	@unittest.skipUnless(exports.parquet_available, "pyarrow isn't installed")
+	def test_export_parquet(self):
+		response, content = self._get_content(f"/api/model_runs/{self.model_runs[0].id}/export/?format=parquet")
+		self.assertEqual(response["Content-Type"], "application/vnd.apache.parquet")
+
+		data = pandas.read_parquet(io.BytesIO(content))
+		self.assertEqual(len(data), 3)
+		self.assertEqual(sorted(data["xlandsc"]), [90.0, 91.0, 92.0])
+
+	def test_export_many_csv(self):
+		ids = ",".join(str(model_run.id) for model_run in self.model_runs)
+		response, content = self._get_content(f"/api/model_runs/export/?ids={ids}&format=csv")
+		self.assertEqual(response["Content-Type"], "application/zip")
+
+		with zipfile.ZipFile(io.BytesIO(content)) as archive:
+			self.assertEqual(sorted(archive.namelist()), sorted(f"waterspout_model_run_{model_run.id}.csv" for model_run in self.model_runs))
+			for model_run, rows in zip(self.model_runs, (3, 2)):
+				self.assertEqual(len(pandas.read_csv(archive.open(f"waterspout_model_run_{model_run.id}.csv"))), rows)
+
+	@unittest.skipUnless(exports.parquet_available, "pyarrow isn't installed")
+	def test_export_many_parquet(self):
+		ids = ",".join(str(model_run.id) for model_run in self.model_runs)
+		response, content = self._get_content(f"/api/model_runs/export/?ids={ids}&format=parquet")
+		self.assertEqual(response["Content-Type"], "application/zip")
+
+		with zipfile.ZipFile(io.BytesIO(content)) as archive:
+			self.assertEqual(len(archive.namelist()), 2)
+			for model_run, rows in zip(self.model_runs, (3, 2)):
+				with archive.open(f"waterspout_model_run_{model_run.id}.parquet") as member:
+					self.assertEqual(len(pandas.read_parquet(io.BytesIO(member.read()))), rows)
+
+	def test_nonmember_cant_export(self):
+		other_user = User(username="export_test_other")
+		other_user.save()
+		self.client.force_authenticate(user=other_user)
+
+		response = self.client.get(f"/api/model_runs/{self.model_runs[0].id}/export/?format=csv")
+		self.assertIn(response.status_code, (status.HTTP_403_FORBIDDEN, status.HTTP_404_NOT_FOUND))
+		response = self.client.get(f"/api/model_runs/export/?ids={self.model_runs[0].id}&format=csv")
+		self.assertIn(response.status_code, (status.HTTP_403_FORBIDDEN, status.HTTP_404_NOT_FOUND))
@@ -0,0 +1,40 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework import exceptions
+
+from waterspout_api import authentication, support
+
+
+class CachedTokenAuthenticationTestCase(TestCase):
+
+	def setUp(self):
+		cache.clear()
+		self.user = User.objects.create(username="token_test")
+		self.token = support.get_or_create_token(self.user)
+		self.backend = authentication.CachedTokenAuthentication()
+
+	def test_cached_after_first_request(self):
+		user, token = self.backend.authenticate_credentials(self.token.key)
+		self.assertEqual(user.pk, self.user.pk)
+
+		with self.assertNumQueries(0):
+			user, token = self.backend.authenticate_credentials(self.token.key)
+		self.assertEqual(user.username, "token_test")
+		self.assertEqual(token.key, self.token.key)
+
+	def test_rotated_tokens_stop_working(self):
+		self.backend.authenticate_credentials(self.token.key)
+		new_token = support.refresh_token_for_user(self.user)
+
+		with self.assertRaises(exceptions.AuthenticationFailed):
+			self.backend.authenticate_credentials(self.token.key)
+		self.assertEqual(self.backend.authenticate_credentials(new_token.key)[0].pk, self.user.pk)
+
+	def test_deactivated_users_stop_working(self):
+		self.backend.authenticate_credentials(self.token.key)
+		self.user.is_active = False
+		self.user.save()
+
+		with self.assertRaises(exceptions.AuthenticationFailed):
+			self.backend.authenticate_credentials(self.token.key)
@@ -0,0 +1,82 @@
+import numpy
+import pandas
+
+from django.test import TestCase
+
+from waterspout_api import columnar, models, serializers
+
+
+class ColumnarStorageTestCase(TestCase):
+
+	def test_round_trip_keeps_missing_values(self):
+		df = pandas.DataFrame({
+			"g": ["1", "2", "3"],
+			"resource_flag": ["L", None, "W"],
+			"xlandsc": [1.5, numpy.nan, 3.25],
+			"year": [2020, 2020, 2021],
+		})
+
+		stored = columnar.from_bytes(memoryview(columnar.to_bytes(df)))  # some database drivers give us memoryviews
+
+		self.assertEqual(list(stored.columns), ["g", "resource_flag", "xlandsc", "year"])
+		self.assertEqual(list(stored["g"]), ["1", "2", "3"])
+		self.assertTrue(pandas.isna(stored["resource_flag"][1]))
+		self.assertEqual(stored["resource_flag"][2], "W")
+		self.assertTrue(numpy.isnan(stored["xlandsc"][1]))
+		self.assertEqual(list(stored["year"]), [2020, 2020, 2021])
+
+	def test_representation_matches_serializer_format(self):
+		df = pandas.DataFrame({
+			"region": [4], "crop": [7], "year": [2020], "xlandsc": [12.5], "xwatersc": [numpy.nan],
+			"water_per_acre": [3.0], "net_revenue": [100.125], "gross_revenue": [-2.0],
+		})
+
+		records = serializers.columnar_representation(df, serializers.ResultSerializer)
+
+		self.assertEqual(records[0]["region"], 4)
+		self.assertEqual(records[0]["crop"], 7)
+		self.assertEqual(records[0]["year"], 2020)
+		self.assertEqual(records[0]["xlandsc"], "12.5000000000")
+		self.assertIsNone(records[0]["xwatersc"])
+		self.assertEqual(records[0]["net_revenue"], "100.125")
+
+	def test_large_values_match_serializer_output(self):
+		# values that don't fit in a float with all ten decimal places, and that round differently when formatted
+		# from the float than from the Decimal we'd store for a record
+		xlandsc = [33059443.718483075, 5932.69356835085, 99999999.99999, 0.1 + 0.2]
+		df = pandas.DataFrame({
+			"region": [4, 4, 5, 5], "crop": [7, 8, 7, 8], "year": [2020] * 4, "xlandsc": xlandsc,
+			"xwatersc": [12345678.123456789, 1.0, numpy.nan, 3.0], "water_per_acre": [1234567890123.12345] * 4,
+			"net_revenue": [987654321098765.4321, -0.0005, 2.5, 1234.5675], "gross_revenue": [1.0] * 4,
+		})
+
+		records = serializers.columnar_representation(df, serializers.ResultSerializer)
+
+		# what ModelSerializer gives us for the records - a Result holds what the database gives back for each value
+		fields = {field.name: field for field in models.Result._meta.concrete_fields}
+		for row, record in zip(df.to_dict("records"), records):
+			result = models.Result(region_id=row["region"], crop_id=row["crop"], year=row["year"], **{
+				name: None if numpy.isnan(value) else fields[name].to_python(value)
+				for name, value in row.items() if name not in ("region", "crop", "year")
+			})
+			self.assertEqual(record, dict(serializers.ResultSerializer(result).data))
+
+		self.assertEqual(records[0]["xlandsc"], "33059443.7184830755")
+		self.assertEqual(records[1]["xlandsc"], "5932.6935683508")
+
+	def test_columnar_wire_format(self):
+		df = pandas.DataFrame({
+			"region": [4, 4, 5], "crop": [7, 8, 7], "year": [2020, 2020, 2020], "xlandsc": [12.5, 1.0, numpy.nan],
+			"xwatersc": [1.0, 2.0, 3.0], "water_per_acre": [3.0, 3.0, 3.0], "net_revenue": [100.125, 0, 1],
+			"gross_revenue": [-2.0, 0, 1],
+		})
+
+		results = serializers.columnar_results(df, serializers.ResultSerializer)
+
+		self.assertEqual(results["length"], 3)
+		self.assertEqual(results["dictionaries"]["region"], [4, 5])
+		self.assertEqual(results["columns"]["region"], [0, 0, 1])
+		self.assertEqual(results["dictionaries"]["crop"], [7, 8])
+		self.assertEqual(results["columns"]["crop"], [0, 1, 0])
+		self.assertEqual(results["columns"]["xlandsc"], [12.5, 1.0, None])
+		self.assertEqual(results["columns"]["year"], [2020, 2020, 2020])
@@ -0,0 +1,75 @@
+import tempfile
+from unittest import mock
+
+from django.db.models import DecimalField
+from django.test import TestCase
+
+from waterspout_api import data_cache, models
+
+
+def make_calibrated_parameter(calibration_set, region, crop, **values):
+	# every required decimal field gets 1 unless it's given
+	fields = {field.name: 1 for field in models.CalibratedParameter._meta.concrete_fields
+	          if isinstance(field, DecimalField) and not field.null and not field.has_default()}
+	fields.update(values)
+	return models.CalibratedParameter.objects.create(calibration_set=calibration_set, region=region, crop=crop, year=1, **fields)
+
+
+class RecordSetDataFrameCacheTestCase(TestCase):
+
+	def setUp(self):
+		self.model_area = models.ModelArea(name="data_cache_test", map_center_longitude=1, map_center_latitude=1, map_default_zoom=1)
+		self.model_area.save()
+		self.region = models.Region.objects.create(name="Region", internal_id="1", model_area=self.model_area)
+		self.crop = models.Crop.objects.create(name="Alfalfa", crop_code="ALF", model_area=self.model_area)
+		self.calibration_set = models.CalibrationSet.objects.create(model_area=self.model_area)
+		self.record = make_calibrated_parameter(self.calibration_set, self.region, self.crop, xland=100)
+
+		# a cache of our own, so tests don't share frames (or files) with each other or the real cache folder
+		self.folder = tempfile.TemporaryDirectory()
+		self.addCleanup(self.folder.cleanup)
+		patcher = mock.patch.object(data_cache, "record_set_frames", data_cache.DataFrameCache(max_items=4, folder=self.folder.name))
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def _fresh_calibration_set(self):
+		return models.CalibrationSet.objects.get(pk=self.calibration_set.pk)
+
+	def test_second_load_is_a_cache_hit(self):
+		first = self._fresh_calibration_set().as_cached_data_frame()
+		self.assertEqual(list(first["xland"]), [100.0])
+
+		calibration_set = self._fresh_calibration_set()
+		with self.assertNumQueries(0):
+			second = calibration_set.as_cached_data_frame()
+		self.assertTrue(first.equals(second))
+
+		# callers get their own copies, so changing one doesn't change what's cached
+		second["xland"] = 0
+		with self.assertNumQueries(0):
+			self.assertEqual(list(calibration_set.as_cached_data_frame()["xland"]), [100.0])
+
+	def test_disk_cache_survives_the_memory_cache(self):
+		self._fresh_calibration_set().as_cached_data_frame()
+		data_cache.record_set_frames.clear()  # like a new process
+
+		calibration_set = self._fresh_calibration_set()
+		with self.assertNumQueries(0):
+			self.assertEqual(list(calibration_set.as_cached_data_frame()["xland"]), [100.0])
+
+	def test_saving_a_record_misses_the_cache(self):
+		self._fresh_calibration_set().as_cached_data_frame()
+		version = self._fresh_calibration_set().data_version
+
+		self.record.xland = 250
+		self.record.save()  # the signal receivers bump the set's data_version
+
+		calibration_set = self._fresh_calibration_set()
+		self.assertEqual(calibration_set.data_version, version + 1)
+		self.assertEqual(list(calibration_set.as_cached_data_frame()["xland"]), [250.0])
+
+	def test_deleting_a_record_misses_the_cache(self):
+		self._fresh_calibration_set().as_cached_data_frame()
+		self.record.delete()
+
+		self.assertEqual(len(self._fresh_calibration_set().as_cached_data_frame()), 0)
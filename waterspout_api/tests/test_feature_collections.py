@@ -0,0 +1,75 @@
+import gzip
+import json
+
+from django.test import TestCase
+
+from waterspout_api import models, feature_collections, geometry
+
+
+def _square_feature(name, offset):
+	return json.dumps({
+		"type": "Feature",
+		"properties": {"NAME": name},
+		"geometry": {"type": "Polygon", "coordinates": [[[offset, 0], [offset + 1, 0], [offset + 1, 1], [offset, 1], [offset, 0]]]},
+	})
+
+
+class FeatureCollectionTestCase(TestCase):
+
+	def setUp(self):
+		self.model_area = models.ModelArea(name="feature_collection_test", map_center_longitude=1, map_center_latitude=1, map_default_zoom=1)
+		self.model_area.save()
+		self.first_region = models.Region.objects.create(name="First", internal_id="1", model_area=self.model_area, geometry=_square_feature("First", 0))
+		self.second_region = models.Region.objects.create(name="Second", internal_id="2", model_area=self.model_area, geometry=_square_feature("Second", 1))
+
+	def _get_collection(self, level=None):
+		model_area = models.ModelArea.objects.get(pk=self.model_area.pk)  # fresh copy, with the current versions
+		feature_collection = feature_collections.get_feature_collection(model_area, level=level)
+		return json.loads(gzip.decompress(feature_collection.data))
+
+	def _get_features(self):
+		return self._get_collection()["features"]
+
+	def test_builds_collection_of_regions(self):
+		features = self._get_features()
+
+		self.assertEqual([feature["id"] for feature in features], [self.first_region.id, self.second_region.id])
+		self.assertEqual(features[0]["properties"]["NAME"], "First")  # keeps the properties from the original file
+		self.assertEqual(features[1]["properties"]["internal_id"], "2")
+
+	def test_rebuilds_after_regions_change(self):
+		self._get_features()
+		self.second_region.delete()
+
+		features = self._get_features()
+		self.assertEqual([feature["id"] for feature in features], [self.first_region.id])
+		self.assertEqual(models.FeatureCollection.objects.filter(model_area=self.model_area, level=None).count(), 1)
+
+	def test_levels_of_detail_keep_shared_borders(self):
+		collection = self._get_collection(level=max(feature_collections.get_levels_of_detail()))
+
+		first, second = [geometry.delta_decode(feature["geometry"]["coordinates"][0], collection["transform"])
+		                 for feature in collection["features"]]
+		# both squares still have their corners, and they still meet along x = 1 (give or take a grid cell)
+		self.assertEqual(len(first), 5)
+		first_border = {(x, y) for x, y in first if abs(x - 1) < 0.001}
+		self.assertEqual(len(first_border), 2)
+		self.assertEqual(first_border, {(x, y) for x, y in second if abs(x - 1) < 0.001})
+
+	def test_groups_without_geometry_get_outlines(self):
+		group_set = models.RegionGroupSet.objects.create(name="Dissolved", model_area=self.model_area)
+		group = models.RegionGroup.objects.create(name="Everything else", group_set=group_set)
+		group.regions.add(self.first_region, self.second_region)
+
+		features = feature_collections.build_region_group_features(group_set)
+		group.refresh_from_db()
+		self.assertEqual(group.dissolved_version, group.version)
+		self.assertEqual(features[0]["geometry"]["type"], "Polygon")
+		# the border between the two squares is gone - just the outside of the 2x1 rectangle is left
+		corners = {(round(x, 3), round(y, 3)) for x, y in features[0]["geometry"]["coordinates"][0]}
+		self.assertEqual({(0, 0), (2, 0), (2, 1), (0, 1)}, corners - {(1, 0), (1, 1)})
+
+		group.regions.remove(self.second_region)
+		features = feature_collections.build_region_group_features(group_set)
+		xs = [x for x, y in features[0]["geometry"]["coordinates"][0]]
+		self.assertAlmostEqual(max(xs), 1, places=3)
@@ -0,0 +1,47 @@
+import io
+
+from django.test import TestCase
+
+from waterspout_api import models
+from waterspout_api.load import core
+
+INPUT_DATA = """g,i,year,omegaland,omegasupply,omegalabor,omegaestablish,p,y,xland,xwater,notes
+01,ALF,2018,100.5,20,30,,1.25,3.5,1000,2000,first
+01,CORN,2019,101,21,31,5,2.5,4.5,1100,2100,second
+99,ALF,2018,102,22,32,6,3.5,5.5,1200,2200,not a region here
+"""
+
+
+class InputDataLoadTestCase(TestCase):
+
+	def setUp(self):
+		self.model_area = models.ModelArea(name="load_test", map_center_longitude=1, map_center_latitude=1, map_default_zoom=1)
+		self.model_area.save()
+		self.region = models.Region.objects.create(name="Region", internal_id="01", model_area=self.model_area)
+		self.alfalfa = models.Crop.objects.create(name="Alfalfa", crop_code="ALF", model_area=self.model_area)
+		self.corn = models.Crop.objects.create(name="Corn", crop_code="CORN", model_area=self.model_area)
+
+	def test_loads_records_in_bulk(self):
+		# the regions, the crops, then the set and its records inside a savepoint (two more queries)
+		with self.assertNumQueries(6):
+			input_data_set = core.load_input_data_set(io.StringIO(INPUT_DATA), self.model_area, [2018, 2019],
+			                                          set_model=models.InputDataSet,
+			                                          item_model=models.InputDataItem,
+			                                          set_lookup="dataset")
+
+		records = {record.crop_id: record for record in models.InputDataItem.objects.filter(dataset=input_data_set)}
+		self.assertEqual(set(records), {self.alfalfa.id, self.corn.id})  # the row for region 99 was skipped
+		self.assertEqual(records[self.alfalfa.id].region_id, self.region.id)
+		self.assertEqual(records[self.alfalfa.id].year, 2018)
+		self.assertEqual(float(records[self.alfalfa.id].omegaland), 100.5)
+		self.assertIsNone(records[self.alfalfa.id].omegaestablish)
+		self.assertEqual(float(records[self.corn.id].omegaestablish), 5)
+
+	def test_missing_crops_fail_the_whole_load(self):
+		self.corn.delete()
+		with self.assertRaises(models.Crop.DoesNotExist):
+			core.load_input_data_set(io.StringIO(INPUT_DATA), self.model_area, [2018, 2019],
+			                         set_model=models.InputDataSet,
+			                         item_model=models.InputDataItem,
+			                         set_lookup="dataset")
+		self.assertFalse(models.InputDataSet.objects.filter(model_area=self.model_area).exists())
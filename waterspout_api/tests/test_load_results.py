@@ -0,0 +1,147 @@
+from unittest import mock
+
+import numpy
+import pandas
+from django.contrib.auth.models import User, Group
+from django.test import TestCase
+
+from Waterspout import settings
+from waterspout_api import models
+
+
+def load_results_per_record(model_run, results_df, result_set, record_model=models.Result):
+	"""
+		The way ModelRun._load_df used to load results - one query for each row's crop and region, and one save
+		per record. Kept here so we can check the bulk version against it
+	"""
+	for record in results_df.itertuples():
+		fields = list(set(record._fields) - set(["id", "g", "i", "calibration_set"]))
+		break
+
+	for record in results_df.itertuples():
+		result = record_model(result_set=result_set)
+		result.crop = models.Crop.objects.get(crop_code=record.i, model_area=model_run.calibration_set.model_area)
+		result.region = models.Region.objects.get(internal_id=record.g, model_area=model_run.calibration_set.model_area)
+		for column in fields:
+			value = getattr(record, column)
+			if value is not None and type(value) is not str and numpy.isnan(value):
+				value = None
+			setattr(result, column, value)
+
+		if hasattr(result, "net_revenue_flag") and (not result.net_revenue_flag or result.net_revenue_flag < 0):
+			result_set.in_calibration = False
+
+		result.save()
+
+	if result_set.in_calibration is False:
+		result_set.save()
+
+	return result_set
+
+
+class LoadResultsTestCase(TestCase):
+
+	def setUp(self):
+		self.organization = models.Organization.objects.create(name="load_results_test", group=Group.objects.create(name="load_results_test"))
+		self.model_area = models.ModelArea(name="load_results_test", organization=self.organization, map_center_longitude=1,
+		                                   map_center_latitude=1, map_default_zoom=1)
+		self.model_area.save()
+		self.calibration_set = models.CalibrationSet.objects.create(model_area=self.model_area)
+		for internal_id in ("1", "2"):
+			models.Region.objects.create(name=f"Region {internal_id}", internal_id=internal_id, model_area=self.model_area)
+		for crop_code in ("ALF", "CORN"):
+			models.Crop.objects.create(name=crop_code, crop_code=crop_code, model_area=self.model_area)
+		self.model_run = models.ModelRun.objects.create(name="load_results", user=User.objects.create(username="load_results_test"),
+		                                                organization=self.organization, calibration_set=self.calibration_set)
+
+	def _make_results(self, net_revenue_flags=(1.0, 2.0, 3.0)):
+		return pandas.DataFrame({
+			"g": ["1", "1", "2"],
+			"i": ["ALF", "CORN", "ALF"],
+			"year": [2020, 2020, 2020],
+			"p": [1.25, 2.5, 3.125],
+			"y": [4.5, 5.5, 6.25],
+			"xland": [1000.123456789, 2000.5, 3000.25],  # can't be null
+			"xlandsc": [900.25, 1800.5, numpy.nan],  # NaN like an infeasibility gives us
+			"xwatersc": [3000.75, 4000.125, numpy.nan],
+			"water_per_acre": [3.00075, 2.0000625, numpy.nan],
+			"gross_revenue": [12345.678, 23456.789, numpy.nan],
+			"net_revenue": [2345.678, -15.5, numpy.nan],
+			"net_revenue_flag": list(net_revenue_flags),
+			"resource_flag": ["land", None, "water"],
+			"worst_case_land": [1.0, 2.0, 3.0],  # we don't store this one
+		})
+
+	def _load(self, results, storage):
+		result_set = models.ResultSet.objects.create(model_run=self.model_run)
+		with mock.patch.object(settings, "RESULT_STORAGE", storage):
+			self.model_run._load_df(results_df=results, result_set=result_set)
+		result_set.refresh_from_db()
+		return result_set
+
+	def _load_per_record(self, results):
+		result_set = models.ResultSet.objects.create(model_run=self.model_run)
+		load_results_per_record(self.model_run, results, result_set)
+		result_set.refresh_from_db()
+		return result_set
+
+	def _assert_same_results(self, result_set, expected_result_set):
+		df = result_set.as_data_frame()
+		expected = expected_result_set.as_data_frame()
+		columns = [column for column in df.columns if column not in ("id", "result_set")]
+		self.assertIn("resource_flag", columns)
+		self.assertNotIn("worst_case_land", columns)
+
+		df = df[columns].sort_values(["g", "i"]).reset_index(drop=True)
+		expected = expected[columns].sort_values(["g", "i"]).reset_index(drop=True)
+		pandas.testing.assert_frame_equal(df, expected, check_dtype=False)
+
+	def test_matches_per_record_loading(self):
+		results = self._make_results()
+		expected_result_set = self._load_per_record(results)
+
+		for storage in ("records", "columnar", "both"):
+			with self.subTest(storage):
+				result_set = self._load(results, storage)
+				self._assert_same_results(result_set, expected_result_set)
+				self.assertEqual(result_set.in_calibration, expected_result_set.in_calibration)
+				self.assertEqual(models.Result.objects.filter(result_set=result_set).count(), 0 if storage == "columnar" else 3)
+
+				if storage == "both":  # the records match the columns too
+					result_set.result_data = None
+					self._assert_same_results(result_set, expected_result_set)
+
+	def test_in_calibration_matches_per_record_loading(self):
+		cases = {
+			"all positive": ((1.0, 2.0, 3.0), True),
+			"zero": ((1.0, 0.0, 3.0), False),
+			"negative": ((1.0, -1.0, 3.0), False),
+			"missing": ((1.0, numpy.nan, 3.0), False),
+		}
+		for name, (flags, in_calibration) in cases.items():
+			with self.subTest(name):
+				results = self._make_results(net_revenue_flags=flags)
+				self.assertIs(self._load_per_record(results).in_calibration, in_calibration)
+				for storage in ("records", "columnar"):
+					self.assertIs(self._load(results, storage).in_calibration, in_calibration)
+
+		with self.subTest("no flag column"):
+			results = self._make_results().drop(columns=["net_revenue_flag"])
+			self.assertIs(self._load_per_record(results).in_calibration, False)
+			self.assertIs(self._load(results, "columnar").in_calibration, False)
+
+	def test_missing_values_in_required_columns(self):
+		results = self._make_results()
+		results.loc[2, "xland"] = numpy.nan
+		result_set = models.ResultSet.objects.create(model_run=self.model_run)
+		with mock.patch.object(settings, "RESULT_STORAGE", "records"):
+			with self.assertRaisesRegex(ValueError, "xland"):
+				self.model_run._load_df(results_df=results, result_set=result_set)
+
+		self.assertFalse(models.ResultSet.objects.filter(id=result_set.id).exists())  # cleaned up
+		self.assertEqual(models.Result.objects.count(), 0)
+
+		with mock.patch.object(settings, "RESULT_STORAGE", "records"):
+			with self.assertRaisesRegex(ValueError, "xland"):
+				self.model_run._load_df(results_df=results.drop(columns=["xland"]),
+				                        result_set=models.ResultSet.objects.create(model_run=self.model_run))
@@ -0,0 +1,42 @@
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.test import TestCase
+
+from waterspout_api import memberships, models
+
+
+class MembershipCacheTestCase(TestCase):
+
+	def setUp(self):
+		cache.clear()
+		self.organization = models.Organization.objects.create(name="membership_test", group=Group.objects.create(name="membership_test"))
+		self.user = User.objects.create(username="membership_test")
+
+	def _fresh_user(self):
+		return User.objects.get(pk=self.user.pk)  # like the user on a new request
+
+	def test_memberships_are_cached(self):
+		self.organization.add_member(self.user)
+		self.assertEqual(memberships.get_organization_ids(self._fresh_user()), {self.organization.id})
+
+		user = self._fresh_user()
+		with self.assertNumQueries(0):
+			self.assertTrue(self.organization.has_member(user))
+
+	def test_group_changes_clear_the_cache(self):
+		self.assertFalse(self.organization.has_member(self._fresh_user()))
+
+		self.organization.add_member(self.user)  # from the group's side
+		self.assertTrue(self.organization.has_member(self._fresh_user()))
+
+		self.user.groups.clear()  # from the user's side
+		self.assertFalse(self.organization.has_member(self._fresh_user()))
+
+	def test_organization_changes_clear_the_cache(self):
+		other_group = Group.objects.create(name="membership_test_other")
+		self.user.groups.add(other_group)
+		self.assertFalse(self.organization.has_member(self._fresh_user()))
+
+		self.organization.group = other_group
+		self.organization.save()
+		self.assertTrue(self.organization.has_member(self._fresh_user()))
@@ -0,0 +1,97 @@
+from unittest import mock
+
+import pandas
+from django.contrib.auth.models import User, Group
+from django.test import TestCase
+
+from Waterspout import settings
+from waterspout_api import models
+
+
+class ModelRunMemoizationTestCase(TestCase):
+
+	def setUp(self):
+		self.organization = models.Organization.objects.create(name="memoization_test", group=Group.objects.create(name="memoization_test"))
+		self.model_area = models.ModelArea(name="memoization_test", organization=self.organization, map_center_longitude=1,
+		                                   map_center_latitude=1, map_default_zoom=1)
+		self.model_area.save()
+		self.calibration_set = models.CalibrationSet.objects.create(model_area=self.model_area)
+		self.regions = [
+			models.Region.objects.create(name="Rainfall", internal_id="1", model_area=self.model_area, supports_rainfall=True),
+			models.Region.objects.create(name="Irrigated", internal_id="2", model_area=self.model_area, supports_rainfall=False),
+		]
+		self.crop = models.Crop.objects.create(name="Alfalfa", crop_code="ALF", model_area=self.model_area)
+		self.user = User.objects.create(username="memoization_test")
+
+	def _make_run(self, land_proportion=1.0, price_proportion=1.0):
+		model_run = models.ModelRun.objects.create(name="memoization", user=self.user, organization=self.organization,
+		                                           calibration_set=self.calibration_set)
+		models.RegionModification.objects.create(model_run=model_run)
+		models.RegionModification.objects.create(model_run=model_run, region=self.regions[0], land_proportion=land_proportion)
+		models.CropModification.objects.create(model_run=model_run)
+		models.CropModification.objects.create(model_run=model_run, crop=self.crop, price_proportion=price_proportion)
+		return model_run
+
+	def _get_fingerprint(self, model_run):
+		return models.ModelRun.objects.get(pk=model_run.pk).get_input_fingerprint()  # freshly loaded, like the run processor
+
+	def _load_results(self, model_run):
+		results = pandas.DataFrame({
+			"g": ["1", "2"], "i": ["ALF", "ALF"], "year": [2020, 2020], "p": [1.5, 1.5], "y": [2.5, 2.5],
+			"xland": [100.0, 50.0], "xlandsc": [90.0, 45.0], "xwatersc": [200.0, 100.0], "water_per_acre": [2.0, 2.0],
+			"gross_revenue": [1000.0, 500.0], "net_revenue": [500.0, 250.0], "net_revenue_flag": [1.0, 1.0],
+		})
+		result_set = model_run._load_df(results_df=results, result_set=models.ResultSet.objects.create(model_run=model_run))
+		result_set.input_fingerprint = self._get_fingerprint(model_run)
+		result_set.save(update_fields=["input_fingerprint"])
+		return result_set
+
+	def test_identical_runs_share_a_fingerprint(self):
+		self.assertEqual(self._get_fingerprint(self._make_run()), self._get_fingerprint(self._make_run()))
+
+	def test_identical_runs_reuse_results(self):
+		result_set = self._load_results(self._make_run())
+		model_run = self._make_run()
+
+		with mock.patch.object(settings, "MEMOIZE_MODEL_RUN_RESULTS", True):
+			model_run.run()
+
+		model_run.refresh_from_db()
+		self.assertTrue(model_run.complete)
+		copied = model_run.results.get()
+		self.assertNotEqual(copied.id, result_set.id)
+		self.assertEqual(copied.input_fingerprint, result_set.input_fingerprint)
+		self.assertTrue(copied.as_data_frame().equals(result_set.as_data_frame()))
+
+	def test_changed_inputs_change_the_fingerprint(self):
+		fingerprint = self._get_fingerprint(self._make_run())
+		seen = {fingerprint}
+
+		changed_runs = {
+			"region modification": self._make_run(land_proportion=0.5),
+			"crop modification": self._make_run(price_proportion=1.5),
+		}
+		for name, model_run in changed_runs.items():
+			with self.subTest(name):
+				self.assertNotIn(self._get_fingerprint(model_run), seen)
+				seen.add(self._get_fingerprint(model_run))
+
+		model_run = self._make_run()
+		self.assertEqual(self._get_fingerprint(model_run), fingerprint)
+
+		self.calibration_set.bump_data_version()  # the calibration data changed
+		with self.subTest("calibration data"):
+			self.assertNotIn(self._get_fingerprint(model_run), seen)
+			seen.add(self._get_fingerprint(model_run))
+
+		# only the second region's flag changes - the model area as a whole already supported rainfall
+		self.regions[1].supports_rainfall = True
+		self.regions[1].save()
+		with self.subTest("region supports rainfall"):
+			self.assertNotIn(self._get_fingerprint(model_run), seen)
+			seen.add(self._get_fingerprint(model_run))
+
+		self.regions[1].supports_irrigation = False
+		self.regions[1].save()
+		with self.subTest("region supports irrigation"):
+			self.assertNotIn(self._get_fingerprint(model_run), seen)
@@ -0,0 +1,42 @@
+from django.test import TestCase
+
+from waterspout_api import feature_packages, models
+
+
+class ModelAreaMetadataTestCase(TestCase):
+
+	def setUp(self):
+		self.model_area = models.ModelArea(name="metadata_test", map_center_longitude=1, map_center_latitude=1, map_default_zoom=1)
+		self.model_area.save()
+		self.region = models.Region.objects.create(name="Region", internal_id="1", model_area=self.model_area,
+		                                           supports_rainfall=False, supports_irrigation=True)
+
+	def _fresh_model_area(self):
+		return models.ModelArea.objects.get(pk=self.model_area.pk)  # like the model area on a new request
+
+	def test_metadata_is_cached(self):
+		model_area = self._fresh_model_area()
+		self.assertFalse(model_area.supports_rainfall)
+
+		model_area = self._fresh_model_area()
+		with self.assertNumQueries(0):
+			self.assertFalse(model_area.supports_rainfall)
+			self.assertTrue(model_area.supports_irrigation)
+			self.assertTrue(model_area.preference_values["shared_model_runs"])
+			self.assertEqual(model_area.preference_values["model_area"], self.model_area.id)
+
+	def test_region_changes_update_metadata(self):
+		self.assertFalse(self._fresh_model_area().supports_rainfall)
+
+		self.region.supports_rainfall = True
+		self.region.save()
+		self.assertTrue(self._fresh_model_area().supports_rainfall)
+
+	def test_preference_changes_update_metadata(self):
+		model_area = self._fresh_model_area()
+		self.assertTrue(model_area.preference_values["shared_model_runs"])
+
+		model_area.feature_package_name = "ISOLATED_PUBLIC"
+		feature_packages.update_feature_package(model_area)
+		self.assertFalse(self._fresh_model_area().preference_values["shared_model_runs"])
+		self.assertFalse(model_area.preference_values["shared_model_runs"])  # even on instances loaded before the change
@@ -0,0 +1,71 @@
+import datetime
+
+from django.contrib.auth.models import User, Group
+from django.test import TestCase
+from django.utils import timezone
+
+from waterspout_api import filters, models, serializers
+
+
+class ModelRunListingTestCase(TestCase):
+
+	def setUp(self):
+		group = Group.objects.create(name="listing_test")
+		self.organization = models.Organization.objects.create(name="listing_test", group=group)
+		self.model_area = models.ModelArea(name="listing_test", map_center_longitude=1, map_center_latitude=1, map_default_zoom=1)
+		self.model_area.save()
+		self.calibration_set = models.CalibrationSet.objects.create(model_area=self.model_area)
+		self.user = User.objects.create(username="listing_test")
+		self.region = models.Region.objects.create(name="Region", internal_id="1", model_area=self.model_area)
+		self.crop = models.Crop.objects.create(name="Crop", crop_code="CROP", model_area=self.model_area)
+		self.group_set = models.RegionGroupSet.objects.create(name="listing_test", model_area=self.model_area)
+
+	def _make_run(self, land_proportions, price_proportions):
+		model_run = models.ModelRun.objects.create(name="listing", user=self.user, organization=self.organization,
+		                                           calibration_set=self.calibration_set)
+		for index, land_proportion in enumerate(land_proportions):  # each needs its own group to be unique
+			region_group = models.RegionGroup.objects.create(name=f"group {model_run.id}-{index}", group_set=self.group_set) if index else None
+			models.RegionModification.objects.create(model_run=model_run, region=self.region, region_group=region_group, land_proportion=land_proportion)
+		for price_proportion in price_proportions:
+			models.CropModification.objects.create(model_run=model_run, crop=self.crop, price_proportion=price_proportion)
+		return model_run
+
+	def test_annotated_averages_match(self):
+		with_modifications = self._make_run([0.5, 1.5, 1.0], [2.0])
+		without_modifications = self._make_run([], [])
+
+		annotated = {model_run.id: model_run for model_run in models.ModelRun.objects.with_listing_data()}
+		for model_run in (with_modifications, without_modifications):
+			for field in ("land_modifications_average", "water_modifications_average", "price_modifications_average", "yield_modifications_average"):
+				self.assertAlmostEqual(getattr(annotated[model_run.id], field), getattr(model_run, field))
+		self.assertAlmostEqual(annotated[without_modifications.id].land_modifications_average, 0)
+
+	def test_listing_query_count_is_constant(self):
+		for index in range(5):
+			self._make_run([1.0, 0.5], [1.0])
+
+		# the model runs, then their region and crop modifications
+		with self.assertNumQueries(3):
+			serializers.ModelRunSerializer(models.ModelRun.objects.with_listing_data().order_by("id"), many=True).data
+
+	def test_filters(self):
+		first = self._make_run([], [])
+		first.name = "Drought scenario"
+		first.is_base = True
+		first.save()
+		second = self._make_run([], [])
+
+		def filtered(**params):
+			return [model_run.id for model_run in filters.ModelRunFilter(params, queryset=models.ModelRun.objects.order_by("id")).qs]
+
+		self.assertEqual(filtered(search="drought"), [first.id])
+		self.assertEqual(filtered(is_base="false"), [second.id])
+		self.assertEqual(filtered(user=str(self.user.id)), [first.id, second.id])
+
+	def test_changed_since(self):
+		model_run = self._make_run([], [])
+		checked_at = timezone.now()
+		self.assertEqual(list(filters.ModelRunFilter({"changed_since": checked_at.isoformat()}, queryset=models.ModelRun.objects.all()).qs), [])
+
+		models.ModelRun.objects.filter(pk=model_run.pk).update(date_modified=checked_at + datetime.timedelta(seconds=1))
+		self.assertEqual(list(filters.ModelRunFilter({"changed_since": checked_at.isoformat()}, queryset=models.ModelRun.objects.all()).qs), [model_run])
@@ -0,0 +1,108 @@
+import decimal
+import tempfile
+from unittest import mock
+
+import pandas
+from django.db.models import DecimalField
+from django.test import TestCase
+
+from waterspout_api import data_cache, models
+
+
+def make_record(record_model, value, **kwargs):
+	# every required decimal field gets the value unless it's given
+	fields = {field.name: value for field in record_model._meta.concrete_fields
+	          if isinstance(field, DecimalField) and not field.null and not field.has_default()}
+	fields.update(kwargs)
+	return record_model.objects.create(year=2020, **fields)
+
+
+def per_record_data_frame(record_set, exclude_regions=None):
+	"""
+		The way RecordSet.as_data_frame used to build the data frame - one record at a time, following the foreign
+		keys on each. Kept here so we can check the values_list version against it
+	"""
+	record_model = getattr(models, record_set.record_model_name)
+	fields = [f.name for f in record_model._meta.get_fields()]
+	basic_fields = list(set(fields) - set(["region", "crop", "rainfall_set"]))
+
+	output = []
+	for record in getattr(record_set, record_set.reverse_name).all():
+		if exclude_regions and record.region.internal_id in exclude_regions:
+			continue
+
+		output_dict = {}
+		for field in basic_fields:
+			field_value = getattr(record, field)
+			output_dict[field] = float(field_value) if type(field_value) is decimal.Decimal else field_value
+		output_dict["i"] = record.crop.crop_code
+		output_dict["g"] = record.region.internal_id
+		output.append(output_dict)
+
+	return pandas.DataFrame(output)
+
+
+class RecordSetDataFrameTestCase(TestCase):
+
+	def setUp(self):
+		self.model_area = models.ModelArea(name="record_set_test", map_center_longitude=1, map_center_latitude=1, map_default_zoom=1)
+		self.model_area.save()
+		self.regions = [models.Region.objects.create(name=f"Region {internal_id}", internal_id=internal_id, model_area=self.model_area)
+		                for internal_id in ("1", "2")]
+		self.crops = [models.Crop.objects.create(name=crop_code, crop_code=crop_code, model_area=self.model_area)
+		              for crop_code in ("ALF", "CORN")]
+
+		self.calibration_set = models.CalibrationSet.objects.create(model_area=self.model_area)
+		self.rainfall_set = models.RainfallSet.objects.create(model_area=self.model_area)
+		for index, (region, crop) in enumerate([(region, crop) for region in self.regions for crop in self.crops]):
+			make_record(models.CalibratedParameter, decimal.Decimal("1.25") + index, calibration_set=self.calibration_set,
+			            region=region, crop=crop, xland=decimal.Decimal("1234.5678901234") * (index + 1),
+			            omegaestablish=decimal.Decimal("5.5") if index % 2 else None)
+			make_record(models.RainfallParameter, decimal.Decimal("0.5") + index, rainfall_set=self.rainfall_set,
+			            region=region, crop=crop)
+
+	def _assert_matches_per_record(self, record_set, exclude_regions=None):
+		df = record_set.as_data_frame(exclude_regions=exclude_regions)
+		expected = per_record_data_frame(record_set, exclude_regions=exclude_regions)
+
+		record_model = getattr(models, record_set.record_model_name)
+		for field in record_model._meta.concrete_fields:
+			if isinstance(field, DecimalField) and df[field.name].notna().any():  # the model does math with these
+				self.assertTrue(pandas.api.types.is_float_dtype(df[field.name]), field.name)
+		self.assertTrue(pandas.api.types.is_string_dtype(df["g"]))
+		self.assertTrue(pandas.api.types.is_string_dtype(df["i"]))
+
+		# the same columns, values and types as building it record by record - including the set itself in its column
+		df = df.sort_values(["g", "i"]).reset_index(drop=True)
+		expected = expected.sort_values(["g", "i"]).reset_index(drop=True)
+		pandas.testing.assert_frame_equal(df, expected, check_like=True)
+		return df
+
+	def test_calibration_set_matches_per_record(self):
+		df = self._assert_matches_per_record(self.calibration_set)
+		self.assertEqual(len(df), 4)
+		self.assertEqual(df["omegaestablish"].isna().sum(), 2)  # nulls come through as NaN
+
+	def test_rainfall_set_matches_per_record(self):
+		self.assertEqual(len(self._assert_matches_per_record(self.rainfall_set)), 4)
+
+	def test_excluded_regions_match_per_record(self):
+		df = self._assert_matches_per_record(self.calibration_set, exclude_regions=["1"])
+		self.assertEqual(list(df["g"].unique()), ["2"])
+
+	def test_columns_without_values_stay_empty(self):
+		df = self._assert_matches_per_record(self.calibration_set)
+		self.assertTrue(df["omegacash"].isna().all())  # never set on any record
+
+	def test_cached_data_frames_match(self):
+		with tempfile.TemporaryDirectory() as folder:
+			cache = data_cache.DataFrameCache(max_items=4, folder=folder)
+			with mock.patch.object(data_cache, "record_set_frames", cache):
+				pandas.testing.assert_frame_equal(self.calibration_set.as_cached_data_frame(exclude_regions=["1"]),
+				                                  self.calibration_set.as_data_frame(exclude_regions=["1"]))
+				cache.clear()  # and from the copy on disk
+				pandas.testing.assert_frame_equal(self.calibration_set.as_cached_data_frame(exclude_regions=["1"]),
+				                                  self.calibration_set.as_data_frame(exclude_regions=["1"]))
+
+	def test_empty_sets_have_no_columns(self):
+		self.assertEqual(len(models.CalibrationSet.objects.create(model_area=self.model_area).as_data_frame().columns), 0)
@@ -0,0 +1,88 @@
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from waterspout_api import memberships, models, resolution, views
+
+
+class ResolutionContextTestCase(TestCase):
+
+	def setUp(self):
+		cache.clear()
+		self.organization = models.Organization.objects.create(name="resolution_test", group=Group.objects.create(name="resolution_test"))
+		self.model_area = models.ModelArea(name="resolution_test", organization=self.organization, map_center_longitude=1,
+		                                   map_center_latitude=1, map_default_zoom=1)
+		self.model_area.save()
+		self.calibration_set = models.CalibrationSet.objects.create(model_area=self.model_area)
+		self.user = User.objects.create(username="resolution_test")
+		self.organization.add_member(self.user)
+		self.model_run = models.ModelRun.objects.create(name="resolution", user=self.user, organization=self.organization,
+		                                                calibration_set=self.calibration_set)
+
+	def _make_view(self, method, data=None):
+		request = Request(getattr(APIRequestFactory(), method)(f"/api/model_runs/{self.model_run.id}/", data, format="json"), parsers=[JSONParser()])
+		request.user = User.objects.get(pk=self.user.pk)
+		# memberships and preferences have their own caches - leave them out of the counts
+		memberships.get_organization_ids(request.user)
+		self.model_area.refresh_from_db()
+		self.model_area.preference_values
+
+		view = views.ModelRunViewSet(kwargs={"pk": str(self.model_run.id)}, request=request, format_kwarg=None, action="partial_update")
+		return view, request
+
+	def test_items_load_once_with_related_objects(self):
+		context = resolution.ResolutionContext()
+		self.model_area.refresh_from_db()
+		self.model_area.preference_values
+		with self.assertNumQueries(1):
+			model_run = context.get_item(models.ModelRun, self.model_run.id)
+			self.assertIs(context.get_item(models.ModelRun, str(self.model_run.id)), model_run)
+			self.assertEqual(resolution.get_organization_id(model_run), self.organization.id)
+			self.assertTrue(resolution.get_model_area(model_run).preference_values["create_or_modify_model_runs"])
+
+		with self.assertNumQueries(0):
+			self.assertIsNone(context.get_item(models.ModelRun, "not a number"))
+
+	def test_model_run_write_permissions_share_lookups(self):
+		view, request = self._make_view("patch", {"name": "renamed"})
+
+		# the model run (with its calibration set and model area), then its region modifications
+		with self.assertNumQueries(2):
+			view.check_permissions(request)
+			self.assertEqual(view.get_object(), self.model_run)
+
+	def test_missing_model_runs_are_not_found(self):
+		self.model_run.id += 1000
+		view, request = self._make_view("patch", {"name": "renamed"})
+
+		view.check_permissions(request)
+		with self.assertRaises(views.Http404):
+			view.get_object()
+
+	def test_related_paths_skip_reverse_relations(self):
+		self.assertEqual(resolution.get_related_paths(models.CalibrationSet), ["model_area"])
+		self.assertEqual(resolution.get_related_paths(models.ModelRun), ["calibration_set__model_area"])
+
+	def test_create_model_run(self):
+		client = APIClient()
+		client.force_authenticate(user=self.user)
+		request_data = {
+			"ready": False,
+			"calibration_set": self.calibration_set.id,
+			"organization": self.organization.id,
+			"region_modifications": [],
+			"crop_modifications": [],
+			"name": "created",
+		}
+		response = client.post("/api/model_runs/", request_data, format="json")
+		self.assertEqual(response.status_code, 201)
+		self.assertEqual(models.ModelRun.objects.get(pk=response.data["id"]).calibration_set_id, self.calibration_set.id)
+
+		other_model_area = models.ModelArea(name="resolution_test_other", map_center_longitude=1, map_center_latitude=1, map_default_zoom=1)
+		other_model_area.save()
+		request_data["calibration_set"] = models.CalibrationSet.objects.create(model_area=other_model_area).id
+		response = client.post("/api/model_runs/", request_data, format="json")
+		self.assertEqual(response.status_code, 403)  # the calibration set isn't in the organization
@@ -0,0 +1,152 @@
+import datetime
+import logging
+from unittest import mock
+
+from django.contrib.auth.models import User, Group
+from django.test import TestCase
+from django.utils import timezone
+
+from waterspout_api import models, scheduling
+from waterspout_api.management.commands import process_runs
+
+log = logging.getLogger("waterspout.tests")
+
+
+class RunQueueTestCase(TestCase):
+	"""
+		Base class with an organization, model area, and user to attach model runs to
+	"""
+
+	def setUp(self):
+		self.group = Group(name="claim_test")
+		self.group.save()
+		self.organization = models.Organization(name="claim_test", group=self.group)
+		self.organization.save()
+		self.model_area = models.ModelArea(name="claim_test", map_center_longitude=1, map_center_latitude=1, map_default_zoom=1)
+		self.model_area.save()
+		self.calibration_set = models.CalibrationSet(model_area=self.model_area)
+		self.calibration_set.save()
+		self.user = User(username="claim_test")
+		self.user.save()
+
+	def _make_run(self, name, user=None, organization=None, **kwargs):
+		return models.ModelRun.objects.create(name=name,
+		                                      ready=True,
+		                                      user=user or self.user,
+		                                      organization=organization or self.organization,
+		                                      calibration_set=self.calibration_set,
+		                                      **kwargs)
+
+
+class ModelRunClaimTestCase(RunQueueTestCase):
+
+	def test_run_is_only_claimed_once(self):
+		run = self._make_run("claim once")
+
+		claimed = models.ModelRun.objects.claim_next("worker-1")
+		self.assertEqual(claimed.id, run.id)
+		self.assertTrue(claimed.running)
+		self.assertEqual(claimed.claimed_by, "worker-1")
+
+		# nothing else is waiting, so a second worker shouldn't get anything - including the run we just claimed
+		self.assertIsNone(models.ModelRun.objects.claim_next("worker-2"))
+		self.assertIsNone(models.ModelRun.objects.claim_next("worker-2", candidate_ids=[run.id]))
+
+	def test_claims_oldest_first_and_skips_claimed_candidates(self):
+		first = self._make_run("first")
+		second = self._make_run("second")
+
+		self.assertEqual(models.ModelRun.objects.claim_next("worker-1").id, first.id)
+		# even if the candidates list still has the first run in it (a stale read), we should move past it
+		self.assertEqual(models.ModelRun.objects.claim_next("worker-2", candidate_ids=[first.id, second.id]).id, second.id)
+
+	def test_release_claims(self):
+		run = self._make_run("release")
+		models.ModelRun.objects.claim_next("worker-1")
+
+		self.assertEqual(models.ModelRun.objects.release_claims("worker-1"), 1)
+		run.refresh_from_db()
+		self.assertFalse(run.running)
+		self.assertEqual(models.ModelRun.objects.claim_next("worker-2").id, run.id)
+
+	def test_release_stale_claims(self):
+		stale_run = self._make_run("stale")
+		models.ModelRun.objects.claim_next("worker-1")
+		models.ModelRun.objects.filter(id=stale_run.id).update(date_claimed=timezone.now() - datetime.timedelta(hours=2))
+		fresh_run = self._make_run("fresh")
+		models.ModelRun.objects.claim_next("worker-2")
+
+		self.assertEqual(models.ModelRun.objects.release_stale_claims(60 * 60), 1)
+		stale_run.refresh_from_db()
+		fresh_run.refresh_from_db()
+		self.assertFalse(stale_run.running)
+		self.assertIsNone(stale_run.claimed_by)
+		self.assertTrue(fresh_run.running)  # still within the timeout, so its worker could still be solving it
+
+	def test_processor_releases_claims_when_stopped(self):
+		run = self._make_run("stopped")
+		command = process_runs.Command()
+		command._worker_id = "worker-1"
+
+		def claim_then_stop():  # like getting SIGTERM partway through solving a run
+			models.ModelRun.objects.claim_next("worker-1")
+			raise SystemExit(0)
+
+		with mock.patch.object(command, "_process_runs", claim_then_stop):
+			with self.assertRaises(SystemExit):
+				command.process_runs()
+
+		run.refresh_from_db()
+		self.assertFalse(run.running)
+		self.assertEqual(models.ModelRun.objects.claim_next("worker-2").id, run.id)
+
+
+class FairShareSchedulerTestCase(RunQueueTestCase):
+
+	def test_single_run_not_stuck_behind_bulk_submission(self):
+		bulk_runs = [self._make_run(f"bulk {i}") for i in range(5)]
+		other_user = User(username="claim_test_other")
+		other_user.save()
+		single_run = self._make_run("single", user=other_user)
+
+		scheduler = scheduling.FairShareScheduler(batch_size=8, organization_weights={})
+		self.assertEqual(scheduler.get_batch(), [bulk_runs[0].id, single_run.id] + [run.id for run in bulk_runs[1:]])
+
+		# batches are capped
+		self.assertEqual(len(scheduling.FairShareScheduler(batch_size=3, organization_weights={}).get_batch()), 3)
+
+	def test_organization_weights(self):
+		bulk_runs = [self._make_run(f"bulk {i}") for i in range(3)]
+		other_user = User(username="claim_test_other")
+		other_user.save()
+		other_organization = models.Organization.objects.create(name="claim_test_other", group=Group.objects.create(name="claim_test_other"))
+		single_run = self._make_run("single", user=other_user, organization=other_organization)
+
+		# with equal weights, the users take turns
+		scheduler = scheduling.FairShareScheduler(batch_size=8, organization_weights={})
+		self.assertEqual(scheduler.get_batch(), [bulk_runs[0].id, single_run.id, bulk_runs[1].id, bulk_runs[2].id])
+
+		# with weight 2, the bulk submitter's organization gets two runs before the other organization's one
+		scheduler = scheduling.FairShareScheduler(batch_size=8, organization_weights={self.organization.id: 2})
+		self.assertEqual(scheduler.get_batch(), [bulk_runs[0].id, bulk_runs[1].id, single_run.id, bulk_runs[2].id])
+
+		# and weighting the other organization instead puts its run first, even though it was submitted last
+		scheduler = scheduling.FairShareScheduler(batch_size=8, organization_weights={other_organization.id: 2})
+		self.assertEqual(scheduler.get_batch(), [single_run.id] + [run.id for run in bulk_runs])
+
+	def test_users_alternate_across_claims(self):
+		# the run processor asks for a new batch after every claim - the bulk submitter has the oldest waiting run
+		# every time, so earlier claims need to count or they'd get every run first
+		bulk_runs = [self._make_run(f"bulk {i}") for i in range(5)]
+		other_user = User(username="claim_test_other")
+		other_user.save()
+		other_runs = [self._make_run(f"other {i}", user=other_user) for i in range(3)]
+
+		scheduler = scheduling.FairShareScheduler(batch_size=8, organization_weights={})
+		claimed = []
+		for _ in range(8):
+			claimed.append(models.ModelRun.objects.claim_next("worker-1", candidate_ids=scheduler.get_batch()).id)
+
+		self.assertEqual(claimed, [bulk_runs[0].id, other_runs[0].id, bulk_runs[1].id, other_runs[1].id,
+		                           bulk_runs[2].id, other_runs[2].id, bulk_runs[3].id, bulk_runs[4].id])
+		self.assertIsNone(models.ModelRun.objects.claim_next("worker-1", candidate_ids=scheduler.get_batch()))
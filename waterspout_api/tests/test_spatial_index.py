@@ -0,0 +1,29 @@
+from django.test import TestCase
+
+from waterspout_api import spatial_index
+
+
+def _feature(feature_id, coordinates):
+	return {"type": "Feature", "id": feature_id, "properties": {}, "geometry": {"type": "Polygon", "coordinates": coordinates}}
+
+
+class RegionIndexTestCase(TestCase):
+
+	def setUp(self):
+		self.index = spatial_index.RegionIndex([
+			_feature(1, [[[0, 0], [2, 0], [2, 2], [0, 2], [0, 0]], [[0.5, 0.5], [1.5, 0.5], [1.5, 1.5], [0.5, 1.5], [0.5, 0.5]]]),
+			_feature(2, [[[2, 0], [4, 0], [2, 2], [2, 0]]]),  # a triangle - its bounding box covers more than it does
+			_feature(3, [[[10, 10], [11, 10], [11, 11], [10, 11], [10, 10]]]),
+		])
+
+	def test_regions_in_bbox(self):
+		self.assertEqual(self.index.regions_in_bbox(1, 1, 3, 3), [1, 2])
+		self.assertEqual(self.index.regions_in_bbox(9, 9, 12, 12), [3])
+		self.assertEqual(self.index.regions_in_bbox(5, 5, 6, 6), [])
+
+	def test_regions_at(self):
+		self.assertEqual(self.index.regions_at(0.25, 0.25), [1])
+		self.assertEqual(self.index.regions_at(1, 1), [])  # in the hole
+		self.assertEqual(self.index.regions_at(2.5, 0.5), [2])
+		self.assertEqual(self.index.regions_at(3.5, 1.5), [])  # inside the triangle's bounding box, but outside it
+		self.assertEqual(self.index.regions_at(10.5, 10.5), [3])
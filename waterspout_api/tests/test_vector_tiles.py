@@ -0,0 +1,38 @@
+import numpy
+
+from django.test import TestCase
+
+from waterspout_api import vector_tiles
+
+
+def _square(feature_id, longitude):
+	return {
+		"id": feature_id,
+		"properties": {"region_id": feature_id, "name": f"Region {feature_id}", "NAME": "not in tiles"},
+		"geometry": {"type": "Polygon", "coordinates": [[[longitude, 0], [longitude + 1, 0], [longitude + 1, 1], [longitude, 1], [longitude, 0]]]},
+	}
+
+
+class VectorTileTestCase(TestCase):
+
+	def setUp(self):
+		self.layer = vector_tiles.SourceLayer("regions", [_square(1, 0), _square(2, 100)], ("region_id", "name"))
+
+	def test_clip_ring_to_tile(self):
+		ring = numpy.array([[-10, -10], [10, -10], [10, 10], [-10, 10]], dtype="float64")
+		clipped = vector_tiles.clip_ring(ring, 0, 5)
+
+		self.assertEqual(sorted(map(tuple, clipped.tolist())), [(0, 0), (0, 5), (5, 0), (5, 5)])
+
+	def test_tile_only_has_features_inside_it(self):
+		self.assertEqual(len(self.layer.get_features(0.5, 0.4, 0.51, 0.5)), 1)  # just east of longitude 0, north of the equator
+		self.assertEqual(vector_tiles.encode_tile([self.layer], 6, 0, 0), b"")  # nothing near the top left corner of the map
+
+	def test_ring_winding(self):
+		ring = vector_tiles.project([[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]])
+		exterior = vector_tiles.tile_ring(ring, 6, 32, 31, exterior=True)
+		hole = vector_tiles.tile_ring(ring, 6, 32, 31, exterior=False)
+
+		self.assertGreater(vector_tiles._signed_area(exterior), 0)
+		self.assertLess(vector_tiles._signed_area(hole), 0)
+		self.assertEqual(len(exterior), 4)
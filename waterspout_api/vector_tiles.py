@@ -0,0 +1,350 @@
+"""
+	Builds Mapbox Vector Tiles (https://github.com/mapbox/vector-tile-spec) of a model area's regions and region groups,
+	so maps only download the geometry they're showing instead of every region at full resolution. Everything is done
+	here with numpy, including the protocol buffer encoding - there's no tile server to run.
+
+	Each tile has two layers - "regions" and "region_groups" (the groups from every region group set, with a
+	region_group_set_id property to tell them apart). Region geometry must be longitude/latitude (which GeoJSON requires).
+
+	Tiles are stored on disk (settings.VECTOR_TILE_CACHE_FOLDER) under the model area's region and region group versions,
+	so we build each tile once, and changed regions or groups get new tiles on their own.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy
+
+from Waterspout import settings
+from waterspout_api import feature_collections, geometry
+
+log = logging.getLogger("waterspout.vector_tiles")
+
+EXTENT = 4096  # tile coordinates go from 0 to EXTENT on each axis
+BUFFER = 64  # how far past the edges of the tile we keep geometry, in tile coordinates, so borders don't show at tile edges
+MAX_LATITUDE = 85.0511287798  # web mercator stops here
+
+# geometry commands and types from the vector tile spec
+MOVE_TO = 1
+LINE_TO = 2
+CLOSE_PATH = 7
+POLYGON = 3
+
+
+class SourceLayer(object):
+	"""
+		The features for one tile layer, projected to web mercator world coordinates (0 to 1 on each axis), with each
+		feature's bounding box so we can quickly find the features in a tile
+	"""
+
+	def __init__(self, name, features, property_names):
+		"""
+		:param name: layer name in the tiles
+		:param features: GeoJSON features with Polygon or MultiPolygon geometry in longitude/latitude
+		:param property_names: which of the features' properties to put in the tiles
+		"""
+		self.name = name
+		self.features = []
+		bounds = []
+		for feature in features:
+			polygons = [[project(ring) for ring in polygon if len(ring) > 0] for polygon in geometry.get_polygons(feature["geometry"])]
+			polygons = [polygon for polygon in polygons if len(polygon) > 0]
+			if len(polygons) == 0:
+				continue
+
+			points = numpy.concatenate([polygon[0] for polygon in polygons])
+			bounds.append(numpy.concatenate([points.min(axis=0), points.max(axis=0)]))
+			properties = {name: feature["properties"][name] for name in property_names if feature["properties"].get(name) is not None}
+			self.features.append((feature["id"], properties, polygons))
+
+		self.bounds = numpy.array(bounds, dtype="float64").reshape(-1, 4)  # min x, min y, max x, max y
+
+	def get_features(self, min_x, min_y, max_x, max_y):
+		"""
+			The features whose bounding boxes overlap the area, in world coordinates
+		"""
+		overlaps = (self.bounds[:, 0] <= max_x) & (self.bounds[:, 2] >= min_x) & (self.bounds[:, 1] <= max_y) & (self.bounds[:, 3] >= min_y)
+		return [self.features[index] for index in numpy.flatnonzero(overlaps)]
+
+
+def project(ring):
+	"""
+		Projects longitude/latitude coordinates to web mercator world coordinates - 0 to 1 on each axis, with y going down
+	:param ring: list of [longitude, latitude] coordinates
+	:return: numpy array of shape (n, 2)
+	"""
+	coordinates = numpy.asarray(ring, dtype="float64")[:, :2]
+	x = (coordinates[:, 0] + 180) / 360
+	latitude = numpy.radians(numpy.clip(coordinates[:, 1], -MAX_LATITUDE, MAX_LATITUDE))
+	y = (1 - numpy.log(numpy.tan(latitude) + 1 / numpy.cos(latitude)) / numpy.pi) / 2
+	return numpy.column_stack([x, y])
+
+
+def clip_ring(points, minimum, maximum):
+	"""
+		Clips a closed ring to a square with Sutherland-Hodgman clipping, one edge of the square at a time
+	:param points: numpy array of shape (n, 2) - the last point may repeat the first or not
+	:param minimum: smallest x and y to keep
+	:param maximum: largest x and y to keep
+	:return: numpy array of the clipped ring's points, not closed - empty if nothing is left
+	"""
+	if len(points) > 1 and numpy.array_equal(points[0], points[-1]):
+		points = points[:-1]
+
+	for axis, bound, keep_below in ((0, minimum, False), (0, maximum, True), (1, minimum, False), (1, maximum, True)):
+		if len(points) == 0:
+			break
+		following = numpy.roll(points, -1, axis=0)
+		inside = points[:, axis] <= bound if keep_below else points[:, axis] >= bound
+		following_inside = numpy.roll(inside, -1)
+
+		# each segment adds where it crosses the edge (if it does), then its end point (if that's inside)
+		crossing = inside != following_inside
+		change = following[:, axis] - points[:, axis]
+		fraction = numpy.divide(bound - points[:, axis], change, out=numpy.zeros(len(points)), where=change != 0)
+		intersections = points + (following - points) * fraction[:, None]
+		intersections[:, axis] = bound
+
+		candidates = numpy.stack([intersections, following], axis=1).reshape(-1, 2)
+		keep = numpy.stack([crossing, following_inside], axis=1).reshape(-1)
+		points = candidates[keep]
+
+	return points
+
+
+def _signed_area(points):
+	# positive for rings that go clockwise on screen (y down) - the spec's winding for exterior rings
+	following = numpy.roll(points, -1, axis=0)
+	return float(numpy.sum(points[:, 0] * following[:, 1] - following[:, 0] * points[:, 1])) / 2
+
+
+def tile_ring(ring, z, x, y, exterior):
+	"""
+		Moves a projected ring into the tile's coordinates, clipped, simplified, and rounded to whole numbers
+	:param ring: numpy array of world coordinates
+	:param exterior: True for a polygon's outside ring, False for holes - sets which way the ring winds
+	:return: numpy array of integer tile coordinates (not closed), or None if nothing is left of the ring in this tile
+	"""
+	points = (ring * (2 ** z) - (x, y)) * EXTENT
+	points = clip_ring(points, -BUFFER, EXTENT + BUFFER)
+	if len(points) < 3:
+		return None
+
+	closed = numpy.concatenate([points, points[:1]])
+	closed = geometry.douglas_peucker(closed, settings.VECTOR_TILE_SIMPLIFICATION)
+	points = numpy.round(closed[:-1]).astype("int64")
+
+	keep = numpy.any(points != numpy.roll(points, 1, axis=0), axis=1)  # drop repeated points, including the start and end
+	points = points[keep]
+	if len(points) < 3:
+		return None
+
+	area = _signed_area(points)
+	if area == 0:
+		return None
+	if (area > 0) != exterior:
+		points = points[::-1]
+	return points
+
+
+def _zigzag(value):
+	return (value << 1) if value >= 0 else ((-value) << 1) - 1
+
+
+def _varint(value):
+	encoded = bytearray()
+	while value > 0x7f:
+		encoded.append((value & 0x7f) | 0x80)
+		value >>= 7
+	encoded.append(value)
+	return bytes(encoded)
+
+
+def _field(number, payload):
+	# length delimited field (wire type 2) - strings, nested messages, and packed numbers
+	return _varint((number << 3) | 2) + _varint(len(payload)) + payload
+
+
+def _uint_field(number, value):
+	return _varint(number << 3) + _varint(value)
+
+
+def _packed(number, values):
+	return _field(number, b"".join(_varint(value) for value in values))
+
+
+def _encode_value(value):
+	if isinstance(value, bool):
+		return _uint_field(7, int(value))
+	if isinstance(value, int):
+		return _uint_field(6, _zigzag(value))  # sint64
+	if isinstance(value, float):
+		return _varint((3 << 3) | 1) + numpy.float64(value).tobytes()  # double, little endian
+	return _field(1, str(value).encode("utf-8"))
+
+
+def encode_polygons(rings):
+	"""
+		Encodes rings as vector tile geometry commands
+	:param rings: list of numpy arrays of integer tile coordinates, each polygon's outside ring followed by its holes
+	:return: list of command integers
+	"""
+	commands = []
+	cursor = numpy.zeros(2, dtype="int64")
+	for ring in rings:
+		deltas = numpy.diff(numpy.concatenate([cursor[None, :], ring]), axis=0)
+		cursor = ring[-1]
+		commands.append(MOVE_TO | (1 << 3))
+		commands.extend(_zigzag(int(value)) for value in deltas[0])
+		commands.append(LINE_TO | ((len(ring) - 1) << 3))
+		commands.extend(_zigzag(int(value)) for value in deltas[1:].ravel())
+		commands.append(CLOSE_PATH | (1 << 3))
+	return commands
+
+
+def encode_layer(source_layer, z, x, y):
+	"""
+		Encodes the part of source_layer inside a tile as a vector tile layer
+	:return: the encoded layer, or None if nothing in the layer is in this tile
+	"""
+	scale = 2 ** z
+	buffer = BUFFER / EXTENT
+	features = source_layer.get_features((x - buffer) / scale, (y - buffer) / scale, (x + 1 + buffer) / scale, (y + 1 + buffer) / scale)
+
+	keys = {}
+	values = {}
+	encoded_features = []
+	for feature_id, properties, polygons in features:
+		rings = []
+		for polygon in polygons:
+			exterior = tile_ring(polygon[0], z, x, y, exterior=True)
+			if exterior is None:
+				continue
+			rings.append(exterior)
+			for hole in polygon[1:]:
+				hole = tile_ring(hole, z, x, y, exterior=False)
+				if hole is not None:
+					rings.append(hole)
+		if len(rings) == 0:
+			continue
+
+		tags = []
+		for key, value in properties.items():
+			tags.append(keys.setdefault(key, len(keys)))
+			tags.append(values.setdefault((type(value), value), len(values)))
+
+		encoded_features.append(_field(2,
+			_uint_field(1, feature_id) + _packed(2, tags) + _uint_field(3, POLYGON) + _packed(4, encode_polygons(rings))
+		))
+
+	if len(encoded_features) == 0:
+		return None
+
+	return b"".join([
+		_uint_field(15, 2),  # version
+		_field(1, source_layer.name.encode("utf-8")),
+		*encoded_features,
+		*[_field(3, key.encode("utf-8")) for key in keys],
+		*[_field(4, _encode_value(value)) for value_type, value in values],
+		_uint_field(5, EXTENT),
+	])
+
+
+def encode_tile(source_layers, z, x, y):
+	"""
+		Builds a vector tile
+	:param source_layers: list of SourceLayers
+	:param z: zoom
+	:param x: tile column, from the left
+	:param y: tile row, from the top
+	:return: bytes - empty when there's nothing in the tile
+	"""
+	layers = [encode_layer(source_layer, z, x, y) for source_layer in source_layers]
+	return b"".join(_field(3, layer) for layer in layers if layer is not None)
+
+
+_source_layers = {}  # model area ID: (versions, SourceLayers) - just the newest versions for each model area
+_source_layers_lock = threading.Lock()
+
+
+def get_versions(model_area):
+	return f"{model_area.region_version}-{model_area.region_group_version}"
+
+
+def get_source_layers(model_area):
+	"""
+		The projected regions and region groups for the model area, reused between tiles until they change
+	"""
+	versions = get_versions(model_area)
+	with _source_layers_lock:
+		cached = _source_layers.get(model_area.id)
+	if cached is not None and cached[0] == versions:
+		return cached[1]
+
+	region_groups = []
+	for region_group_set in model_area.region_group_sets.all():
+		for feature in feature_collections.build_region_group_features(region_group_set):
+			feature["properties"]["region_group_set_id"] = region_group_set.id
+			region_groups.append(feature)
+
+	source_layers = [
+		SourceLayer("regions", feature_collections.build_region_features(model_area), ("region_id", "internal_id", "name")),
+		SourceLayer("region_groups", region_groups, ("region_group_id", "region_group_set_id", "name")),
+	]
+	with _source_layers_lock:
+		_source_layers[model_area.id] = (versions, source_layers)
+	return source_layers
+
+
+def _get_tile_folder(model_area):
+	return os.path.join(settings.VECTOR_TILE_CACHE_FOLDER, str(model_area.id), get_versions(model_area))
+
+
+def _read_tile(path):
+	try:
+		with open(path, 'rb') as tile_file:
+			return tile_file.read()
+	except OSError:
+		return None
+
+
+def _write_tile(model_area, path, tile):
+	try:
+		folder = os.path.dirname(path)
+		if not os.path.exists(_get_tile_folder(model_area)):  # first tile for these versions - clear out older ones
+			model_area_folder = os.path.dirname(_get_tile_folder(model_area))
+			if os.path.exists(model_area_folder):
+				for old_versions in os.listdir(model_area_folder):
+					shutil.rmtree(os.path.join(model_area_folder, old_versions), ignore_errors=True)
+
+		os.makedirs(folder, exist_ok=True)
+		# write to a temporary file and move it into place so other processes never read a partial tile
+		handle, temp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+		with os.fdopen(handle, 'wb') as temp_file:
+			temp_file.write(tile)
+		os.replace(temp_path, path)
+	except OSError:
+		log.warning(f"Couldn't write cached vector tile {path}", exc_info=True)
+
+
+def get_tile(model_area, z, x, y):
+	"""
+		Returns a vector tile of the model area's regions and region groups, from the disk cache if we have it
+	:param model_area: ModelArea instance, with current region and region group versions
+	:param z: zoom
+	:param x: tile column, from the left
+	:param y: tile row, from the top
+	:return: bytes - empty when there's nothing in the tile
+	"""
+	if settings.VECTOR_TILE_CACHE_FOLDER is None:
+		return encode_tile(get_source_layers(model_area), z, x, y)
+
+	path = os.path.join(_get_tile_folder(model_area), str(z), str(x), f"{y}.mvt")
+	tile = _read_tile(path)
+	if tile is None:
+		tile = encode_tile(get_source_layers(model_area), z, x, y)
+		_write_tile(model_area, path, tile)
+	return tile
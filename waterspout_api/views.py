@@ -1,17 +1,25 @@
+import gzip
+import hashlib
+import json
 import logging
+import math
 
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse, Http404
 from django.contrib.auth import get_user_model
-from django.db.models import Q, Prefetch
+from django.db.models import Q, Prefetch, prefetch_related_objects
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
 
 from rest_framework import viewsets, renderers, authentication
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.permissions import BasePermission, DjangoObjectPermissions, IsAuthenticated, IsAdminUser, SAFE_METHODS, AllowAny
 from rest_framework.views import APIView
 
@@ -20,6 +28,15 @@ from waterspout_api import models
 from waterspout_api import serializers
 from waterspout_api import support
 from waterspout_api import permissions
+from waterspout_api import exports
+from waterspout_api import feature_collections
+from waterspout_api import vector_tiles
+from waterspout_api import spatial_index
+from waterspout_api import filters
+from waterspout_api import pagination
+from waterspout_api import memberships
+from waterspout_api import resolution
+from waterspout_api.authentication import CachedTokenAuthentication
 
 log = logging.getLogger("waterspout.views")
 
@@ -56,7 +73,7 @@ class GetApplicationVariables(APIView):
 	* Requires token authentication.
 	* Only authenticated users can access
 	"""
-	authentication_classes = [authentication.TokenAuthentication]
+	authentication_classes = [CachedTokenAuthentication]
 	permission_classes = [IsAuthenticated]
 
 	def get(self, request, format=None):
@@ -149,12 +166,41 @@ class CropViewSet(viewsets.ModelViewSet):
 		return models.Crop.objects.filter(model_area__organization__in=support.get_organizations_for_user(self.request.user)).order_by("name")
 
 
+def _get_float_params(query_params, name, count):
+	"""
+		Reads a comma separated list of count numbers from the query parameter name
+	:raises ValidationError: if they're not numbers, or there aren't count of them
+	"""
+	try:
+		values = [float(value) for value in query_params[name].split(",")]
+	except ValueError:
+		values = []
+	if len(values) != count or not all(math.isfinite(value) for value in values):
+		raise ValidationError({name: f"{name} must be {count} comma separated numbers"})
+	return values
+
+
 class RegionViewSet(viewsets.ModelViewSet):
 	permission_classes = [permissions.IsInSameOrganization]
 	serializer_class = serializers.RegionSerializer
 
 	def get_queryset(self):
-		return models.Region.objects.filter(model_area__organization__in=support.get_organizations_for_user(self.request.user)).order_by("internal_id")
+		"""
+			Takes ?bbox=min_longitude,min_latitude,max_longitude,max_latitude to only get the regions in a map's
+			viewport (any region whose bounding box overlaps it)
+		:return:
+		"""
+		queryset = models.Region.objects.filter(model_area__organization__in=support.get_organizations_for_user(self.request.user)).order_by("internal_id")
+
+		if self.request.query_params.get("bbox"):
+			min_x, min_y, max_x, max_y = _get_float_params(self.request.query_params, "bbox", 4)
+			region_ids = []
+			model_area_ids = queryset.order_by().values_list("model_area_id", flat=True).distinct()
+			for model_area in models.ModelArea.objects.filter(id__in=model_area_ids):
+				region_ids.extend(spatial_index.get_region_index(model_area).regions_in_bbox(min_x, min_y, max_x, max_y))
+			queryset = queryset.filter(id__in=region_ids)
+
+		return queryset
 
 """
 class RegionGroupViewSet(viewsets.ModelViewSet):
@@ -228,6 +274,101 @@ class PassthroughRenderer(renderers.BaseRenderer):  # we need this so it won't m
 		return data
 
 
+class CSVExportRenderer(PassthroughRenderer):
+	media_type = "text/csv"
+	format = "csv"
+
+
+class ParquetExportRenderer(PassthroughRenderer):
+	media_type = "application/vnd.apache.parquet"
+	format = "parquet"
+
+
+class GeoJSONRenderer(PassthroughRenderer):
+	media_type = "application/geo+json"
+	format = "geojson"
+
+
+class VectorTileRenderer(PassthroughRenderer):
+	media_type = "application/vnd.mapbox-vector-tile"
+	format = "mvt"
+
+
+class ColumnarJSONRenderer(renderers.JSONRenderer):
+	"""
+		Plain JSON, but selecting it (with ?format=columnar or by accepting its media type) tells views that
+		support it to send results in the columnar wire format - see serializers.columnar_results
+	"""
+	media_type = "application/vnd.waterspout.columnar+json"
+	format = "columnar"
+
+
+def feature_collection_response(request, feature_collection):
+	"""
+		Sends a stored FeatureCollection as it is - gzip-compressed if the client accepts that (they all do), which
+		means we don't decompress or encode anything
+	:param request: DRF request
+	:param feature_collection: models.FeatureCollection instance
+	:return:
+	"""
+	use_gzip = "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", "")
+	# each encoding needs its own ETag
+	etag = f'"{feature_collection.etag}-gzip"' if use_gzip else f'"{feature_collection.etag}"'
+
+	response = get_conditional_response(request._request, etag=etag)
+	if response is None:
+		if use_gzip:
+			response = HttpResponse(bytes(feature_collection.data), content_type="application/geo+json")
+			response["Content-Encoding"] = "gzip"
+		else:
+			response = HttpResponse(gzip.decompress(feature_collection.data), content_type="application/geo+json")
+		response["Cache-Control"] = "private, no-cache"
+
+	response["ETag"] = etag
+	patch_vary_headers(response, ["Accept-Encoding"])
+	return response
+
+
+def list_model_runs(view, request, queryset, paginator=None):
+	"""
+		The response for model run listings, filtered with filters.ModelRunFilter.
+
+		With ?changed_since=, instead of the usual listing, we send {"results": [model runs changed since then],
+		"ids": [IDs of every model run in the listing], "checked_at": when we looked}. Clients keep their list
+		current by updating the changed model runs, dropping any that aren't in ids anymore (deleted), and sending
+		checked_at as changed_since next time.
+	:param view: the viewset we're responding for
+	:param request: DRF request
+	:param queryset: the model runs to list, before filtering
+	:param paginator: paginator instance to send the model runs a page at a time with, or None to send all of them
+	:return: Response
+	"""
+	checked_at = timezone.now()  # before we query, so anything that changes while we work is sent next time too
+
+	filterset = filters.ModelRunFilter(request.query_params, queryset=queryset, request=request)
+	if not filterset.is_valid():
+		raise ValidationError(filterset.errors)
+	model_runs = filterset.qs.with_listing_data()
+	context = view.get_serializer_context()
+
+	if filterset.form.cleaned_data.get("changed_since") is not None:
+		listing_params = request.query_params.copy()
+		del listing_params["changed_since"]
+		ids = filters.ModelRunFilter(listing_params, queryset=queryset, request=request).qs.values_list("id", flat=True)
+		return Response({
+			"results": serializers.ModelRunSerializer(model_runs, many=True, context=context).data,
+			"ids": list(ids),
+			"checked_at": checked_at,
+		})
+
+	if paginator is not None:
+		page = paginator.paginate_queryset(model_runs, request, view=view)
+		if page is not None:
+			return paginator.get_paginated_response(serializers.ModelRunSerializer(page, many=True, context=context).data)
+
+	return Response(serializers.ModelRunSerializer(model_runs, many=True, context=context).data)
+
+
 class ModelAreaViewSet(viewsets.ModelViewSet):
 	permission_classes = [permissions.IsInSameOrganization]
 	serializer_class = serializers.ModelAreaSerializer
@@ -235,18 +376,160 @@ class ModelAreaViewSet(viewsets.ModelViewSet):
 	def get_queryset(self):
 		return models.ModelArea.objects.filter(organization__in=support.get_organizations_for_user(self.request.user)).order_by('id')
 
+	@action(detail=True)
+	def manifest(self, request, pk=None):
+		"""
+			A lightweight alternative to the detail view - has the model area's small fields and, for each of the large
+			parts of the detail view, a version and the URL to get it from (the data action below). Clients can
+			keep copies of the large parts and only download the ones whose versions changed.
+		:param request:
+		:param pk:
+		:return:
+		"""
+		model_area = self.get_object()
+		serializer = serializers.ModelAreaManifestSerializer(model_area, context=self.get_serializer_context())
+		return Response(serializer.data)
+
+	def _get_level_of_detail(self):
+		"""
+			The level of detail from the lod query parameter, or None for full resolution geometry
+		"""
+		level = self.request.query_params.get("lod", None)
+		if level is None or level == "":
+			return None
+		try:
+			level = int(level)
+		except ValueError:
+			raise Http404("lod must be a whole number")
+		if level not in feature_collections.get_levels_of_detail():
+			raise Http404(f"No level of detail {level}")
+		return level
+
+	@action(detail=True, renderer_classes=(renderers.JSONRenderer, GeoJSONRenderer))
+	def region_geometry(self, request, pk=None):
+		"""
+			A GeoJSON FeatureCollection of all the regions in the model area. Each feature's ID is the region's ID.
+			Add ?lod=0 (or 1, 2, ... - higher is simpler) for simplified geometry with quantized, delta-encoded
+			coordinates (see geometry.py) instead of the full resolution geometry
+		:param request:
+		:param pk:
+		:return:
+		"""
+		model_area = self.get_object()
+		level = self._get_level_of_detail()
+		return feature_collection_response(request, feature_collections.get_feature_collection(model_area, level=level))
+
+	@action(detail=True, url_path=r"region_group_sets/(?P<region_group_set_id>[0-9]+)/geometry",
+	        renderer_classes=(renderers.JSONRenderer, GeoJSONRenderer))
+	def region_group_geometry(self, request, pk=None, region_group_set_id=None):
+		"""
+			A GeoJSON FeatureCollection of all the groups in one of the model area's region group sets. Each
+			feature's ID is the group's ID. Takes ?lod= like region_geometry
+		:param request:
+		:param pk:
+		:param region_group_set_id:
+		:return:
+		"""
+		model_area = self.get_object()
+		region_group_set = get_object_or_404(model_area.region_group_sets, pk=region_group_set_id)
+		level = self._get_level_of_detail()
+		return feature_collection_response(request, feature_collections.get_feature_collection(model_area, region_group_set, level))
+
+	@action(detail=True)
+	def regions_at(self, request, pk=None):
+		"""
+			The regions in the model area that contain a point - ?point=longitude,latitude. Usually just one, but
+			an empty list outside of the model area's regions and more than one where regions overlap
+		:param request:
+		:param pk:
+		:return:
+		"""
+		model_area = self.get_object()
+		if not request.query_params.get("point"):
+			raise ValidationError({"point": "Provide the point to look up with ?point=longitude,latitude"})
+		x, y = _get_float_params(request.query_params, "point", 2)
+
+		region_ids = spatial_index.get_region_index(model_area).regions_at(x, y)
+		regions = models.Region.objects.filter(id__in=region_ids).order_by("internal_id")
+		return Response(serializers.RegionSerializer(regions, many=True, context=self.get_serializer_context()).data)
+
+	@action(detail=True, url_path=r"tiles/(?P<z>[0-9]+)/(?P<x>[0-9]+)/(?P<y>[0-9]+)", renderer_classes=(VectorTileRenderer,))
+	def tiles(self, request, pk=None, z=None, x=None, y=None, format=None):
+		"""
+			A Mapbox Vector Tile of the model area's regions and region groups, at tiles/{z}/{x}/{y}.mvt - see
+			vector_tiles.py for what's in them. Tiles with nothing in them are empty.
+		:param request:
+		:param pk:
+		:param z:
+		:param x:
+		:param y:
+		:param format: always mvt - the router gets it from the URL's extension
+		:return:
+		"""
+		model_area = self.get_object()
+		z, x, y = int(z), int(x), int(y)
+		if z > settings.VECTOR_TILE_MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+			return HttpResponse(f"No tile {z}/{x}/{y}", status=404, content_type="text/plain")
+
+		etag = f'"{vector_tiles.get_versions(model_area)}"'  # the URL has the tile, so the versions are enough
+		response = get_conditional_response(request._request, etag=etag)
+		if response is None:
+			response = HttpResponse(vector_tiles.get_tile(model_area, z, x, y), content_type=VectorTileRenderer.media_type)
+			response["Cache-Control"] = "private, no-cache"
+		response["ETag"] = etag
+		return response
+
+	@action(detail=True, url_path=r"data/(?P<resource>[a-z_]+)")
+	def data(self, request, pk=None, resource=None):
+		"""
+			One of the large parts of the model area detail view (calibration_data, rainfall_data, input_data,
+			crop_set, region_set, region_group_sets, or multipliers_raw), with the same data the detail view has.
+			The ETag is the version from the manifest, so clients can revalidate their copies cheaply.
+		:param request:
+		:param pk:
+		:param resource:
+		:return:
+		"""
+		if resource not in serializers.MODEL_AREA_RESOURCE_SERIALIZERS:
+			raise Http404(f"Model areas don't have {resource} data")
+
+		model_area = self.get_object()
+		version = model_area.get_resource_versions()[resource]
+		etag = f'"{version}"'
+
+		not_modified = get_conditional_response(request._request, etag=etag)
+		if not_modified is not None:
+			not_modified["ETag"] = etag
+			return not_modified
+
+		encoded = serializers.get_encoded_model_area_resource(model_area, resource, version)
+		if request.accepted_renderer.format != "json":  # the browsable API renders the data itself
+			return Response(json.loads(encoded))
+
+		response = HttpResponse(encoded, content_type="application/json")
+		response["ETag"] = etag
+		response["Cache-Control"] = "private, no-cache"
+		return response
+
 	@action(detail=True, url_name="get_model_runs", )
 	def model_runs(self, request, pk):
+		"""
+			All the model runs in the model area the user can see. Takes the filters in filters.ModelRunFilter
+			(including ?changed_since= - see list_model_runs), and ?pagination=cursor to get them a page at a time
+		:param request:
+		:param pk:
+		:return:
+		"""
 		mrs = models.ModelRun.objects.filter(
 			calibration_set__model_area__id=pk,
 			organization__in=support.get_organizations_for_user(self.request.user)
 		).order_by('id')
 
-		if models.ModelArea.objects.get(pk=pk).preferences.shared_model_runs is False:  # if they're not supposed to share model runs, then filter to only the user's model runs
+		if models.ModelArea.objects.get(pk=pk).preference_values["shared_model_runs"] is False:  # if they're not supposed to share model runs, then filter to only the user's model runs
 			mrs = mrs.filter(Q(user=request.user) | Q(user=models.User.objects.get(username="system")))
 
-		serializer = serializers.ModelRunSerializer(mrs, many=True)
-		return Response(serializer.data)
+		paginator = pagination.ModelRunCursorPagination() if pagination.wants_cursor_pagination(request) else None
+		return list_model_runs(self, request, mrs, paginator)
 
 
 class ModelRunViewSet(viewsets.ModelViewSet):
@@ -259,6 +542,13 @@ class ModelRunViewSet(viewsets.ModelViewSet):
 	"""
 	permission_classes = [permissions.IsInSameOrganization, permissions.CanCreateOrModifyModelRuns]
 	serializer_class = serializers.ModelRunSerializer
+	renderer_classes = list(api_settings.DEFAULT_RENDERER_CLASSES) + [ColumnarJSONRenderer]
+
+	def get_serializer_context(self):
+		context = super().get_serializer_context()
+		if getattr(self.request, "accepted_renderer", None) is not None and self.request.accepted_renderer.format == "columnar":
+			context["results_format"] = "columnar"
+		return context
 
 	def get_queryset(self):
 		# right now, this will only show the user's model runs, not the organization's,
@@ -269,6 +559,14 @@ class ModelRunViewSet(viewsets.ModelViewSet):
 		# view of model runs they're authorized to view in the model area's model run endpoint
 		# return models.ModelRun.objects.filter(organization__in=support.get_organizations_for_user(self.request.user)).order_by('id')
 
+	def list(self, request, *args, **kwargs):
+		"""
+			Takes the filters in filters.ModelRunFilter (including ?changed_since= - see list_model_runs). Pages are
+			numbered (?page=) unless the client asks for cursor pagination with ?pagination=cursor
+		"""
+		paginator = pagination.ModelRunCursorPagination() if pagination.wants_cursor_pagination(request) else self.paginator
+		return list_model_runs(self, request, self.get_queryset(), paginator)
+
 	def get_object(self):
 		"""
 			When we filtered the queryset to *just* the user's or systems's runs, we also locked users out of accessing
@@ -278,37 +576,81 @@ class ModelRunViewSet(viewsets.ModelViewSet):
 			the organization and that way we should be able to find model runs when appropriate.
 		:return:
 		"""
-		available_model_runs = models.ModelRun.objects.filter(
-			organization__in=support.get_organizations_for_user(self.request.user))\
-			.prefetch_related(Prefetch('region_modifications', queryset=models.RegionModification.objects.filter(created_from_group=False)))
-
-		filter = {}
-		filter[self.lookup_field] = self.kwargs[self.lookup_field]
+		# the permission classes already loaded it for writes - the resolution context gives us the same object
+		obj = resolution.get_context(self.request).get_item(models.ModelRun, self.kwargs[self.lookup_field])
+		if obj is None or not memberships.is_member(self.request.user, obj.organization_id):  # see _get_available_model_runs
+			raise Http404
 
-		obj = get_object_or_404(available_model_runs, **filter)
+		prefetch_related_objects([obj], Prefetch('region_modifications', queryset=models.RegionModification.objects.filter(created_from_group=False)))
 		self.check_object_permissions(self.request, obj)
 		return obj
-	# Commented out 11/28/2020 - no longer using back end to generate CSVs through stormchaser
-	#@action(detail=True, url_name="model_run_csv", renderer_classes=(PassthroughRenderer,))
-	#def csv(self, request, pk):
-	#	"""
-	#		A temporary proof of concept - allows downloading a csv of model results. Realistically,
-	#		we may want to save these as static files somewhere, but then we'd still want to read
-	#		them in through Django on request to manage permissions. Still would be faster and more
-	#		reliable than making the data frame a CSV on the fly though
-	#	:param request:
-	#	:param pk:
-	#	:return:
-	#	"""
-	#	model_run = self.get_object()  # this checks DRF's permissions here
-	#	if model_run.complete is False:  # if it's not complete, just return the current serialized response - should use the API view instead!
-	#		return Response(json.dumps(model_run))
-	#
-	#	output_name = f"waterspout_model_run_{model_run.id}_{model_run.name}.csv"
-	#	response = Response(model_run.results.to_csv(waterspout_limited=True, waterspout_sort_columns=False),
-	#	                    headers={'Content-Disposition': f'attachment; filename="{output_name}"'},
-	#	                    content_type='text/csv')
-	#	return response
+
+	def _get_available_model_runs(self):
+		return models.ModelRun.objects.filter(organization__in=support.get_organizations_for_user(self.request.user))
+
+	@action(detail=True, renderer_classes=(CSVExportRenderer, ParquetExportRenderer))
+	def export(self, request, pk=None):
+		"""
+			Downloads the newest results for the model run as a CSV (?format=csv, the default) or Parquet
+			(?format=parquet) file. The file is streamed as it's built, so large exports don't use extra memory.
+		:param request:
+		:param pk:
+		:return:
+		"""
+		model_run = self.get_object()  # this checks DRF's permissions here
+		export_format = request.accepted_renderer.format
+		if export_format == "parquet" and not exports.parquet_available:
+			return HttpResponse("Parquet exports aren't available on this server", status=501, content_type="text/plain")
+
+		result_set = model_run.results.order_by('-date_run').first() if model_run.complete else None
+		if result_set is None:
+			return HttpResponse(f"Model run {model_run.id} doesn't have results yet", status=409, content_type="text/plain")
+
+		response = StreamingHttpResponse(exports.encode(result_set, exports.get_export_fields(model_run), export_format),
+		                                 content_type=request.accepted_renderer.media_type)
+		response["Content-Disposition"] = f'attachment; filename="{exports.get_file_name(model_run, export_format)}"'
+		return response
+
+	@action(detail=False, url_path="export", renderer_classes=(CSVExportRenderer, ParquetExportRenderer))
+	def export_many(self, request):
+		"""
+			Downloads the newest results for several model runs (?ids=1,2,3) as a zip with one CSV or Parquet file
+			per model run, streamed as it's built
+		:param request:
+		:return:
+		"""
+		export_format = request.accepted_renderer.format
+		if export_format == "parquet" and not exports.parquet_available:
+			return HttpResponse("Parquet exports aren't available on this server", status=501, content_type="text/plain")
+
+		try:
+			model_run_ids = [int(model_run_id) for model_run_id in request.query_params.get("ids", "").split(",") if model_run_id]
+		except ValueError:
+			return HttpResponse("ids must be a comma separated list of model run IDs", status=400, content_type="text/plain")
+		if len(model_run_ids) == 0:
+			return HttpResponse("Provide the model runs to export with ?ids=", status=400, content_type="text/plain")
+
+		model_runs = self._get_available_model_runs().filter(id__in=model_run_ids).order_by("id")
+		if len(model_runs) != len(set(model_run_ids)):
+			return HttpResponse("Model runs not found", status=404, content_type="text/plain")
+
+		to_export = []
+		for model_run in model_runs:
+			self.check_object_permissions(request, model_run)
+			result_set_id = model_run.results.order_by('-date_run').values_list("id", flat=True).first() if model_run.complete else None
+			if result_set_id is None:
+				return HttpResponse(f"Model run {model_run.id} doesn't have results yet", status=409, content_type="text/plain")
+			to_export.append((model_run, result_set_id))
+
+		def members():
+			# get each result set only when we reach it so we only hold one model run's results at a time
+			for model_run, result_set_id in to_export:
+				result_set = models.ResultSet.objects.get(id=result_set_id)
+				yield exports.get_file_name(model_run, export_format), exports.encode(result_set, exports.get_export_fields(model_run), export_format)
+
+		response = StreamingHttpResponse(exports.stream_zip(members()), content_type="application/zip")
+		response["Content-Disposition"] = f'attachment; filename="waterspout_model_runs_{export_format}.zip"'
+		return response
 
 	#@action(detail=True)
 	#def status_longpoll(self, request, pk):
@@ -326,6 +668,42 @@ class ModelRunViewSet(viewsets.ModelViewSet):
 	#	while model_run.complete is False or total_time < settings.LONG_POLL_DURATION:
 	#		pass
 
+	def retrieve(self, request, *args, **kwargs):
+		"""
+			Results are the bulk of this response and they don't change once a model run is complete, so for
+			complete model runs, we send pre-encoded results (see serializers.get_encoded_result_sets) and an ETag
+			so that clients can revalidate without downloading everything again. Anything else (runs still in
+			progress, the browsable API) goes through the regular serializer.
+		"""
+		model_run = self.get_object()
+		if not model_run.complete or model_run.running or request.accepted_renderer.format not in ("json", "columnar"):
+			return Response(self.get_serializer(model_run).data)
+
+		serializer = self.get_serializer(model_run, context=dict(self.get_serializer_context(), defer_results=True))
+		data = serializer.data
+		data.pop("results", None)
+		encoded_model_run = renderers.JSONRenderer().render(data)
+
+		# the ETag covers the model run's own fields and which result sets it has - the result sets themselves never change
+		result_set_ids = list(model_run.results.order_by('-date_run').values_list("id", flat=True))
+		etag_source = request.accepted_renderer.format.encode("utf-8") + encoded_model_run + ",".join(str(result_set_id) for result_set_id in result_set_ids).encode("utf-8")
+		etag = f'"{hashlib.sha1(etag_source).hexdigest()}"'
+
+		not_modified = get_conditional_response(request._request, etag=etag)
+		if not_modified is not None:
+			not_modified["ETag"] = etag
+			return not_modified
+
+		results_format = "columnar" if request.accepted_renderer.format == "columnar" else "records"
+		encoded_results = b"[" + b",".join(serializers.get_encoded_result_sets(result_set_ids, results_format=results_format)) + b"]"
+		body = encoded_model_run[:-1] + b',"results":' + encoded_results + b"}"  # add results as the last key in the object
+
+		response = HttpResponse(body, content_type=request.accepted_renderer.media_type)
+		response["ETag"] = etag
+		response["Cache-Control"] = "private, no-cache"  # clients can keep it, but should check the ETag before using it
+		patch_vary_headers(response, ["Accept"])  # the columnar format can be requested through the Accept header
+		return response
+
 	def perform_create(self, serializer):
 		serializer.save(user=self.request.user)
 